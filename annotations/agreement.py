@@ -0,0 +1,334 @@
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.fields.json import KT
+from django.utils import timezone
+
+from projects.counters import COUNTED_ANNOTATION_STATUSES
+
+from .boxes import BOX_PROJECT_TYPES
+from .models import Annotation, AnnotatorAgreement, BoxBuffer, FileAgreement
+from .spatial import unpack_boxes
+
+# Рамки считаются совпавшими при IoU не ниже порога
+IOU_THRESHOLD = 0.5
+LOAD_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 1000
+
+
+def encode(values):
+    """Уникальные значения и плотные коды 0..k-1 для каждого элемента"""
+    return np.unique(np.asarray(values), return_inverse=True)
+
+
+def label_counts(items, categories, n_items, n_categories):
+    """Матрица «элемент × категория» с числом аннотаторов, выбравших категорию"""
+    flat = items.astype(np.int64) * n_categories + categories
+    return np.bincount(flat, minlength=n_items * n_categories).reshape(n_items, n_categories)
+
+
+def item_agreement(counts):
+    """Доля согласных пар аннотаторов по каждому элементу (P_i у Флейса), NaN при одном аннотаторе"""
+    n = counts.sum(axis=1)
+    pairs = (counts * (counts - 1)).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n >= 2, pairs / (n * (n - 1)), np.nan)
+
+
+def fleiss_kappa(counts):
+    """Каппа Флейса по элементам минимум с двумя оценками"""
+    n = counts.sum(axis=1)
+    rated = counts[n >= 2]
+    if not len(rated):
+        return None
+    p_bar = np.nanmean(item_agreement(rated))
+    p_c = rated.sum(axis=0) / rated.sum()
+    p_e = float((p_c ** 2).sum())
+    if p_e >= 1.0:
+        return 1.0
+    return float((p_bar - p_e) / (1.0 - p_e))
+
+
+def krippendorff_alpha(counts):
+    """Альфа Криппендорфа для номинальных данных по матрице совпадений"""
+    m = counts.sum(axis=1)
+    rated = counts[m >= 2].astype(np.float64)
+    if not len(rated):
+        return None
+    weighted = rated / (m[m >= 2] - 1)[:, None]
+    coincidences = weighted.T @ rated - np.diag(weighted.sum(axis=0))
+    n_c = coincidences.sum(axis=1)
+    n = n_c.sum()
+    expected = n * n - (n_c ** 2).sum()
+    if expected == 0:
+        return 1.0
+    return float(1.0 - (n - 1) * (n - np.trace(coincidences)) / expected)
+
+
+def pairs_within_groups(groups):
+    """Индексы (i, j), i < j, всех пар элементов одной группы в отсортированном массиве"""
+    first, second = [], []
+    d = 1
+    while d < len(groups):
+        same = np.nonzero(groups[:-d] == groups[d:])[0]
+        if not len(same):
+            break
+        first.append(same)
+        second.append(same + d)
+        d += 1
+    if not first:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(first), np.concatenate(second)
+
+
+def cohen_kappa_pairs(keys, categories_a, categories_b, n_keys, n_categories):
+    """Каппа Коэна для многих пар аннотаторов сразу; keys — номер пары для каждой общей оценки"""
+    n = np.bincount(keys, minlength=n_keys).astype(np.float64)
+    agreed = np.bincount(keys, weights=categories_a == categories_b, minlength=n_keys)
+    marginal_a = np.bincount(keys * n_categories + categories_a, minlength=n_keys * n_categories)
+    marginal_b = np.bincount(keys * n_categories + categories_b, minlength=n_keys * n_categories)
+    p_o = agreed / n
+    p_e = (marginal_a * marginal_b).reshape(n_keys, n_categories).sum(axis=1) / (n * n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = np.where(p_e < 1.0, (p_o - p_e) / (1.0 - p_e), np.where(p_o == 1.0, 1.0, 0.0))
+    return n.astype(np.int64), p_o, kappa
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU построчно для массивов рамок (x1, y1, x2, y2)"""
+    x1 = np.maximum(boxes_a[:, 0], boxes_b[:, 0])
+    y1 = np.maximum(boxes_a[:, 1], boxes_b[:, 1])
+    x2 = np.minimum(boxes_a[:, 2], boxes_b[:, 2])
+    y2 = np.minimum(boxes_a[:, 3], boxes_b[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a + area_b - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+def _first_in_groups(score, *groups):
+    """Маска строк с наименьшим score в каждой группе (группа задаётся набором ключей groups)"""
+    order = np.lexsort((score, *groups))
+    boundary = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        same = np.ones(len(order) - 1, dtype=bool)
+        for key in groups:
+            sorted_key = key[order]
+            same &= sorted_key[1:] == sorted_key[:-1]
+        boundary[1:] = ~same
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[boundary]] = True
+    return mask
+
+
+def box_pair_agreement(starts, counts, boxes, labels, pair_a, pair_b, threshold=IOU_THRESHOLD):
+    """Согласие рамок для пар аннотаций: 2·ΣIoU совпавших / (n_a + n_b)
+
+    Рамки сопоставляются взаимно лучшим IoU с совпадающей меткой — векторизуемое
+    приближение венгерского алгоритма, каждая рамка участвует не более чем в одной паре.
+    """
+    n_pairs = len(pair_a)
+    n_a, n_b = counts[pair_a], counts[pair_b]
+    sizes = n_a * n_b
+    total = int(sizes.sum())
+    matched_iou = np.zeros(n_pairs)
+    if total:
+        pair = np.repeat(np.arange(n_pairs), sizes)
+        offset = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        box_a = starts[pair_a][pair] + offset // n_b[pair]
+        box_b = starts[pair_b][pair] + offset % n_b[pair]
+        iou = np.where(labels[box_a] == labels[box_b], box_iou(boxes[box_a], boxes[box_b]), 0.0)
+
+        best_for_a = _first_in_groups(-iou, box_a, pair)
+        best_for_b = _first_in_groups(-iou, box_b, pair)
+        matched = best_for_a & best_for_b & (iou >= threshold)
+        matched_iou = np.bincount(pair[matched], weights=iou[matched], minlength=n_pairs)
+
+    boxes_total = n_a + n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Обе аннотации без рамок тоже согласны
+        return np.where(boxes_total > 0, 2.0 * matched_iou / boxes_total, 1.0)
+
+
+def load_labels(project, files=None):
+    """Метки засчитанных аннотаций проекта (или только файлов files) в виде массивов"""
+    annotations = Annotation.objects.filter(project=project, status__in=COUNTED_ANNOTATION_STATUSES)
+    if files is not None:
+        annotations = annotations.filter(file_id__in=files)
+    rows = (
+        annotations.filter(annotation_data__has_key='label')
+        .annotate(label=KT('annotation_data__label'))
+        .order_by('file_id', 'annotator_id')
+        .values_list('file_id', 'annotator_id', 'label')
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+    file_ids, annotator_ids, labels = [], [], []
+    for file_id, annotator_id, label in rows:
+        if label is None:
+            continue
+        file_ids.append(file_id)
+        annotator_ids.append(annotator_id)
+        labels.append(label)
+    return np.array(file_ids, dtype=np.int64), np.array(annotator_ids, dtype=np.int64), labels
+
+
+def _load_boxes(project):
+    """Рамки засчитанных аннотаций из упакованных буферов, без разбора annotation_data"""
+    rows = (
+        BoxBuffer.objects.filter(project=project, annotation__status__in=COUNTED_ANNOTATION_STATUSES)
+        .order_by('annotation__file_id', 'annotation__annotator_id')
+        .values_list('annotation__file_id', 'annotation__annotator_id', 'coordinates', 'labels')
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+    file_ids, annotator_ids, counts, buffers, labels = [], [], [], [], []
+    for file_id, annotator_id, coordinates, annotation_labels in rows:
+        file_ids.append(file_id)
+        annotator_ids.append(annotator_id)
+        counts.append(len(annotation_labels))
+        buffers.append(bytes(coordinates))
+        labels.extend(annotation_labels)
+    return (
+        np.array(file_ids, dtype=np.int64),
+        np.array(annotator_ids, dtype=np.int64),
+        np.array(counts, dtype=np.int64),
+        unpack_boxes(b''.join(buffers)).astype(np.float64),
+        labels,
+    )
+
+
+def _annotator_pairs(items, raters):
+    """Пары аннотаций одного файла; в каждой паре первый аннотатор с меньшим id"""
+    first, second = pairs_within_groups(items)
+    swap = raters[first] > raters[second]
+    first, second = np.where(swap, second, first), np.where(swap, first, second)
+    return first, second
+
+
+def _classification(project):
+    file_ids, annotator_ids, labels = load_labels(project)
+    if not len(file_ids):
+        return {}, {}, {}
+    files, items = encode(file_ids)
+    annotators, raters = encode(annotator_ids)
+    categories, codes = encode(np.array(labels, dtype=str))
+
+    counts = label_counts(items, codes, len(files), len(categories))
+    n_raters = counts.sum(axis=1)
+    per_item = item_agreement(counts)
+    file_rows = {
+        int(files[i]): (int(n_raters[i]), float(per_item[i])) for i in np.nonzero(n_raters >= 2)[0]
+    }
+
+    first, second = _annotator_pairs(items, raters)
+    pair_codes = raters[first] * len(annotators) + raters[second]
+    unique_pairs, keys = encode(pair_codes)
+    shared, observed, kappa = cohen_kappa_pairs(
+        keys, codes[first], codes[second], len(unique_pairs), len(categories)
+    )
+    pair_rows = {
+        (int(annotators[code // len(annotators)]), int(annotators[code % len(annotators)])):
+            (int(shared[k]), float(observed[k]), float(kappa[k]))
+        for k, code in enumerate(unique_pairs)
+    }
+    summary = {
+        'fleiss_kappa': fleiss_kappa(counts),
+        'krippendorff_alpha': krippendorff_alpha(counts),
+    }
+    return file_rows, pair_rows, summary
+
+
+def _detection(project):
+    file_ids, annotator_ids, box_counts, boxes, labels = _load_boxes(project)
+    if not len(file_ids):
+        return {}, {}, {}
+    files, items = encode(file_ids)
+    annotators, raters = encode(annotator_ids)
+    _, label_codes = encode(np.array(labels, dtype=str))
+    starts = np.cumsum(box_counts) - box_counts
+
+    first, second = _annotator_pairs(items, raters)
+    scores = box_pair_agreement(starts, box_counts, boxes, label_codes, first, second)
+
+    n_raters = np.bincount(items, minlength=len(files))
+    pair_items = items[first]
+    per_item_pairs = np.bincount(pair_items, minlength=len(files))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_item = np.bincount(pair_items, weights=scores, minlength=len(files)) / per_item_pairs
+    file_rows = {
+        int(files[i]): (int(n_raters[i]), float(per_item[i])) for i in np.nonzero(per_item_pairs > 0)[0]
+    }
+
+    pair_codes = raters[first] * len(annotators) + raters[second]
+    unique_pairs, keys = encode(pair_codes)
+    shared = np.bincount(keys, minlength=len(unique_pairs))
+    mean_scores = np.bincount(keys, weights=scores, minlength=len(unique_pairs)) / np.maximum(shared, 1)
+    pair_rows = {
+        (int(annotators[code // len(annotators)]), int(annotators[code % len(annotators)])):
+            (int(shared[k]), float(mean_scores[k]), None)
+        for k, code in enumerate(unique_pairs)
+    }
+    summary = {'mean_box_agreement': float(scores.mean()) if len(scores) else None}
+    return file_rows, pair_rows, summary
+
+
+def compute_project_agreement(project):
+    """Считает согласие по проекту и сохраняет результаты по файлам и парам аннотаторов"""
+    if project.project_type in BOX_PROJECT_TYPES:
+        file_rows, pair_rows, summary = _detection(project)
+    else:
+        file_rows, pair_rows, summary = _classification(project)
+
+    now = timezone.now()
+    with transaction.atomic():
+        FileAgreement.objects.bulk_create(
+            [
+                FileAgreement(
+                    file_id=file_id, project=project, annotator_count=count, agreement=agreement, computed_at=now
+                )
+                for file_id, (count, agreement) in file_rows.items()
+            ],
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['file'],
+            update_fields=['project', 'annotator_count', 'agreement', 'computed_at'],
+        )
+        AnnotatorAgreement.objects.bulk_create(
+            [
+                AnnotatorAgreement(
+                    project=project, annotator_a_id=a, annotator_b_id=b, shared_files=shared,
+                    observed_agreement=observed, kappa=kappa, computed_at=now,
+                )
+                for (a, b), (shared, observed, kappa) in pair_rows.items()
+            ],
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['project', 'annotator_a', 'annotator_b'],
+            update_fields=['shared_files', 'observed_agreement', 'kappa', 'computed_at'],
+        )
+        # Файлы и пары, у которых больше нет общих оценок
+        FileAgreement.objects.filter(project=project, computed_at__lt=now).delete()
+        AnnotatorAgreement.objects.filter(project=project, computed_at__lt=now).delete()
+
+    return {'files': len(file_rows), 'annotator_pairs': len(pair_rows), **summary}
+
+
+def annotator_consistency(project_id, annotator_ids):
+    """Согласованность аннотаторов с коллегами (0..1), взвешенная по числу общих файлов"""
+    annotator_ids = set(annotator_ids)
+    totals = defaultdict(lambda: [0.0, 0])
+    rows = AnnotatorAgreement.objects.filter(
+        Q(annotator_a__in=annotator_ids) | Q(annotator_b__in=annotator_ids), project_id=project_id
+    ).values_list('annotator_a_id', 'annotator_b_id', 'shared_files', 'observed_agreement', 'kappa')
+    for a, b, shared, observed, kappa in rows:
+        # Каппа ниже нуля (согласие хуже случайного) считается нулевой согласованностью
+        score = observed if kappa is None else min(max(kappa, 0.0), 1.0)
+        for annotator_id in (a, b):
+            if annotator_id in annotator_ids:
+                totals[annotator_id][0] += score * shared
+                totals[annotator_id][1] += shared
+    return {annotator_id: total / shared for annotator_id, (total, shared) in totals.items() if shared}
@@ -0,0 +1,146 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from projects.models import ProjectFile, ProjectSettings
+
+from .models import Annotation, TaskLease
+
+# Сколько кандидатов пробовать при конфликте на SQLite
+CAS_ATTEMPTS = 5
+# Сколько просроченных аренд освобождать за один вызов
+RECLAIM_BATCH_SIZE = 500
+
+
+def _annotation_limits(project):
+    try:
+        project_settings = project.settings
+    except ProjectSettings.DoesNotExist:
+        return 1, 3
+    return project_settings.min_annotations_per_file, project_settings.max_annotations_per_file
+
+
+def reclaim_expired_leases(project=None, limit=RECLAIM_BATCH_SIZE):
+    """Освобождает просроченные аренды и возвращает файлы в очередь"""
+    leases = TaskLease.objects.filter(expires_at__lte=timezone.now())
+    if project is not None:
+        leases = leases.filter(project=project)
+
+    with transaction.atomic():
+        expired = list(leases.values_list('pk', flat=True)[:limit])
+        released = _delete_leases(expired)
+        _release_files(released)
+    return sum(released.values())
+
+
+def _delete_leases(pks):
+    """DELETE ... RETURNING file_id: файлы только тех аренд, которые удалил этот вызов
+
+    Параллельный reclaim или release_lease мог удалить часть строк между выборкой и
+    удалением; счётчики аренд этих файлов уже уменьшил тот, кто их удалил.
+    """
+    if not pks:
+        return Counter()
+    quote = connection.ops.quote_name
+    meta = TaskLease._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({", ".join(["%s"] * len(pks))}) '
+            f'RETURNING {quote(meta.get_field("file").column)}',
+            pks,
+        )
+        return Counter(file_id for file_id, in cursor.fetchall())
+
+
+def _release_files(counts):
+    # Группируем файлы по величине уменьшения: обычно это один UPDATE
+    by_delta = {}
+    for file_id, count in counts.items():
+        by_delta.setdefault(count, []).append(file_id)
+    for count, file_ids in by_delta.items():
+        ProjectFile.objects.filter(pk__in=file_ids).update(lease_count=F('lease_count') - count)
+
+
+def release_lease(file_id, user_id):
+    """Снимает аренду пользователя с файла (задача пропущена или выполнена)"""
+    with transaction.atomic():
+        deleted, _ = TaskLease.objects.filter(file_id=file_id, user_id=user_id).delete()
+        if deleted:
+            ProjectFile.objects.filter(pk=file_id).update(lease_count=F('lease_count') - 1)
+    return bool(deleted)
+
+
+def release_leases(user_id, file_ids):
+    """Пакетный release_lease для файлов одного пользователя"""
+    with transaction.atomic():
+        released = _delete_leases(list(
+            TaskLease.objects.filter(user_id=user_id, file_id__in=file_ids).values_list('pk', flat=True)
+        ))
+        _release_files(released)
+    return sum(released.values())
+
+
+def _candidates(project, user, limit):
+    """Файлы, на которые у пользователя нет ни аренды, ни аннотации, в пределах квоты"""
+    return (
+        ProjectFile.objects.filter(project=project)
+        .filter(annotation_count__lt=limit - F('lease_count'))
+        .exclude(Exists(Annotation.objects.filter(file=OuterRef('pk'), annotator=user)))
+        .exclude(Exists(TaskLease.objects.filter(file=OuterRef('pk'), user=user)))
+        .order_by('pk')
+    )
+
+
+def _lock_next_file(project, user, limit):
+    if connection.features.has_select_for_update_skip_locked:
+        # Параллельные запросы пропускают строки, уже заблокированные другими
+        project_file = (
+            _candidates(project, user, limit)
+            .select_for_update(skip_locked=True, of=('self',))
+            .only('pk', 'lease_count')
+            .first()
+        )
+        if project_file is None:
+            return None
+        ProjectFile.objects.filter(pk=project_file.pk).update(lease_count=F('lease_count') + 1)
+        return project_file
+
+    # SQLite: блокировок строк нет, используем условный UPDATE (compare-and-swap)
+    for project_file in _candidates(project, user, limit).only('pk', 'lease_count')[:CAS_ATTEMPTS]:
+        if ProjectFile.objects.filter(pk=project_file.pk, lease_count=project_file.lease_count).update(
+            lease_count=F('lease_count') + 1
+        ):
+            return project_file
+    return None
+
+
+def lease_next_task(project, user):
+    """Выдаёт пользователю следующий файл проекта в аренду"""
+    now = timezone.now()
+    current = TaskLease.objects.filter(project=project, user=user, expires_at__gt=now).select_related('file').first()
+    if current is not None:
+        return current
+
+    reclaim_expired_leases(project)
+    min_annotations, max_annotations = _annotation_limits(project)
+
+    with transaction.atomic():
+        # Сначала файлы, не набравшие минимум аннотаций, затем остальные до максимума
+        project_file = None
+        for limit in sorted({min_annotations, max_annotations}):
+            project_file = _lock_next_file(project, user, limit)
+            if project_file is not None:
+                break
+        if project_file is None:
+            return None
+
+        return TaskLease.objects.create(
+            project=project,
+            file_id=project_file.pk,
+            user=user,
+            expires_at=now + timedelta(minutes=settings.TASK_LEASE_MINUTES),
+        )
@@ -0,0 +1,34 @@
+# Типы проектов, где annotation_data['objects'] содержит прямоугольники
+BOX_PROJECT_TYPES = ('object_detection',)
+# Типы проектов с одной меткой в annotation_data['label']
+LABEL_PROJECT_TYPES = ('image_classification', 'text_classification', 'sentiment_analysis')
+
+
+def _coordinates(obj):
+    # Редактор хранит {'coordinates': {x, y, width, height}}, импорт — {'bbox': [x, y, w, h]}
+    if isinstance(obj.get('coordinates'), dict):
+        c = obj['coordinates']
+        return c.get('x'), c.get('y'), c.get('width'), c.get('height')
+    bbox = obj.get('bbox')
+    if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
+        return tuple(bbox)
+    return None
+
+
+def extract_boxes(annotation_data):
+    """Прямоугольники аннотации в виде (метка, x, y, ширина, высота); некорректные пропускаются"""
+    objects = annotation_data.get('objects') if isinstance(annotation_data, dict) else None
+    boxes = []
+    for obj in objects or []:
+        if not isinstance(obj, dict):
+            continue
+        coordinates = _coordinates(obj)
+        if coordinates is None:
+            continue
+        try:
+            x, y, width, height = (float(value) for value in coordinates)
+        except (TypeError, ValueError):
+            continue
+        if width > 0 and height > 0:
+            boxes.append((str(obj.get('label', '')), x, y, width, height))
+    return boxes
@@ -0,0 +1,260 @@
+import json
+from collections import defaultdict, namedtuple
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.dashboard import invalidate_dashboard
+from core.search import index_objects
+from projects.counters import COUNTED_ANNOTATION_STATUSES, annotations_counted
+from projects.models import ProjectFile
+
+from .assignment import release_leases
+from .boxes import BOX_PROJECT_TYPES
+from .eventlog import record_transitions
+from .live import publish_status_changes
+from .models import Annotation
+from .rollups import bulk_transition
+from .schemas import SchemaError, validator_for_project
+from .spatial import sync_boxes
+
+# Строк в одной транзакции записи
+BATCH_SIZE = 2000
+# Статусы, в которых можно загружать предразметку
+IMPORT_STATUSES = ('draft', 'submitted')
+# Аннотации, которые загрузка может перезаписать; проверенные не трогаются
+OVERWRITABLE_STATUSES = ('draft', 'submitted')
+INSERT_FIELDS = [
+    'project', 'file', 'annotator', 'annotation_data', 'status', 'quality_score',
+    'annotator_notes', 'reviewer_notes', 'submitted_at', 'created_at', 'updated_at',
+]
+UPSERT_FIELDS = ['annotation_data', 'status', 'quality_score', 'annotator_notes', 'submitted_at', 'updated_at']
+
+# Записанная строка: поля, нужные счётчикам, агрегатам, хранилищу рамок и поисковому индексу
+ImportedAnnotation = namedtuple('ImportedAnnotation', [
+    'pk', 'project_id', 'file_id', 'annotator_id', 'annotation_data', 'status',
+    'quality_score', 'annotator_notes', 'submitted_at', 'created_at',
+])
+
+
+def iter_jsonl(lines):
+    """Строки JSONL в виде (номер строки, объект или исключение); пустые строки пропускаются"""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f'Invalid JSON: {exc}')
+
+
+def _clean(row, validate):
+    """Проверенные поля строки или сообщение об ошибке"""
+    if isinstance(row, Exception):
+        return str(row)
+    if not isinstance(row, dict):
+        return 'Row must be a JSON object'
+    status = row.get('status', 'draft')
+    if status not in IMPORT_STATUSES:
+        return f'Status must be one of: {", ".join(IMPORT_STATUSES)}'
+    data = row.get('annotation_data')
+    if not isinstance(data, dict):
+        return 'annotation_data must be a JSON object'
+    score = row.get('quality_score')
+    if score is not None:
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0.0 <= score <= 1.0:
+            return 'quality_score must be a number between 0 and 1'
+        score = float(score)
+    notes = row.get('annotator_notes', '')
+    if not isinstance(notes, str):
+        return 'annotator_notes must be a string'
+    if 'file' in row:
+        file_id = row['file']
+        if isinstance(file_id, str) and file_id.isdigit():
+            file_id = int(file_id)
+        if isinstance(file_id, bool) or not isinstance(file_id, int):
+            return '"file" must be a file id'
+        file_key = ('file', file_id)
+    elif isinstance(row.get('filename'), str) and row['filename']:
+        file_key = ('filename', row['filename'])
+    else:
+        return 'Row must reference a file by id ("file") or name ("filename")'
+    # Как и в форме редактирования, по схеме проверяются отправленные данные, черновики — нет
+    if status == 'submitted' and validate is not None:
+        try:
+            validate(data)
+        except SchemaError as exc:
+            return str(exc)
+    return {
+        'file_key': file_key, 'status': status, 'annotation_data': data,
+        'quality_score': score, 'annotator_notes': notes,
+    }
+
+
+def _resolve_files(project, keys):
+    """{('file', id) или ('filename', имя): id файла проекта} двумя запросами на пачку"""
+    ids = [value for kind, value in keys if kind == 'file']
+    names = [value for kind, value in keys if kind == 'filename']
+    resolved = {}
+    if ids:
+        for pk in ProjectFile.objects.filter(project=project, pk__in=ids).values_list('pk', flat=True):
+            resolved['file', pk] = pk
+    if names:
+        by_name = defaultdict(list)
+        for pk, filename in ProjectFile.objects.filter(project=project, filename__in=names).values_list('pk', 'filename'):
+            by_name[filename].append(pk)
+        # Неоднозначное имя не сопоставляется: такие строки нужно ссылать по id
+        for filename, pks in by_name.items():
+            resolved['filename', filename] = pks[0] if len(pks) == 1 else None
+    return resolved
+
+
+def _upsert(annotations, now):
+    """INSERT ... ON CONFLICT (file, annotator) DO UPDATE через executemany
+
+    Тот же запрос, что строит bulk_create(update_conflicts=True), но без экземпляров моделей
+    и с подготовкой общих для пачки значений (время, пустые поля) один раз, а не для каждого
+    поля каждой строки: это основная стоимость bulk_create на больших пачках.
+    """
+    db = connections[Annotation.objects.db]
+    fields = [Annotation._meta.get_field(name) for name in INSERT_FIELDS]
+    quote = db.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    updates = ', '.join(
+        f'{quote(column)} = EXCLUDED.{quote(column)}'
+        for column in (Annotation._meta.get_field(name).column for name in UPSERT_FIELDS)
+    )
+    unique = ', '.join(quote(Annotation._meta.get_field(name).column) for name in ('file', 'annotator'))
+    sql = (
+        f'INSERT INTO {quote(Annotation._meta.db_table)} ({columns}) VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({unique}) DO UPDATE SET {updates}'
+    )
+
+    data_field = Annotation._meta.get_field('annotation_data')
+    stamp = db.ops.adapt_datetimefield_value(now)
+    rows = [
+        (
+            annotation.project_id, annotation.file_id, annotation.annotator_id,
+            data_field.get_db_prep_save(annotation.annotation_data, db),
+            annotation.status, annotation.quality_score, annotation.annotator_notes, '',
+            stamp if annotation.submitted_at == now else db.ops.adapt_datetimefield_value(annotation.submitted_at),
+            stamp, stamp,
+        )
+        for annotation in annotations
+    ]
+    with db.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _write_batch(project, user, batch, validate, seen, errors):
+    """Проверяет и записывает одну пачку пар (номер строки, объект); возвращает (создано, обновлено)"""
+    cleaned = []
+    for number, row in batch:
+        result = _clean(row, validate)
+        if isinstance(result, str):
+            errors.append({'row': number, 'error': result})
+        else:
+            cleaned.append((number, result))
+    resolved = _resolve_files(project, {row['file_key'] for _, row in cleaned})
+
+    pending = {}
+    for number, row in cleaned:
+        key = row['file_key']
+        file_id = resolved.get(key)
+        if file_id is None:
+            error = 'Ambiguous filename, reference the file by id' if key in resolved else 'File not found in project'
+            errors.append({'row': number, 'error': error})
+        elif file_id in seen:
+            errors.append({'row': number, 'error': 'Duplicate file in this upload'})
+        else:
+            seen.add(file_id)
+            pending[file_id] = (number, row)
+    if not pending:
+        return 0, 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            file_id: (status, created_at, submitted_at)
+            for file_id, status, created_at, submitted_at in Annotation.objects.filter(
+                file_id__in=pending, annotator=user
+            ).select_for_update().values_list('file_id', 'status', 'created_at', 'submitted_at')
+        }
+        annotations, changes = [], []
+        for file_id, (number, row) in pending.items():
+            old_status, created_at, submitted_at = existing.get(file_id, (None, now, None))
+            if old_status is not None and old_status not in OVERWRITABLE_STATUSES:
+                errors.append({'row': number, 'error': f'Annotation is already {old_status}'})
+                continue
+            if row['status'] != 'submitted':
+                submitted_at = None
+            elif old_status != 'submitted':
+                submitted_at = now
+            # Сохранённая дата создания не меняется при обновлении: по ней считаются дневные агрегаты
+            annotations.append(ImportedAnnotation(
+                None, project.pk, file_id, user.pk, row['annotation_data'], row['status'],
+                row['quality_score'], row['annotator_notes'], submitted_at, created_at,
+            ))
+            changes.append(old_status)
+        if not annotations:
+            return 0, 0
+
+        _upsert(annotations, now)
+        ids = dict(
+            Annotation.objects.filter(file_id__in=pending, annotator=user).values_list('file_id', 'pk')
+        )
+        annotations = [annotation._replace(pk=ids[annotation.file_id]) for annotation in annotations]
+
+        # Сигналы не отправляются: счётчики, агрегаты и индексы обновляются здесь
+        file_deltas = {}
+        for annotation, old_status in zip(annotations, changes):
+            was_counted = old_status in COUNTED_ANNOTATION_STATUSES
+            is_counted = annotation.status in COUNTED_ANNOTATION_STATUSES
+            if was_counted != is_counted:
+                file_deltas[annotation.file_id] = 1 if is_counted else -1
+        annotations_counted(project.pk, file_deltas)
+        release_leases(user.pk, [file_id for file_id, delta in file_deltas.items() if delta > 0])
+        transitions = list(zip(annotations, changes))
+        bulk_transition(transitions)
+        record_transitions(transitions)
+        publish_status_changes(transitions)
+        if project.project_type in BOX_PROJECT_TYPES:
+            sync_boxes(annotations)
+        index_objects('annotation', annotations)
+
+    created = sum(old_status is None for old_status in changes)
+    return created, len(annotations) - created
+
+
+def import_annotations(project, user, rows, batch_size=BATCH_SIZE, progress=None):
+    """Загружает предразметку пачками с upsert по (file, annotator)
+
+    rows — пары (номер строки, объект); ошибки строк собираются, а не прерывают загрузку.
+    """
+    validate = validator_for_project(project)
+    seen = set()
+    errors = []
+    created = updated = 0
+    batch = []
+
+    def flush():
+        nonlocal created, updated
+        batch_created, batch_updated = _write_batch(project, user, batch, validate, seen, errors)
+        created += batch_created
+        updated += batch_updated
+        if progress:
+            progress(created + updated, len(errors))
+        batch.clear()
+
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    invalidate_dashboard(user.pk)
+    errors.sort(key=lambda error: error['row'])
+    return {'created': created, 'updated': updated, 'errors': errors}
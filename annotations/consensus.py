@@ -0,0 +1,232 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from projects.counters import COUNTED_ANNOTATION_STATUSES
+
+from .agreement import LOAD_CHUNK_SIZE, WRITE_BATCH_SIZE, encode, label_counts, load_labels
+from .models import Annotation, AnnotatorReliability, FileConsensus
+
+# EM останавливается, когда вероятности меток почти перестают меняться
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+# Сглаживание матриц ошибок, чтобы редкие метки не давали нулевых вероятностей
+SMOOTHING = 0.01
+# Точность аннотатора, для которого ещё нет оценённой матрицы ошибок
+DEFAULT_ACCURACY = 0.7
+# При большой доле изменившихся файлов дешевле пересчитать проект целиком
+FULL_RECOMPUTE_SHARE = 0.2
+CONSENSUS_FIELDS = [
+    'project', 'label', 'confidence', 'majority_label', 'majority_share',
+    'annotation_count', 'source_updated_at', 'computed_at',
+]
+
+
+def majority_vote(counts):
+    """Метка большинством голосов и доля голосов за неё; при равенстве выигрывает меньший код"""
+    winners = counts.argmax(axis=1)
+    return winners, counts[np.arange(len(counts)), winners] / counts.sum(axis=1)
+
+
+def _e_step(items, raters, codes, n_items, log_confusion, log_priors):
+    """Апостериорные вероятности истинных меток при известных матрицах ошибок"""
+    # log P(поставленная метка | истинная t) для каждой аннотации, по столбцу на каждую t
+    observed = log_confusion[raters, :, codes]
+    log_posteriors = np.column_stack([
+        np.bincount(items, weights=observed[:, t], minlength=n_items) for t in range(len(log_priors))
+    ]) + log_priors
+    log_posteriors -= log_posteriors.max(axis=1, keepdims=True)
+    posteriors = np.exp(log_posteriors)
+    return posteriors / posteriors.sum(axis=1, keepdims=True)
+
+
+def _m_step(items, raters, codes, posteriors, n_raters):
+    """Матрицы ошибок аннотаторов и частоты классов по текущим вероятностям меток"""
+    n_categories = posteriors.shape[1]
+    flat = raters * n_categories + codes
+    weights = posteriors[items]
+    confusion = np.stack([
+        np.bincount(flat, weights=weights[:, t], minlength=n_raters * n_categories).reshape(n_raters, n_categories)
+        for t in range(n_categories)
+    ], axis=1) + SMOOTHING
+    confusion /= confusion.sum(axis=2, keepdims=True)
+    priors = posteriors.sum(axis=0) + SMOOTHING
+    return confusion, priors / priors.sum()
+
+
+def dawid_skene(items, raters, codes, n_items, n_raters, n_categories,
+                max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """EM Дэвида–Скина: вероятности истинных меток, матрицы ошибок аннотаторов и частоты классов
+
+    Начальное приближение — доли голосов, так что первая итерация совпадает с голосованием большинством.
+    """
+    counts = label_counts(items, codes, n_items, n_categories)
+    posteriors = counts / counts.sum(axis=1, keepdims=True)
+    for _ in range(max_iterations):
+        confusion, priors = _m_step(items, raters, codes, posteriors, n_raters)
+        updated = _e_step(items, raters, codes, n_items, np.log(confusion), np.log(priors))
+        converged = np.abs(updated - posteriors).max() < tolerance
+        posteriors = updated
+        if converged:
+            break
+    return posteriors, confusion, priors
+
+
+def _default_confusion(n_categories):
+    if n_categories == 1:
+        return np.ones((1, 1))
+    confusion = np.full((n_categories, n_categories), (1.0 - DEFAULT_ACCURACY) / (n_categories - 1))
+    np.fill_diagonal(confusion, DEFAULT_ACCURACY)
+    return confusion
+
+
+def _file_state(project):
+    """Число засчитанных меток и время последнего изменения по каждому файлу проекта"""
+    rows = (
+        Annotation.objects.filter(
+            project=project, status__in=COUNTED_ANNOTATION_STATUSES, annotation_data__has_key='label'
+        )
+        .values('file_id')
+        .annotate(labels=Count('pk'), latest=Max('updated_at'))
+        .order_by()
+        .values_list('file_id', 'labels', 'latest')
+    )
+    return {file_id: (labels, latest) for file_id, labels, latest in rows.iterator(chunk_size=LOAD_CHUNK_SIZE)}
+
+
+def _save_consensus(project, files, categories, posteriors, counts, state, now):
+    labels = posteriors.argmax(axis=1)
+    majority, share = majority_vote(counts)
+    consensus = []
+    for i, file_id in enumerate(files.tolist()):
+        annotation_count, updated_at = state.get(file_id, (int(counts[i].sum()), now))
+        consensus.append(FileConsensus(
+            file_id=file_id, project=project,
+            label=categories[labels[i]], confidence=float(posteriors[i, labels[i]]),
+            majority_label=categories[majority[i]], majority_share=float(share[i]),
+            annotation_count=annotation_count, source_updated_at=updated_at, computed_at=now,
+        ))
+    FileConsensus.objects.bulk_create(
+        consensus, batch_size=WRITE_BATCH_SIZE,
+        update_conflicts=True, unique_fields=['file'], update_fields=CONSENSUS_FIELDS,
+    )
+    return len(consensus)
+
+
+def _full(project, state, now):
+    """Оценивает надёжность аннотаторов по всему проекту и пересчитывает все файлы"""
+    file_ids, annotator_ids, labels = load_labels(project)
+    with transaction.atomic():
+        if len(file_ids):
+            files, items = encode(file_ids)
+            annotators, raters = encode(annotator_ids)
+            categories, codes = encode(np.array(labels, dtype=str))
+            posteriors, confusion, priors = dawid_skene(
+                items, raters, codes, len(files), len(annotators), len(categories)
+            )
+            counts = label_counts(items, codes, len(files), len(categories))
+            written = _save_consensus(project, files, categories, posteriors, counts, state, now)
+
+            per_annotator = np.bincount(raters, minlength=len(annotators))
+            accuracy = (confusion.diagonal(axis1=1, axis2=2) * priors).sum(axis=1)
+            names = categories.tolist()
+            AnnotatorReliability.objects.bulk_create(
+                [
+                    AnnotatorReliability(
+                        project=project, annotator_id=annotator_id, accuracy=float(accuracy[r]),
+                        confusion={
+                            true: dict(zip(names, confusion[r, t].tolist())) for t, true in enumerate(names)
+                        },
+                        annotation_count=int(per_annotator[r]), computed_at=now,
+                    )
+                    for r, annotator_id in enumerate(annotators.tolist())
+                ],
+                batch_size=WRITE_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['project', 'annotator'],
+                update_fields=['accuracy', 'confusion', 'annotation_count', 'computed_at'],
+            )
+        else:
+            written = 0
+        # Файлы и аннотаторы, у которых больше нет засчитанных меток
+        FileConsensus.objects.filter(project=project, computed_at__lt=now).delete()
+        AnnotatorReliability.objects.filter(project=project, computed_at__lt=now).delete()
+    return written
+
+
+def _incremental(project, state, dirty, reliability, now):
+    """Пересчитывает изменившиеся файлы по сохранённым матрицам ошибок (один E-шаг).
+    Возвращает None, если встретилась метка, которой нет в матрицах"""
+    if not dirty:
+        return 0
+    chunks = [
+        load_labels(project, dirty[start:start + LOAD_CHUNK_SIZE])
+        for start in range(0, len(dirty), LOAD_CHUNK_SIZE)
+    ]
+    file_ids = np.concatenate([chunk[0] for chunk in chunks])
+    annotator_ids = np.concatenate([chunk[1] for chunk in chunks])
+    labels = np.array([label for chunk in chunks for label in chunk[2]], dtype=str)
+    if not len(file_ids):
+        return 0
+
+    categories = np.array(sorted(next(iter(reliability.values()))), dtype=str)
+    codes = np.searchsorted(categories, labels).clip(max=len(categories) - 1)
+    if not (categories[codes] == labels).all():
+        return None
+
+    names = categories.tolist()
+    annotators, raters = encode(annotator_ids)
+    known = [
+        np.array([[reliability[annotator_id][true][observed] for observed in names] for true in names])
+        if annotator_id in reliability else _default_confusion(len(names))
+        for annotator_id in annotators.tolist()
+    ]
+    # Частоты классов — по уже сведённым меткам проекта
+    priors = np.full(len(names), SMOOTHING)
+    for label, count in FileConsensus.objects.filter(project=project).values_list('label').annotate(Count('pk')):
+        if label in names:
+            priors[names.index(label)] += count
+    priors /= priors.sum()
+
+    files, items = encode(file_ids)
+    posteriors = _e_step(items, raters, codes, len(files), np.log(np.stack(known)), np.log(priors))
+    counts = label_counts(items, codes, len(files), len(categories))
+    with transaction.atomic():
+        return _save_consensus(project, files, categories, posteriors, counts, state, now)
+
+
+def compute_consensus(project, full=False):
+    """Сводит метки аннотаторов в итоговую метку файла голосованием и по модели Дэвида–Скина
+
+    Без full пересчитываются только файлы, чьи засчитанные аннотации изменились с прошлого запуска;
+    надёжность аннотаторов при этом берётся из последнего полного пересчёта.
+    """
+    now = timezone.now()
+    # Состояние читается до меток: изменение между запросами попадёт в следующий запуск
+    state = _file_state(project)
+    stored = {
+        file_id: (count, updated_at)
+        for file_id, count, updated_at in FileConsensus.objects.filter(project=project)
+        .values_list('file_id', 'annotation_count', 'source_updated_at').iterator(chunk_size=LOAD_CHUNK_SIZE)
+    }
+    dirty = [file_id for file_id, file_state in state.items() if stored.get(file_id) != file_state]
+    removed = [file_id for file_id in stored if file_id not in state]
+    reliability = {
+        annotator_id: confusion
+        for annotator_id, confusion in AnnotatorReliability.objects.filter(project=project)
+        .values_list('annotator_id', 'confusion')
+    }
+
+    written = None
+    if not full and reliability and len(dirty) <= FULL_RECOMPUTE_SHARE * len(state):
+        written = _incremental(project, state, dirty, reliability, now)
+        if written is not None:
+            for start in range(0, len(removed), LOAD_CHUNK_SIZE):
+                FileConsensus.objects.filter(
+                    project=project, file_id__in=removed[start:start + LOAD_CHUNK_SIZE]
+                ).delete()
+    if written is None:
+        full = True
+        written = _full(project, state, now)
+    return {'files': written, 'removed': len(removed), 'full': full}
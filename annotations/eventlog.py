@@ -0,0 +1,227 @@
+from collections import Counter, defaultdict, namedtuple
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AnnotationEvent
+from .rollups import replace_rollups, rollup_day
+
+# Статусы, которые выставляет проверка, а не аннотатор
+REVIEWED_STATUSES = ('approved', 'rejected', 'needs_review')
+WRITE_BATCH_SIZE = 1000
+# Событий за одно чтение курсора при повторном проигрывании
+REPLAY_CHUNK_SIZE = 5000
+# Сколько месячных секций PostgreSQL создавать наперёд
+PARTITION_MONTHS_AHEAD = 3
+# Верхние границы корзин гистограммы задержки проверки, в секундах
+LATENCY_BUCKETS = (60, 5 * 60, 15 * 60, 60 * 60, 4 * 60 * 60, 24 * 60 * 60, 3 * 24 * 60 * 60, 7 * 24 * 60 * 60)
+
+EVENT_FIELDS = [
+    'id', 'annotation_id', 'project_id', 'annotator_id', 'actor_id',
+    'event_type', 'status', 'previous_status', 'created_at', 'payload',
+]
+Event = namedtuple('Event', EVENT_FIELDS)
+
+
+def _transition_event(annotation, old_status, now):
+    reviewed = annotation.status in REVIEWED_STATUSES
+    payload = {}
+    if reviewed and annotation.quality_score is not None:
+        payload['quality_score'] = annotation.quality_score
+    return AnnotationEvent(
+        annotation_id=annotation.pk, project_id=annotation.project_id, annotator_id=annotation.annotator_id,
+        actor_id=getattr(annotation, 'reviewed_by_id', None) if reviewed else annotation.annotator_id,
+        event_type=AnnotationEvent.CREATED if old_status is None else AnnotationEvent.STATUS_CHANGED,
+        status=annotation.status, previous_status=old_status or '',
+        # Создание датируется самой аннотацией: по этой дате считаются дневные агрегаты
+        created_at=annotation.created_at if old_status is None else now,
+        payload=payload,
+    )
+
+
+def record_transitions(changes):
+    """Добавляет события для пар (аннотация, старый статус); None — новая аннотация"""
+    now = timezone.now()
+    events = [
+        _transition_event(annotation, old_status, now)
+        for annotation, old_status in changes
+        if old_status != annotation.status
+    ]
+    AnnotationEvent.objects.bulk_create(events, batch_size=WRITE_BATCH_SIZE)
+    return len(events)
+
+
+def record_deleted(annotation, old_status):
+    AnnotationEvent.objects.create(
+        annotation_id=annotation.pk, project_id=annotation.project_id, annotator_id=annotation.annotator_id,
+        event_type=AnnotationEvent.DELETED, previous_status=old_status or '',
+    )
+
+
+def _month(day, offset=0):
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead=PARTITION_MONTHS_AHEAD, start=None, db=None, table=None):
+    """Месячные секции журнала с текущего месяца на months_ahead вперёд (только PostgreSQL)
+
+    События месяцев без секции (запуск пропущен, горизонт пройден) лежат в секции DEFAULT,
+    и создать для них секцию обычным PARTITION OF нельзя. Такие месяцы тоже получают
+    секции: строки переносятся из DEFAULT в новую таблицу, которая затем подключается.
+    """
+    db = db or connection
+    if db.vendor != 'postgresql':
+        return []
+    table = table or AnnotationEvent._meta.db_table
+    default = f'{table}_default'
+    quote = db.ops.quote_name
+    first = _month(start or timezone.localdate())
+    months = {_month(first, offset) for offset in range(months_ahead + 1)}
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {quote(default)}")
+        months.update(month for month, in cursor.fetchall())
+
+    names = []
+    for lower in sorted(months):
+        upper = _month(lower, 1)
+        name = f'{table}_{lower:%Y%m}'
+        bounds = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        with transaction.atomic(using=db.alias), db.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is None:
+                # Блокировка не даёт новым событиям месяца попасть в DEFAULT между переносом и подключением
+                cursor.execute(f'LOCK TABLE {quote(default)} IN EXCLUSIVE MODE')
+                cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+                cursor.execute(
+                    f'WITH moved AS (DELETE FROM {quote(default)} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                    f'INSERT INTO {quote(name)} SELECT * FROM moved',
+                    [lower, upper],
+                )
+                cursor.execute(f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} {bounds}')
+        names.append(name)
+    return names
+
+
+def stream_events(project=None, since=None, until=None, chunk_size=REPLAY_CHUNK_SIZE):
+    """События по порядку id одним проходом курсора; since/until ограничивают created_at"""
+    events = AnnotationEvent.objects.order_by('id')
+    if project is not None:
+        events = events.filter(project=project)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    if until is not None:
+        events = events.filter(created_at__lt=until)
+    for row in events.values_list(*EVENT_FIELDS).iterator(chunk_size=chunk_size):
+        yield Event(*row)
+
+
+class DailyRollups:
+    """Дневные агрегаты (день создания, проект, аннотатор, статус), как в AnnotationDailyRollup"""
+
+    name = 'rollups'
+
+    def __init__(self):
+        self.cells = Counter()
+        self._current = {}
+
+    def feed(self, event):
+        if event.event_type == AnnotationEvent.CREATED:
+            cell = (rollup_day(event.created_at), event.project_id, event.annotator_id, event.status)
+        else:
+            cell = self._current.pop(event.annotation_id, None)
+            if cell is None:
+                # Создание вне проигранного окна: ячейка аннотации неизвестна
+                return
+            self.cells[cell] -= 1
+            if event.event_type == AnnotationEvent.DELETED:
+                return
+            cell = (*cell[:3], event.status)
+        self._current[event.annotation_id] = cell
+        self.cells[cell] += 1
+
+    def result(self):
+        return {cell: count for cell, count in self.cells.items() if count}
+
+
+class Leaderboard:
+    """Отправки и итоги проверок по аннотаторам, по убыванию утверждённых"""
+
+    name = 'leaderboard'
+
+    def __init__(self):
+        self.counts = defaultdict(Counter)
+
+    def feed(self, event):
+        if event.event_type == AnnotationEvent.STATUS_CHANGED or (
+            event.event_type == AnnotationEvent.CREATED and event.status != 'draft'
+        ):
+            self.counts[event.annotator_id][event.status] += 1
+
+    def result(self):
+        rows = []
+        for annotator_id, counts in self.counts.items():
+            reviewed = counts['approved'] + counts['rejected']
+            rows.append({
+                'annotator_id': annotator_id,
+                'submitted': counts['submitted'],
+                'approved': counts['approved'],
+                'rejected': counts['rejected'],
+                'approval_rate': counts['approved'] / reviewed if reviewed else None,
+            })
+        rows.sort(key=lambda row: (-row['approved'], -row['submitted'], row['annotator_id']))
+        return rows
+
+
+class ReviewLatency:
+    """Гистограмма времени от отправки до первого решения проверки"""
+
+    name = 'latency'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self._submitted = {}
+
+    def feed(self, event):
+        if event.status == 'submitted':
+            self._submitted[event.annotation_id] = event.created_at
+        elif event.status in REVIEWED_STATUSES:
+            submitted_at = self._submitted.pop(event.annotation_id, None)
+            if submitted_at is not None:
+                seconds = (event.created_at - submitted_at).total_seconds()
+                index = next((i for i, upper in enumerate(self.buckets) if seconds <= upper), len(self.buckets))
+                self.counts[index] += 1
+                self.total += seconds
+        else:
+            self._submitted.pop(event.annotation_id, None)
+
+    def result(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean_seconds': self.total / count if count else None,
+            'buckets': [
+                {'max_seconds': upper, 'count': value}
+                for upper, value in zip((*self.buckets, None), self.counts)
+            ],
+        }
+
+
+METRICS = {metric.name: metric for metric in (DailyRollups, Leaderboard, ReviewLatency)}
+
+
+def replay(metrics, project=None, since=None, until=None):
+    """Проигрывает журнал один раз, передавая каждое событие всем метрикам; возвращает {имя: результат}"""
+    for event in stream_events(project, since, until):
+        for metric in metrics:
+            metric.feed(event)
+    return {metric.name: metric.result() for metric in metrics}
+
+
+def rebuild_rollups_from_events(project=None):
+    """Пересобирает AnnotationDailyRollup из журнала вместо сканирования аннотаций"""
+    cells = replay([DailyRollups()], project=project)['rollups']
+    return replace_rollups(cells, project)
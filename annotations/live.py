@@ -0,0 +1,20 @@
+from core.pubsub import project_channel, publish_many, user_channel
+
+
+def publish_status_changes(changes):
+    """События смены статуса для пар (аннотация, старый статус)
+
+    Событие получают аннотатор (итог проверки) и подписчики очереди проекта.
+    """
+    publish_many(
+        (
+            [user_channel(annotation.annotator_id), project_channel(annotation.project_id)],
+            'annotation_status',
+            {
+                'annotation': annotation.pk, 'project': annotation.project_id, 'file': annotation.file_id,
+                'annotator': annotation.annotator_id, 'status': annotation.status, 'previous': old_status,
+            },
+        )
+        for annotation, old_status in changes
+        if old_status != annotation.status
+    )
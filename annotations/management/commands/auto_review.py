@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.models import Annotation
+from annotations.review import auto_review
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Approve or flag scored submitted annotations using project quality thresholds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Review a single project')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.filter(
+            pk__in=Annotation.objects.filter(status='submitted', quality_score__isnull=False).values('project_id')
+        ).select_related('owner', 'settings')
+        if options['project']:
+            projects = projects.filter(pk=options['project'])
+            if not Project.objects.filter(pk=options['project']).exists():
+                raise CommandError(f'Project {options["project"]} does not exist')
+
+        total_approved = total_flagged = 0
+        for project in projects.iterator():
+            approved, flagged = auto_review(project)
+            total_approved += approved
+            total_flagged += flagged
+            if approved or flagged:
+                self.stdout.write(f'{project.name}: approved {approved}, flagged {flagged} for review')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Auto-approved {total_approved} annotation(s), flagged {total_flagged} for manual review'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.rollups import REBUILD_BATCH_SIZE, rebuild_rollups
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily annotation rollups from existing annotations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Rebuild rollups of a single project')
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        project = None
+        if options['project']:
+            try:
+                project = Project.objects.get(pk=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError(f'Project {options["project"]} does not exist')
+
+        processed = 0
+
+        def progress(count):
+            nonlocal processed
+            processed += count
+            self.stdout.write(f'Aggregated {processed} annotation(s)')
+
+        cells = rebuild_rollups(project, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {cells} rollup row(s) from {processed} annotation(s)'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.agreement import compute_project_agreement
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Compute inter-annotator agreement per file and per annotator pair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Compute a single project')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project']:
+            projects = projects.filter(pk=options['project'])
+            if not projects.exists():
+                raise CommandError(f'Project {options["project"]} does not exist')
+
+        for project in projects.iterator():
+            result = compute_project_agreement(project)
+            if not result['files']:
+                continue
+            summary = ', '.join(
+                f'{name} {value:.3f}' for name, value in result.items()
+                if name not in ('files', 'annotator_pairs') and value is not None
+            )
+            self.stdout.write(
+                f'{project.name}: {result["files"]} file(s), {result["annotator_pairs"]} annotator pair(s)'
+                + (f', {summary}' if summary else '')
+            )
+
+        self.stdout.write(self.style.SUCCESS('Agreement computed'))
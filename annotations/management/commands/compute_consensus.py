@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.consensus import compute_consensus
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Aggregate annotator labels into consensus labels per file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Compute a single project')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Re-estimate annotator reliability and recompute every file, not only changed ones',
+        )
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project']:
+            projects = projects.filter(pk=options['project'])
+            if not projects.exists():
+                raise CommandError(f'Project {options["project"]} does not exist')
+
+        for project in projects.iterator():
+            result = compute_consensus(project, full=options['full'])
+            if result['files'] or result['removed']:
+                self.stdout.write(
+                    f'{project.name}: {result["files"]} file(s) updated, {result["removed"]} removed'
+                    + (' (full recompute)' if result['full'] else '')
+                )
+
+        self.stdout.write(self.style.SUCCESS('Consensus labels computed'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from annotations.eventlog import PARTITION_MONTHS_AHEAD, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions of the annotation event log (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=PARTITION_MONTHS_AHEAD,
+            help='How many months ahead of the current one to create',
+        )
+
+    def handle(self, *args, **options):
+        created = ensure_partitions(months_ahead=options['months'])
+        if not created:
+            self.stdout.write('Event log is not partitioned on this database, nothing to do')
+            return
+        for name in created:
+            self.stdout.write(f'Partition "{name}" is in place')
+        self.stdout.write(self.style.SUCCESS('Event log partitions ready'))
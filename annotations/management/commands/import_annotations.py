@@ -0,0 +1,58 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.bulk import BATCH_SIZE, import_annotations, iter_jsonl
+from annotations.schemas import SchemaError
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import machine pre-labels from a JSON or JSONL file into a project'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='Project id')
+        parser.add_argument('source', help='JSONL file with one annotation per line, or a .json array')
+        parser.add_argument('--user', required=True, help='Username recorded as annotator of the pre-labels')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--max-errors', type=int, default=20, help='How many row errors to print')
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project']} does not exist")
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        def progress(written, failed):
+            self.stdout.write(f'Written {written} annotation(s), {failed} error(s)')
+
+        try:
+            with open(options['source'], encoding='utf-8') as source:
+                if options['source'].endswith('.json'):
+                    data = json.load(source)
+                    if not isinstance(data, list):
+                        raise CommandError('JSON source must contain a list of annotations')
+                    rows = enumerate(data, 1)
+                else:
+                    rows = iter_jsonl(source)
+                result = import_annotations(
+                    project, user, rows, batch_size=options['batch_size'], progress=progress
+                )
+        except OSError as exc:
+            raise CommandError(f'Cannot read {options["source"]}: {exc}')
+        except ValueError as exc:
+            raise CommandError(f'Invalid JSON in {options["source"]}: {exc}')
+        except SchemaError as exc:
+            raise CommandError(str(exc))
+
+        for error in result['errors'][:options['max_errors']]:
+            self.stderr.write(f'Row {error["row"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result["created"]}, updated {result["updated"]} annotation(s); '
+            f'{len(result["errors"])} row(s) rejected'
+        ))
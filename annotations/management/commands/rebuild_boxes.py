@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotations.spatial import REBUILD_BATCH_SIZE, rebuild_boxes
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the box store of object detection annotations from annotation_data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Rebuild boxes of a single project')
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        project = None
+        if options['project']:
+            try:
+                project = Project.objects.get(pk=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError(f'Project {options["project"]} does not exist')
+
+        processed = 0
+
+        def progress(count):
+            nonlocal processed
+            processed += count
+            self.stdout.write(f'Indexed {processed} annotation(s)')
+
+        boxes = rebuild_boxes(project, batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Stored {boxes} box(es) from {processed} annotation(s)'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from annotations.assignment import reclaim_expired_leases
+
+
+class Command(BaseCommand):
+    help = 'Release expired task leases so their files return to the queue'
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = reclaim_expired_leases()
+            if not released:
+                break
+            total += released
+        self.stdout.write(self.style.SUCCESS(f'Released {total} expired lease(s)'))
@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from annotations.eventlog import METRICS, replay
+from annotations.rollups import replace_rollups
+from projects.models import Project
+
+
+def _day(value):
+    try:
+        return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min))
+    except ValueError:
+        raise CommandError(f'Expected a date as YYYY-MM-DD, got "{value}"')
+
+
+class Command(BaseCommand):
+    help = 'Replay the annotation event log in one pass and print or store derived metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('metrics', nargs='*', help=f'Metrics to compute: {", ".join(METRICS)}')
+        parser.add_argument('--project', type=int, help='Replay a single project')
+        parser.add_argument('--since', help='First day of events to replay (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Day after the last replayed events (YYYY-MM-DD)')
+        parser.add_argument(
+            '--write-rollups', action='store_true',
+            help='Replace daily rollups with the replayed ones (requires the full history)',
+        )
+
+    def handle(self, *args, **options):
+        names = options['metrics'] or list(METRICS)
+        unknown = set(names) - set(METRICS)
+        if unknown:
+            raise CommandError(f'Unknown metric: {", ".join(sorted(unknown))}')
+        project = None
+        if options['project']:
+            project = Project.objects.filter(pk=options['project']).first()
+            if project is None:
+                raise CommandError(f'Project {options["project"]} does not exist')
+        since = _day(options['since']) if options['since'] else None
+        until = _day(options['until']) if options['until'] else None
+        if options['write_rollups']:
+            if since or until:
+                raise CommandError('--write-rollups needs the full history, drop --since/--until')
+            if 'rollups' not in names:
+                names.append('rollups')
+
+        results = replay([METRICS[name]() for name in names], project=project, since=since, until=until)
+
+        if options['write_rollups']:
+            written = replace_rollups(results['rollups'], project)
+            self.stdout.write(f'Wrote {written} rollup cell(s)')
+        if 'rollups' in results:
+            # Ключи-кортежи не сериализуются в JSON
+            results['rollups'] = [
+                {'day': day, 'project_id': project_id, 'annotator_id': annotator_id, 'status': status, 'count': count}
+                for (day, project_id, annotator_id, status), count in sorted(results['rollups'].items())
+            ]
+        self.stdout.write(json.dumps(results, cls=DjangoJSONEncoder, indent=2))
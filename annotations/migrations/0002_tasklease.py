@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0001_initial'),
+        ('projects', '0007_projectfile_lease_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='projects.projectfile')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_leases', to='projects.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_leases', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['project', 'user'], name='annotations_project_d3a837_idx')],
+                'unique_together': {('file', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0002_tasklease'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['annotator', 'status'], name='annotations_annotat_b5f05c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['annotator', '-created_at'], name='annotations_annotat_2aa254_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['project', 'status', 'submitted_at'], name='annotations_project_340d2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['project', '-created_at'], name='annotations_project_eb64b7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotationsession',
+            index=models.Index(fields=['annotator', '-started_at'], name='annotations_annotat_645b48_idx'),
+        ),
+    ]
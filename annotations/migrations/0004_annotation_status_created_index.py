@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0003_annotation_indexes'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='annotation',
+            name='annotations_annotat_b5f05c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['annotator', 'status', '-created_at'], name='annotations_annotat_ed9907_idx'),
+        ),
+    ]
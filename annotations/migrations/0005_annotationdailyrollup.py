@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from annotations.rollups import rebuild_rollups
+
+
+def fill_rollups(apps, schema_editor):
+    """Агрегаты существующих аннотаций; без них переходы уменьшали бы незаполненные ячейки"""
+    # rebuild_rollups читает только id, created_at, project, annotator и status аннотаций
+    rebuild_rollups()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0004_annotation_status_created_index'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotationDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('submitted', 'Submitted'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('needs_review', 'Needs Review')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('annotator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='projects.project')),
+            ],
+            options={
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['annotator', 'day'], name='annotations_annotat_bcab8d_idx'), models.Index(fields=['project', 'day'], name='annotations_project_ea49c8_idx')],
+                'unique_together': {('day', 'project', 'annotator', 'status')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
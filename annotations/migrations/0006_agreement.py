@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0005_annotationdailyrollup'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotatorAgreement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shared_files', models.IntegerField()),
+                ('observed_agreement', models.FloatField()),
+                ('kappa', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('annotator_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('annotator_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annotator_agreements', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'annotator_b'], name='annotations_project_a2af27_idx')],
+                'unique_together': {('project', 'annotator_a', 'annotator_b')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FileAgreement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('annotator_count', models.IntegerField()),
+                ('agreement', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='agreement', to='projects.projectfile')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_agreements', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'agreement'], name='annotations_project_d41510_idx')],
+            },
+        ),
+    ]
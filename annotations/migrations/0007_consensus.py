@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0006_agreement'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotatorReliability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accuracy', models.FloatField()),
+                ('confusion', models.JSONField()),
+                ('annotation_count', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('annotator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='annotator_reliability', to='projects.project')),
+            ],
+            options={
+                'unique_together': {('project', 'annotator')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FileConsensus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255)),
+                ('confidence', models.FloatField()),
+                ('majority_label', models.CharField(max_length=255)),
+                ('majority_share', models.FloatField()),
+                ('annotation_count', models.IntegerField()),
+                ('source_updated_at', models.DateTimeField()),
+                ('computed_at', models.DateTimeField()),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='consensus', to='projects.projectfile')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consensus_labels', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'confidence'], name='annotations_project_f6de25_idx')],
+            },
+        ),
+    ]
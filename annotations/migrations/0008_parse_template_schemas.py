@@ -0,0 +1,27 @@
+import json
+
+from django.db import migrations
+
+
+def parse_schemas(apps, schema_editor):
+    """Шаблоны, созданные до проверки схем, хранили исходную строку из формы"""
+    AnnotationTemplate = apps.get_model('annotations', 'AnnotationTemplate')
+    for template in AnnotationTemplate.objects.all().iterator():
+        if not isinstance(template.schema, str):
+            continue
+        try:
+            template.schema = json.loads(template.schema or '{}')
+        except ValueError:
+            continue
+        template.save(update_fields=['schema'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0007_consensus'),
+    ]
+
+    operations = [
+        migrations.RunPython(parse_schemas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from annotations.boxes import BOX_PROJECT_TYPES, extract_boxes
+from annotations.spatial import install, pack_boxes, uninstall, unpack_boxes
+
+
+def create_box_store(apps, schema_editor):
+    """Заполняет буферы и строки рамок существующих аннотаций, затем строит пространственный индекс"""
+    Annotation = apps.get_model('annotations', 'Annotation')
+    BoxBuffer = apps.get_model('annotations', 'BoxBuffer')
+    Box = apps.get_model('annotations', 'Box')
+    annotations = Annotation.objects.filter(project__project_type__in=BOX_PROJECT_TYPES).only(
+        'pk', 'project_id', 'annotation_data'
+    )
+    for annotation in annotations.iterator(chunk_size=2000):
+        labels, packed = pack_boxes(extract_boxes(annotation.annotation_data))
+        BoxBuffer.objects.create(
+            annotation_id=annotation.pk, project_id=annotation.project_id,
+            labels=labels, coordinates=packed, count=len(labels),
+        )
+        Box.objects.bulk_create([
+            Box(
+                annotation_id=annotation.pk, project_id=annotation.project_id, position=position,
+                label=label, x1=x1, y1=y1, x2=x2, y2=y2, area=(x2 - x1) * (y2 - y1),
+            )
+            for position, (label, (x1, y1, x2, y2)) in enumerate(zip(labels, unpack_boxes(packed).tolist()))
+        ])
+    install(schema_editor)
+
+
+def drop_box_store(apps, schema_editor):
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0008_parse_template_schemas'),
+        ('projects', '0008_projectfile_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoxBuffer',
+            fields=[
+                ('annotation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='box_buffer', serialize=False, to='annotations.annotation')),
+                ('labels', models.JSONField(default=list)),
+                ('coordinates', models.BinaryField()),
+                ('count', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='box_buffers', to='projects.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Box',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('label', models.CharField(max_length=255)),
+                ('x1', models.FloatField()),
+                ('y1', models.FloatField()),
+                ('x2', models.FloatField()),
+                ('y2', models.FloatField()),
+                ('area', models.FloatField()),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='boxes', to='annotations.annotation')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='boxes', to='projects.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'label', 'area'], name='annotations_project_e755c9_idx'), models.Index(fields=['project', 'area'], name='annotations_project_085e3b_idx')],
+            },
+        ),
+        migrations.RunPython(create_box_store, drop_box_store),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:46
+
+from datetime import date
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+# Значения на момент миграции: она не должна меняться вместе с annotations.eventlog
+CREATED, STATUS_CHANGED = 1, 2
+REVIEWED_STATUSES = ('approved', 'rejected', 'needs_review')
+PARTITION_MONTHS_AHEAD = 3
+
+
+def _month(day, offset=0):
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def install_partitioning(schema_editor, model, oldest):
+    """PostgreSQL: заменяет только что созданную пустую таблицу журнала секционированной по месяцам
+
+    Первичный ключ секционированной таблицы обязан включать created_at, поэтому он (id, created_at);
+    id по-прежнему выдаёт последовательность. Секции создаются с месяца oldest (переносимая история)
+    до PARTITION_MONTHS_AHEAD месяцев вперёд. Индексы Meta.indexes CreateModel уже отложил в
+    deferred_sql, они строятся на новой родительской таблице при выходе из schema_editor.
+    """
+    table = model._meta.db_table
+    quote = schema_editor.quote_name
+    sequence = f'{table}_id_seq'
+    columns = []
+    for field in model._meta.local_fields:
+        if field.primary_key:
+            columns.append(f"{quote(field.column)} bigint NOT NULL DEFAULT nextval('{sequence}')")
+        else:
+            definition, _ = schema_editor.column_sql(model, field, include_default=False)
+            columns.append(f'{quote(field.column)} {definition}')
+    pk, created_at = quote(model._meta.pk.column), quote(model._meta.get_field('created_at').column)
+
+    schema_editor.execute(f'DROP TABLE {quote(table)}')
+    schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {quote(sequence)}')
+    schema_editor.execute(
+        f'CREATE TABLE {quote(table)} ({", ".join(columns)}, PRIMARY KEY ({pk}, {created_at})) '
+        f'PARTITION BY RANGE ({created_at})'
+    )
+    schema_editor.execute(f'ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.{pk}')
+    schema_editor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+    lower, last = _month(oldest), _month(django.utils.timezone.now().date(), PARTITION_MONTHS_AHEAD)
+    while lower <= last:
+        upper = _month(lower, 1)
+        schema_editor.execute(
+            f'CREATE TABLE {quote(f"{table}_{lower:%Y%m}")} PARTITION OF {quote(table)} '
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        lower = upper
+
+
+def _history(annotation):
+    """Восстановимая история аннотации: создание, отправка, проверка и итоговый статус"""
+    steps = [('draft', annotation.created_at)]
+    if annotation.submitted_at is not None:
+        steps.append(('submitted', annotation.submitted_at))
+    if annotation.status in REVIEWED_STATUSES and annotation.reviewed_at is not None:
+        steps.append((annotation.status, annotation.reviewed_at))
+    if steps[-1][0] != annotation.status:
+        steps.append((annotation.status, annotation.updated_at))
+    return steps
+
+
+def create_event_log(apps, schema_editor):
+    """Секционирует журнал (PostgreSQL) и переносит в него историю существующих аннотаций"""
+    Annotation = apps.get_model('annotations', 'Annotation')
+    AnnotationEvent = apps.get_model('annotations', 'AnnotationEvent')
+    if schema_editor.connection.vendor == 'postgresql':
+        oldest = Annotation.objects.aggregate(oldest=Min('created_at'))['oldest'] or django.utils.timezone.now()
+        install_partitioning(schema_editor, AnnotationEvent, oldest.date())
+
+    events = []
+    annotations = Annotation.objects.only(
+        'pk', 'project_id', 'annotator_id', 'reviewed_by_id', 'status',
+        'created_at', 'submitted_at', 'reviewed_at', 'updated_at',
+    ).order_by('pk')
+    for annotation in annotations.iterator(chunk_size=2000):
+        previous = ''
+        for status, at in _history(annotation):
+            events.append(AnnotationEvent(
+                annotation_id=annotation.pk, project_id=annotation.project_id,
+                annotator_id=annotation.annotator_id,
+                actor_id=annotation.reviewed_by_id if status in REVIEWED_STATUSES else annotation.annotator_id,
+                event_type=STATUS_CHANGED if previous else CREATED,
+                status=status, previous_status=previous, created_at=at, payload={},
+            ))
+            previous = status
+        if len(events) >= 2000:
+            AnnotationEvent.objects.bulk_create(events)
+            events = []
+    AnnotationEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('annotations', '0009_box_store'),
+        ('projects', '0008_projectfile_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.PositiveSmallIntegerField(choices=[(1, 'Created'), (2, 'Status Changed'), (3, 'Deleted')])),
+                ('status', models.CharField(blank=True, max_length=20)),
+                ('previous_status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('actor', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('annotation', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='annotations.annotation')),
+                ('annotator', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='projects.project')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['annotation', 'id'], name='annotations_annotat_d12b7c_idx'), models.Index(fields=['project', 'id'], name='annotations_project_202aa7_idx'), models.Index(fields=['created_at'], name='annotations_created_fe59ae_idx')],
+            },
+        ),
+        migrations.RunPython(create_event_log, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from projects.models import Project, ProjectFile
 import json
 
@@ -45,6 +46,12 @@ class Annotation(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['file', 'annotator']
+        indexes = [
+            models.Index(fields=['annotator', 'status', '-created_at']),
+            models.Index(fields=['annotator', '-created_at']),
+            models.Index(fields=['project', 'status', 'submitted_at']),
+            models.Index(fields=['project', '-created_at']),
+        ]
     
     def __str__(self):
         return f"Annotation by {self.annotator.username} on {self.file.filename}"
@@ -174,6 +181,11 @@ class AnnotationSession(models.Model):
     user_agent = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['annotator', '-started_at']),
+        ]
+    
     def __str__(self):
         return f"Session by {self.annotator.username} on {self.project.name}"
     
@@ -183,3 +195,231 @@ class AnnotationSession(models.Model):
             duration = self.ended_at - self.started_at
             return int(duration.total_seconds() / 60)
         return 0
+
+class TaskLease(models.Model):
+    """Временное закрепление файла за аннотатором"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='task_leases')
+    file = models.ForeignKey(ProjectFile, on_delete=models.CASCADE, related_name='leases')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_leases')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        ordering = ['expires_at']
+        unique_together = ['file', 'user']
+        indexes = [
+            models.Index(fields=['project', 'user']),
+        ]
+    
+    def __str__(self):
+        return f"Lease of {self.file_id} to {self.user_id} until {self.expires_at}"
+
+class AnnotationDailyRollup(models.Model):
+    """Число аннотаций за день (по дате создания) в разрезе проекта, аннотатора и статуса"""
+    day = models.DateField()
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_rollups')
+    annotator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    status = models.CharField(max_length=20, choices=Annotation.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['day']
+        unique_together = ['day', 'project', 'annotator', 'status']
+        indexes = [
+            models.Index(fields=['annotator', 'day']),
+            models.Index(fields=['project', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count}"
+
+class FileAgreement(models.Model):
+    """Согласие аннотаторов по одному файлу"""
+    file = models.OneToOneField(ProjectFile, on_delete=models.CASCADE, related_name='agreement')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='file_agreements')
+    
+    annotator_count = models.IntegerField()
+    # Доля согласных пар (классификация) или согласие по IoU рамок (детекция), от 0 до 1
+    agreement = models.FloatField()
+    
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'agreement']),
+        ]
+    
+    def __str__(self):
+        return f"Agreement {self.agreement:.2f} on {self.file_id}"
+
+class AnnotatorAgreement(models.Model):
+    """Согласие пары аннотаторов по общим файлам проекта (annotator_a.id < annotator_b.id)"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='annotator_agreements')
+    annotator_a = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    annotator_b = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    
+    shared_files = models.IntegerField()
+    # Доля совпавших меток или среднее согласие рамок
+    observed_agreement = models.FloatField()
+    # Каппа Коэна (только для классификации)
+    kappa = models.FloatField(null=True, blank=True)
+    
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['project', 'annotator_a', 'annotator_b']
+        indexes = [
+            models.Index(fields=['project', 'annotator_b']),
+        ]
+    
+    def __str__(self):
+        return f"Agreement of {self.annotator_a_id} and {self.annotator_b_id}: {self.observed_agreement:.2f}"
+
+class FileConsensus(models.Model):
+    """Итоговая (золотая) метка файла, сведённая из меток нескольких аннотаторов"""
+    file = models.OneToOneField(ProjectFile, on_delete=models.CASCADE, related_name='consensus')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='consensus_labels')
+    
+    # Метка по модели Дэвида–Скина с учётом надёжности аннотаторов и её апостериорная вероятность
+    label = models.CharField(max_length=255)
+    confidence = models.FloatField()
+    # Метка простым большинством голосов и доля голосов за неё
+    majority_label = models.CharField(max_length=255)
+    majority_share = models.FloatField()
+    
+    # Состояние аннотаций файла на момент расчёта, по нему находятся изменившиеся файлы
+    annotation_count = models.IntegerField()
+    source_updated_at = models.DateTimeField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'confidence']),
+        ]
+    
+    def __str__(self):
+        return f"{self.label} ({self.confidence:.2f}) on {self.file_id}"
+
+class AnnotatorReliability(models.Model):
+    """Матрица ошибок аннотатора в проекте, оценённая по модели Дэвида–Скина"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='annotator_reliability')
+    annotator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    
+    # Доля верных меток с учётом частот классов
+    accuracy = models.FloatField()
+    # {истинная метка: {поставленная метка: вероятность}}
+    confusion = models.JSONField()
+    annotation_count = models.IntegerField()
+    
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['project', 'annotator']
+    
+    def __str__(self):
+        return f"Reliability of {self.annotator_id}: {self.accuracy:.2f}"
+
+class BoxBuffer(models.Model):
+    """Рамки аннотации в упакованном виде: float32 (x1, y1, x2, y2) подряд и метки по порядку"""
+    annotation = models.OneToOneField(
+        Annotation, on_delete=models.CASCADE, primary_key=True, related_name='box_buffer'
+    )
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='box_buffers')
+    
+    labels = models.JSONField(default=list)
+    coordinates = models.BinaryField()
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.count} boxes of {self.annotation_id}"
+
+class Box(models.Model):
+    """Одна рамка объекта: индексируемые метка, площадь и координаты для пространственных запросов"""
+    annotation = models.ForeignKey(Annotation, on_delete=models.CASCADE, related_name='boxes')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='boxes')
+    # Номер рамки в BoxBuffer и в annotation_data['objects'] после отбора корректных
+    position = models.IntegerField()
+    
+    label = models.CharField(max_length=255)
+    x1 = models.FloatField()
+    y1 = models.FloatField()
+    x2 = models.FloatField()
+    y2 = models.FloatField()
+    area = models.FloatField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'label', 'area']),
+            models.Index(fields=['project', 'area']),
+        ]
+    
+    def __str__(self):
+        return f"{self.label} [{self.x1}, {self.y1}, {self.x2}, {self.y2}]"
+
+class AnnotationEvent(models.Model):
+    """Запись журнала: создание, смена статуса или удаление аннотации; строки только добавляются"""
+    CREATED = 1
+    STATUS_CHANGED = 2
+    DELETED = 3
+    EVENT_TYPES = [
+        (CREATED, 'Created'),
+        (STATUS_CHANGED, 'Status Changed'),
+        (DELETED, 'Deleted'),
+    ]
+    
+    # Ссылки без внешних ключей и каскадов: журнал переживает удаление аннотаций и пользователей
+    annotation = models.ForeignKey(
+        Annotation, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='events'
+    )
+    project = models.ForeignKey(
+        Project, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    annotator = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    # Кто вызвал событие; пусто для автоматических действий без пользователя
+    actor = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+'
+    )
+    event_type = models.PositiveSmallIntegerField(choices=EVENT_TYPES)
+    status = models.CharField(max_length=20, blank=True)
+    previous_status = models.CharField(max_length=20, blank=True)
+    # Не auto_now_add: перенос истории записывает события задним числом
+    created_at = models.DateTimeField(default=timezone.now)
+    # Небольшие подробности события, например оценка проверки
+    payload = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['annotation', 'id']),
+            models.Index(fields=['project', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_event_type_display()} {self.annotation_id}: {self.previous_status} -> {self.status}"
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Annotation events are append-only')
+        super().save(*args, **kwargs)
+
+class AnnotationRevision(models.Model):
+    """Версия annotation_data: полный снимок или JSON Patch относительно предыдущей версии"""
+    annotation = models.ForeignKey(Annotation, on_delete=models.CASCADE, related_name='revisions')
+    # Номер версии аннотации с нуля; каждая SNAPSHOT_INTERVAL-я версия хранится целиком
+    number = models.PositiveIntegerField()
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    is_snapshot = models.BooleanField(default=False)
+    # Снимок — документ целиком, иначе список операций RFC 6902
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['annotation', 'number']
+        unique_together = ['annotation', 'number']
+    
+    def __str__(self):
+        return f"Revision {self.number} of {self.annotation_id}"
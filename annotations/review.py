@@ -0,0 +1,205 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.dashboard import invalidate_dashboard
+from projects.counters import COUNTED_ANNOTATION_STATUSES, annotations_counted, review_scores_added
+from projects.models import Project, ProjectSettings
+
+from .agreement import annotator_consistency
+from .assignment import release_leases
+from .eventlog import record_transitions
+from .live import publish_status_changes
+from .models import Annotation, QualityReview
+from .rollups import bulk_transition
+
+REVIEW_DECISIONS = {
+    'approve': 'approved',
+    'reject': 'rejected',
+}
+# Статусы, из которых аннотацию можно утвердить или отклонить
+REVIEWABLE_STATUSES = ('submitted', 'needs_review')
+# Сколько аннотаций обрабатывается в одной транзакции
+MAX_BULK_REVIEW = 500
+SCORE_FIELDS = ('accuracy_score', 'completeness_score', 'consistency_score')
+REVIEWED_FIELDS = ['status', 'quality_score', 'reviewed_at', 'reviewed_by', 'reviewer_notes', 'updated_at']
+# Только поля, нужные для смены статуса и пересчёта счётчиков
+LOADED_FIELDS = ('id', 'project_id', 'file_id', 'annotator_id', 'status', 'quality_score', 'created_at')
+
+
+class ReviewError(Exception):
+    """Ошибка пакетного обзора с HTTP-статусом для ответа"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _thresholds(project):
+    try:
+        project_settings = project.settings
+    except ProjectSettings.DoesNotExist:
+        project_settings = ProjectSettings()
+    return project_settings.auto_approve_threshold, project_settings.quality_threshold
+
+
+def _parse_scores(scores):
+    try:
+        values = {field: float(scores[field]) for field in SCORE_FIELDS}
+    except (KeyError, TypeError, ValueError):
+        raise ReviewError('Scores must include accuracy, completeness and consistency')
+    if not all(0.0 <= value <= 1.0 for value in values.values()):
+        raise ReviewError('Scores must be between 0 and 1')
+    return values
+
+
+def _save_reviewed(annotations, reviews):
+    """Сохраняет новые статусы и обзоры пачкой и переносит побочные эффекты сигналов"""
+    now = timezone.now()
+    for annotation in annotations:
+        annotation.updated_at = now
+    Annotation.objects.bulk_update(annotations, REVIEWED_FIELDS, batch_size=MAX_BULK_REVIEW)
+    QualityReview.objects.bulk_create(reviews, batch_size=MAX_BULK_REVIEW)
+
+    # bulk_update и bulk_create не отправляют сигналы: счётчики обновляются здесь
+    file_deltas = defaultdict(lambda: defaultdict(int))
+    released = defaultdict(list)
+    for annotation in annotations:
+        was_counted = annotation._original_status in COUNTED_ANNOTATION_STATUSES
+        is_counted = annotation.status in COUNTED_ANNOTATION_STATUSES
+        if was_counted != is_counted:
+            file_deltas[annotation.project_id][annotation.file_id] += 1 if is_counted else -1
+            if is_counted:
+                released[annotation.annotator_id].append(annotation.file_id)
+    for project_id, deltas in file_deltas.items():
+        annotations_counted(project_id, deltas)
+    # Аренды снимаются пачкой на аннотатора, а не запросом на каждую аннотацию
+    for annotator_id, file_ids in released.items():
+        release_leases(annotator_id, file_ids)
+
+    changes = [(annotation, annotation._original_status) for annotation in annotations]
+    bulk_transition(changes)
+    record_transitions(changes)
+    publish_status_changes(changes)
+
+    scores = defaultdict(lambda: [0.0, 0])
+    for review in reviews:
+        scores[review.annotation.project_id][0] += review.overall_score
+        scores[review.annotation.project_id][1] += 1
+    for project_id, (total, count) in scores.items():
+        review_scores_added(Project.objects.filter(pk=project_id), total, count)
+
+    for annotation in annotations:
+        annotation._original_status = annotation.status
+    invalidate_dashboard(*{annotation.annotator_id for annotation in annotations})
+
+
+def _make_review(annotation, reviewer, review_type, values, comments):
+    review = QualityReview(
+        annotation=annotation,
+        reviewer=reviewer,
+        review_type=review_type,
+        comments=comments,
+        is_approved=annotation.status == 'approved',
+        needs_revision=annotation.status != 'approved',
+        **values,
+    )
+    # save() не вызывается, поэтому общая оценка считается так же, как в QualityReview.save
+    review.overall_score = sum(values.values()) / len(values)
+    return review
+
+
+def review_annotations(reviewer, annotation_ids, decision, scores=None, comments=''):
+    """Утверждает или отклоняет аннотации из проектов рецензента одной транзакцией"""
+    if decision not in REVIEW_DECISIONS:
+        raise ReviewError(f'Unknown decision: {decision}')
+    annotation_ids = {int(pk) for pk in annotation_ids}
+    if not annotation_ids:
+        raise ReviewError('No annotations selected')
+    if len(annotation_ids) > MAX_BULK_REVIEW:
+        raise ReviewError(f'At most {MAX_BULK_REVIEW} annotations can be reviewed at once')
+    values = _parse_scores(scores) if scores else None
+
+    status = REVIEW_DECISIONS[decision]
+    now = timezone.now()
+    with transaction.atomic():
+        annotations = list(
+            Annotation.objects.filter(
+                pk__in=annotation_ids, project__owner=reviewer, status__in=REVIEWABLE_STATUSES
+            ).select_for_update(of=('self',)).only(*LOADED_FIELDS)
+        )
+        consistency = {}
+        if values is None:
+            by_project = defaultdict(set)
+            for annotation in annotations:
+                by_project[annotation.project_id].add(annotation.annotator_id)
+            for project_id, annotator_ids in by_project.items():
+                for annotator_id, score in annotator_consistency(project_id, annotator_ids).items():
+                    consistency[project_id, annotator_id] = score
+        reviews = []
+        for annotation in annotations:
+            # Без оценок берётся автоматическая оценка аннотации, если она есть
+            if values is None:
+                default = annotation.quality_score
+                if default is None:
+                    default = 1.0 if status == 'approved' else 0.0
+                review_values = dict.fromkeys(SCORE_FIELDS, default)
+                # Согласованность — посчитанное согласие аннотатора с коллегами по проекту
+                review_values['consistency_score'] = consistency.get(
+                    (annotation.project_id, annotation.annotator_id), default
+                )
+            else:
+                review_values = values
+            annotation.status = status
+            annotation.reviewed_at = now
+            annotation.reviewed_by = reviewer
+            annotation.reviewer_notes = comments
+            review = _make_review(annotation, reviewer, 'manual', review_values, comments)
+            annotation.quality_score = review.overall_score
+            reviews.append(review)
+        _save_reviewed(annotations, reviews)
+
+    reviewed = {annotation.pk for annotation in annotations}
+    return reviewed, sorted(annotation_ids - reviewed)
+
+
+def auto_review(project, batch_size=MAX_BULK_REVIEW):
+    """Утверждает отправленные аннотации с оценкой не ниже auto_approve_threshold,
+    а с оценкой ниже quality_threshold отправляет на ручной обзор"""
+    auto_approve_threshold, quality_threshold = _thresholds(project)
+    approved = flagged = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            annotations = list(
+                Annotation.objects.filter(
+                    project=project, status='submitted', quality_score__isnull=False, pk__gt=last_pk
+                ).order_by('pk').select_for_update(of=('self',)).only(*LOADED_FIELDS)[:batch_size]
+            )
+            if not annotations:
+                break
+            last_pk = annotations[-1].pk
+
+            now = timezone.now()
+            changed, reviews = [], []
+            for annotation in annotations:
+                if annotation.quality_score >= auto_approve_threshold:
+                    annotation.status = 'approved'
+                    approved += 1
+                elif annotation.quality_score < quality_threshold:
+                    annotation.status = 'needs_review'
+                    flagged += 1
+                else:
+                    continue
+                annotation.reviewed_at = now
+                annotation.reviewed_by_id = project.owner_id
+                annotation.reviewer_notes = ''
+                changed.append(annotation)
+                reviews.append(_make_review(
+                    annotation, project.owner, 'automatic',
+                    dict.fromkeys(SCORE_FIELDS, annotation.quality_score),
+                    'Automatically reviewed against project thresholds',
+                ))
+            _save_reviewed(changed, reviews)
+    return approved, flagged
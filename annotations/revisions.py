@@ -0,0 +1,181 @@
+import copy
+import json
+
+from .models import AnnotationRevision
+
+# Каждая SNAPSHOT_INTERVAL-я версия хранится целиком, поэтому любая версия
+# восстанавливается применением не более SNAPSHOT_INTERVAL - 1 патчей
+SNAPSHOT_INTERVAL = 20
+REVISION_FIELDS = ['number', 'is_snapshot', 'data']
+
+
+class PatchError(ValueError):
+    """Патч не применим к документу"""
+
+
+def _escape(token):
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def diff(source, target, path=''):
+    """Операции JSON Patch (add, remove, replace), переводящие source в target
+
+    Словари и списки сравниваются поэлементно, поэтому размер патча пропорционален
+    правке, а не документу: сдвиг одной вершины многоугольника — одна операция replace.
+    """
+    if type(source) is not type(target):
+        return [{'op': 'replace', 'path': path, 'value': target}]
+    if isinstance(source, dict):
+        ops = []
+        for key in source:
+            if key not in target:
+                ops.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+        for key, value in target.items():
+            if key in source:
+                ops.extend(diff(source[key], value, f'{path}/{_escape(key)}'))
+            else:
+                ops.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+        return ops
+    if isinstance(source, list):
+        # Общие начало и конец не попадают в патч: вставка или удаление элемента — одна операция
+        start = 0
+        limit = min(len(source), len(target))
+        while start < limit and source[start] == target[start]:
+            start += 1
+        source_end, target_end = len(source), len(target)
+        while source_end > start and target_end > start and source[source_end - 1] == target[target_end - 1]:
+            source_end -= 1
+            target_end -= 1
+        common = min(source_end, target_end) - start
+        ops = []
+        for index in range(start, start + common):
+            ops.extend(diff(source[index], target[index], f'{path}/{index}'))
+        index = start + common
+        for _ in range(source_end - index):
+            ops.append({'op': 'remove', 'path': f'{path}/{index}'})
+        for position in range(index, target_end):
+            ops.append({'op': 'add', 'path': f'{path}/{position}', 'value': target[position]})
+        return ops
+    if source != target:
+        return [{'op': 'replace', 'path': path, 'value': target}]
+    return []
+
+
+def _resolve(document, path):
+    """(контейнер, ключ) для указателя JSON; ключ списка — индекс или '-' для конца"""
+    tokens = [_unescape(token) for token in path.split('/')[1:]]
+    container = document
+    try:
+        for token in tokens[:-1]:
+            container = container[int(token) if isinstance(container, list) else token]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise PatchError(f'Path not found: {path}')
+    key = tokens[-1]
+    if isinstance(container, list) and key != '-':
+        if not key.isdigit():
+            raise PatchError(f'Invalid list index: {path}')
+        key = int(key)
+    elif not isinstance(container, (dict, list)):
+        raise PatchError(f'Path not found: {path}')
+    return container, key
+
+
+def apply_patch(document, patch):
+    """Новый документ после операций патча; исходный не изменяется"""
+    document = copy.deepcopy(document)
+    for op in patch:
+        path = op['path']
+        if not path:
+            if op['op'] == 'remove':
+                raise PatchError('Cannot remove the document root')
+            document = copy.deepcopy(op['value'])
+            continue
+        container, key = _resolve(document, path)
+        try:
+            if op['op'] == 'add':
+                if isinstance(container, list):
+                    if key == '-':
+                        key = len(container)
+                    if key > len(container):
+                        raise IndexError(key)
+                    container.insert(key, copy.deepcopy(op['value']))
+                else:
+                    container[key] = copy.deepcopy(op['value'])
+            elif op['op'] == 'remove':
+                del container[key]
+            elif op['op'] == 'replace':
+                if isinstance(container, dict) and key not in container:
+                    raise KeyError(key)
+                container[key] = copy.deepcopy(op['value'])
+            else:
+                raise PatchError(f'Unsupported operation: {op["op"]}')
+        except (KeyError, IndexError, TypeError):
+            raise PatchError(f'Path not found: {path}')
+    return document
+
+
+def _rebuild(rows):
+    """Документ последней из строк (номер, снимок?, данные), упорядоченных по номеру"""
+    base = max(position for position, (_, is_snapshot, _) in enumerate(rows) if is_snapshot)
+    document = rows[base][2]
+    for _, _, patch in rows[base + 1:]:
+        document = apply_patch(document, patch)
+    return document
+
+
+def record_revision(annotation, author=None, previous=None):
+    """Записывает текущие annotation_data новой версией; возвращает её или None без изменений
+
+    Вызывается в транзакции сохранения аннотации: её UPDATE блокирует строку и
+    упорядочивает номера версий. Патч строится от последней сохранённой версии, а не от
+    данных, прочитанных формой, поэтому цепочка верна и при одновременных правках.
+    previous — данные до правки; у аннотации без истории они становятся версией 0.
+    """
+    data = annotation.annotation_data
+    # Последние SNAPSHOT_INTERVAL версий всегда содержат снимок
+    rows = list(
+        AnnotationRevision.objects.filter(annotation=annotation)
+        .order_by('-number').values_list(*REVISION_FIELDS)[:SNAPSHOT_INTERVAL]
+    )
+    rows.reverse()
+    revisions = []
+    if rows:
+        number, latest = rows[-1][0] + 1, _rebuild(rows)
+    elif previous is not None and previous != data:
+        revisions.append(AnnotationRevision(annotation=annotation, number=0, is_snapshot=True, data=previous))
+        number, latest = 1, previous
+    else:
+        number, latest = 0, None
+
+    if number == 0:
+        revisions.append(AnnotationRevision(
+            annotation=annotation, number=0, author=author, is_snapshot=True, data=data,
+        ))
+    else:
+        patch = diff(latest, data)
+        if not patch:
+            return None
+        # Патч крупнее самого документа (правка почти всего) хранится снимком
+        is_snapshot = number % SNAPSHOT_INTERVAL == 0 or len(json.dumps(patch)) >= len(json.dumps(data))
+        revisions.append(AnnotationRevision(
+            annotation=annotation, number=number, author=author,
+            is_snapshot=is_snapshot, data=data if is_snapshot else patch,
+        ))
+    AnnotationRevision.objects.bulk_create(revisions)
+    return revisions[-1]
+
+
+def get_revision(annotation, number):
+    """annotation_data версии number одним запросом и не более SNAPSHOT_INTERVAL - 1 патчами"""
+    rows = list(
+        AnnotationRevision.objects.filter(
+            annotation=annotation, number__gte=number - number % SNAPSHOT_INTERVAL, number__lte=number,
+        ).order_by('number').values_list(*REVISION_FIELDS)
+    )
+    if not rows or rows[-1][0] != number:
+        raise AnnotationRevision.DoesNotExist(f'Revision {number} does not exist')
+    return _rebuild(rows)
@@ -0,0 +1,128 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Annotation, AnnotationDailyRollup
+
+# Сколько аннотаций агрегировать за один запрос при пересчёте
+REBUILD_BATCH_SIZE = 10000
+# Самый длинный ряд, который можно запросить
+MAX_SERIES_DAYS = 366
+
+
+def rollup_day(created_at):
+    """День агрегата: дата создания в текущем часовом поясе (как TruncDate)"""
+    return timezone.localdate(created_at)
+
+
+def bump(day, project_id, annotator_id, status, delta):
+    """Атомарно изменяет счётчик одной ячейки агрегата"""
+    cell = AnnotationDailyRollup.objects.filter(
+        day=day, project_id=project_id, annotator_id=annotator_id, status=status
+    )
+    if cell.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            AnnotationDailyRollup.objects.create(
+                day=day, project_id=project_id, annotator_id=annotator_id, status=status, count=delta
+            )
+    except IntegrityError:
+        # Строку только что создал параллельный запрос
+        cell.update(count=F('count') + delta)
+
+
+def annotation_transition(annotation, old_status, new_status):
+    """Переносит аннотацию между ячейками при создании, смене статуса или удалении"""
+    if old_status == new_status:
+        return
+    day = rollup_day(annotation.created_at)
+    if old_status is not None:
+        bump(day, annotation.project_id, annotation.annotator_id, old_status, -1)
+    if new_status is not None:
+        bump(day, annotation.project_id, annotation.annotator_id, new_status, 1)
+
+
+def bulk_transition(changes):
+    """Пакетный annotation_transition для пар (аннотация, старый статус): одна правка на ячейку.
+    Старый статус None означает новую аннотацию"""
+    cells = Counter()
+    for annotation, old_status in changes:
+        if old_status == annotation.status:
+            continue
+        key = (rollup_day(annotation.created_at), annotation.project_id, annotation.annotator_id)
+        if old_status is not None:
+            cells[(*key, old_status)] -= 1
+        cells[(*key, annotation.status)] += 1
+    for (day, project_id, annotator_id, status), delta in cells.items():
+        if delta:
+            bump(day, project_id, annotator_id, status, delta)
+
+
+def rebuild_rollups(project=None, batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """Пересчитывает агрегаты (всех или одного проекта) пачками по первичному ключу"""
+    annotations = Annotation.objects.all()
+    if project is not None:
+        annotations = annotations.filter(project=project)
+
+    cells = Counter()
+    last_pk = 0
+    while True:
+        pks = list(annotations.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        rows = (
+            annotations.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'project_id', 'annotator_id', 'status')
+            .annotate(count=Count('pk'))
+            .order_by()
+        )
+        for row in rows:
+            cells[row['day'], row['project_id'], row['annotator_id'], row['status']] += row['count']
+        last_pk = pks[-1]
+        if progress:
+            progress(len(pks))
+
+    return replace_rollups(cells, project)
+
+
+def replace_rollups(cells, project=None):
+    """Заменяет агрегаты (всех или одного проекта) ячейками {(день, проект, аннотатор, статус): число}"""
+    rollups = AnnotationDailyRollup.objects.all()
+    if project is not None:
+        rollups = rollups.filter(project=project)
+    with transaction.atomic():
+        rollups.delete()
+        AnnotationDailyRollup.objects.bulk_create(
+            [
+                AnnotationDailyRollup(
+                    day=day, project_id=project_id, annotator_id=annotator_id, status=status, count=count
+                )
+                for (day, project_id, annotator_id, status), count in cells.items()
+            ],
+            batch_size=1000,
+        )
+    return len(cells)
+
+
+def status_summary(rollups, recent_days):
+    """Итоги по статусам за всё время и за последние recent_days дней одним запросом"""
+    since = timezone.localdate() - timedelta(days=recent_days)
+    rows = rollups.values('status').annotate(
+        total=Sum('count'), recent=Sum('count', filter=Q(day__gte=since))
+    ).filter(total__gt=0).order_by('-total')
+    return [{'status': row['status'], 'count': row['total'], 'recent': row['recent'] or 0} for row in rows]
+
+
+def daily_series(rollups, days, by_status=False):
+    """Временной ряд по дням из агрегатов; стоимость зависит от числа дней"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    fields = ['day', 'status'] if by_status else ['day']
+    return list(
+        rollups.filter(day__gte=since).values(*fields).annotate(count=Sum('count')).order_by(*fields)
+    )
@@ -0,0 +1,128 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import fastjsonschema
+
+from .models import AnnotationTemplate
+
+# Сколько скомпилированных схем держать в памяти процесса
+MAX_COMPILED_SCHEMAS = 256
+
+_compiled = OrderedDict()
+_lock = threading.Lock()
+
+
+class SchemaError(Exception):
+    """Некорректная схема шаблона или данные аннотации, не прошедшие проверку"""
+
+    def __init__(self, message, status=400, path=None):
+        super().__init__(message)
+        self.status = status
+        self.path = path
+
+
+def parse_schema(raw):
+    """Разбирает и компилирует JSON Schema из строки или словаря; возвращает словарь схемы"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw or '{}')
+        except ValueError as exc:
+            raise SchemaError(f'Schema is not valid JSON: {exc}')
+    if not isinstance(raw, dict):
+        raise SchemaError('Schema must be a JSON object')
+    _compile(raw)
+    return raw
+
+
+def _reject_remote_ref(uri):
+    raise SchemaError(f'Invalid JSON Schema: only local references (#...) are allowed, got {uri!r}')
+
+
+class _NoRemoteRefs(dict):
+    """Обработчики $ref для любой схемы URI: внешние ссылки запрещены
+
+    Без обработчика fastjsonschema загружает ссылку через urlopen — чтение
+    локальных файлов (file://) и запросы с сервера (http://) по схеме пользователя.
+    """
+
+    def __contains__(self, scheme):
+        return True
+
+    def __getitem__(self, scheme):
+        return _reject_remote_ref
+
+
+def _compile(schema):
+    try:
+        return fastjsonschema.compile(schema, handlers=_NoRemoteRefs())
+    except (fastjsonschema.JsonSchemaException, ValueError, TypeError, AttributeError, LookupError, re.error) as exc:
+        # Схема прислана пользователем: любая ошибка разбора — ошибка схемы, а не 500
+        raise SchemaError(f'Invalid JSON Schema: {exc}')
+
+
+def _validator(template_id, updated_at):
+    """Скомпилированная схема шаблона; ключ с updated_at отбрасывает устаревшие версии"""
+    key = (template_id, updated_at)
+    with _lock:
+        validator = _compiled.get(key)
+        if validator is not None:
+            _compiled.move_to_end(key)
+            return validator
+
+    schema = AnnotationTemplate.objects.filter(pk=template_id).values_list('schema', flat=True).first()
+    if isinstance(schema, str):
+        # Строки старых шаблонов, которые миграция 0008 не смогла разобрать
+        try:
+            schema = json.loads(schema or '{}')
+        except ValueError:
+            raise SchemaError('Project template schema is not valid JSON; fix the template')
+    validator = _compile(schema or {})
+    with _lock:
+        _compiled[key] = validator
+        while len(_compiled) > MAX_COMPILED_SCHEMAS:
+            _compiled.popitem(last=False)
+    return validator
+
+
+def validator_for_project(project):
+    """Функция проверки данных аннотации по активному шаблону проекта или None без шаблона
+
+    Запрос читает только id и updated_at шаблона; схема загружается и компилируется один раз.
+    """
+    template = AnnotationTemplate.objects.filter(
+        project=project, is_active=True
+    ).values_list('pk', 'updated_at').first()
+    if template is None:
+        return None
+    compiled = _validator(*template)
+
+    def validate(data):
+        try:
+            compiled(data)
+        except fastjsonschema.JsonSchemaValueException as exc:
+            raise SchemaError(f'Invalid annotation data: {exc.message}', path=exc.name)
+
+    return validate
+
+
+def validate_annotation_data(project, data):
+    """Проверяет данные одной аннотации по шаблону проекта"""
+    validate = validator_for_project(project)
+    if validate is not None:
+        validate(data)
+
+
+def validation_errors(project, payloads):
+    """Ошибки проверки для пачки данных: {индекс: сообщение}; шаблон загружается один раз"""
+    validate = validator_for_project(project)
+    if validate is None:
+        return {}
+    errors = {}
+    for index, data in enumerate(payloads):
+        try:
+            validate(data)
+        except SchemaError as exc:
+            errors[index] = str(exc)
+    return errors
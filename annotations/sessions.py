@@ -0,0 +1,177 @@
+import atexit
+import threading
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.db.models import Case, DateTimeField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import AnnotationSession
+
+# Клиент шлёт пульс примерно раз в полминуты; паузу длиннее IDLE_GAP не считаем работой
+IDLE_GAP = timedelta(minutes=2)
+# Сессия без активности дольше SESSION_TIMEOUT закрывается при очередной записи
+SESSION_TIMEOUT = timedelta(minutes=30)
+# Как часто накопленное записывается в базу
+FLUSH_INTERVAL = timedelta(minutes=5)
+
+
+class _Activity:
+    """Несохранённая активность одной сессии в памяти процесса"""
+
+    __slots__ = ('annotator_id', 'last_seen', 'seconds', 'files')
+
+    def __init__(self, annotator_id, last_seen):
+        self.annotator_id = annotator_id
+        self.last_seen = last_seen
+        self.seconds = 0.0
+        self.files = 0
+
+
+class SessionTracker:
+    """Буфер пульсов и отправок сессий аннотации
+
+    Пульсы и отправки копятся в памяти процесса и записываются одним UPDATE с F()
+    на все изменившиеся сессии раз в FLUSH_INTERVAL или при закрытии сессии,
+    поэтому несколько процессов могут вести одну сессию, не теряя приращений.
+    Паузы между событиями длиннее IDLE_GAP в время работы не входят.
+    """
+
+    def __init__(self, idle_gap=IDLE_GAP, session_timeout=SESSION_TIMEOUT, flush_interval=FLUSH_INTERVAL):
+        self.idle_gap = idle_gap
+        self.session_timeout = session_timeout
+        self.flush_interval = flush_interval
+        self._activity = {}
+        self._lock = threading.Lock()
+        self._flushed_at = timezone.now()
+
+    def start(self, annotator, project, user_agent='', ip_address=None):
+        """Открывает сессию (одна вставка) и начинает отсчёт времени"""
+        session = AnnotationSession.objects.create(
+            annotator=annotator, project=project, user_agent=user_agent, ip_address=ip_address,
+        )
+        with self._lock:
+            self._activity[session.pk] = _Activity(annotator.pk, session.started_at)
+        return session
+
+    def _touch(self, session_id, annotator_id, now):
+        """Активность сессии с учётом времени с прошлого события; None — чужая или закрытая сессия"""
+        with self._lock:
+            activity = self._activity.get(session_id)
+        if activity is None:
+            # Сессию открыл другой процесс: проверяем её один раз и считаем время с этого события
+            if not AnnotationSession.objects.filter(
+                pk=session_id, annotator_id=annotator_id, ended_at__isnull=True
+            ).exists():
+                return None
+            with self._lock:
+                activity = self._activity.setdefault(session_id, _Activity(annotator_id, now))
+        if activity.annotator_id != annotator_id:
+            return None
+        with self._lock:
+            gap = now - activity.last_seen
+            if timedelta(0) < gap <= self.idle_gap:
+                activity.seconds += gap.total_seconds()
+            activity.last_seen = max(activity.last_seen, now)
+        return activity
+
+    def heartbeat(self, session_id, annotator_id, now=None):
+        """Пульс клиента; возвращает False для чужой или закрытой сессии"""
+        now = now or timezone.now()
+        if self._touch(session_id, annotator_id, now) is None:
+            return False
+        self.flush_if_due(now)
+        return True
+
+    def submitted(self, session_id, annotator_id, files=1, now=None):
+        """Отправка аннотации в сессии: засчитывается файл и активность"""
+        now = now or timezone.now()
+        activity = self._touch(session_id, annotator_id, now)
+        if activity is None:
+            return False
+        with self._lock:
+            activity.files += files
+        self.flush_if_due(now)
+        return True
+
+    def end(self, session_id, annotator_id, now=None):
+        """Закрывает сессию и сразу записывает её остаток"""
+        now = now or timezone.now()
+        if self._touch(session_id, annotator_id, now) is None:
+            return False
+        with self._lock:
+            activity = self._activity.pop(session_id)
+        self._write({session_id: (activity.files, round(activity.seconds / 60), now)})
+        return True
+
+    def flush_if_due(self, now=None):
+        now = now or timezone.now()
+        if now - self._flushed_at >= self.flush_interval:
+            self.flush(now)
+
+    def flush(self, now=None):
+        """Записывает накопленное всех сессий; простаивающие дольше SESSION_TIMEOUT закрываются"""
+        now = now or timezone.now()
+        changes = {}
+        with self._lock:
+            self._flushed_at = now
+            for session_id, activity in list(self._activity.items()):
+                if now - activity.last_seen > self.session_timeout:
+                    # Сессия закончилась последним событием, а не моментом записи
+                    del self._activity[session_id]
+                    changes[session_id] = (activity.files, round(activity.seconds / 60), activity.last_seen)
+                    continue
+                # Неполная минута остаётся в памяти до следующей записи
+                minutes = int(activity.seconds // 60)
+                if activity.files or minutes:
+                    changes[session_id] = (activity.files, minutes, None)
+                    activity.files = 0
+                    activity.seconds -= minutes * 60
+            tracked = list(self._activity)
+        self._write(changes)
+        if tracked:
+            # Сессию мог закрыть другой процесс: дальше её пульсы здесь не принимаются
+            closed = AnnotationSession.objects.filter(pk__in=tracked, ended_at__isnull=False).values_list('pk', flat=True)
+            with self._lock:
+                for session_id in closed:
+                    self._activity.pop(session_id, None)
+        return len(changes)
+
+    def _write(self, changes):
+        """Одно UPDATE с F()-приращениями для {id: (файлы, минуты, ended_at или None)}"""
+        if not changes:
+            return
+
+        def per_session(index):
+            whens = [
+                When(pk=session_id, then=Value(values[index]))
+                for session_id, values in changes.items() if values[index]
+            ]
+            return Case(*whens, default=Value(0), output_field=IntegerField()) if whens else None
+
+        updates = {}
+        files, minutes = per_session(0), per_session(1)
+        if files is not None:
+            updates['files_annotated'] = F('files_annotated') + files
+        if minutes is not None:
+            updates['total_time_minutes'] = F('total_time_minutes') + minutes
+        # Уже закрытая сессия (например, другим процессом) не закрывается повторно
+        ended = [
+            When(pk=session_id, ended_at__isnull=True, then=Value(ended_at))
+            for session_id, (_, _, ended_at) in changes.items() if ended_at is not None
+        ]
+        if ended:
+            updates['ended_at'] = Case(*ended, default=F('ended_at'), output_field=DateTimeField())
+        if updates:
+            AnnotationSession.objects.filter(pk__in=list(changes)).update(**updates)
+
+tracker = SessionTracker()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Остаток буфера не теряется при штатной остановке процесса
+    try:
+        tracker.flush()
+    except DatabaseError:
+        pass
@@ -0,0 +1,84 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from projects.counters import COUNTED_ANNOTATION_STATUSES, annotation_counted, review_score_changed
+from projects.models import Project
+
+from .assignment import release_lease
+from .boxes import BOX_PROJECT_TYPES
+from .eventlog import record_deleted, record_transitions
+from .live import publish_status_changes
+from .models import Annotation, QualityReview
+from .rollups import annotation_transition
+from .spatial import sync_boxes
+
+
+@receiver(post_init, sender=Annotation)
+def remember_annotation_status(sender, instance, **kwargs):
+    # Читаем из __dict__, чтобы отложенное поле не вызывало запрос
+    instance._original_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Annotation)
+def count_annotation_status(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счётчики файла и проекта и дневные агрегаты при смене статуса аннотации"""
+    if raw:
+        return
+    annotation_transition(instance, None if created else instance._original_status, instance.status)
+    changes = [(instance, None if created else instance._original_status)]
+    record_transitions(changes)
+    publish_status_changes(changes)
+    was_counted = not created and instance._original_status in COUNTED_ANNOTATION_STATUSES
+    is_counted = instance.status in COUNTED_ANNOTATION_STATUSES
+    if was_counted != is_counted:
+        annotation_counted(instance.file_id, instance.project_id, 1 if is_counted else -1)
+        if is_counted:
+            # Выполненная задача больше не занимает аренду
+            release_lease(instance.file_id, instance.annotator_id)
+    instance._original_status = instance.status
+
+
+@receiver(post_save, sender=Annotation)
+def sync_annotation_boxes(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Держит хранилище рамок в согласии с annotation_data в проектах детекции"""
+    if raw or (update_fields is not None and 'annotation_data' not in update_fields):
+        return
+    if instance.project.project_type in BOX_PROJECT_TYPES:
+        sync_boxes([instance])
+
+
+@receiver(post_delete, sender=Annotation)
+def uncount_annotation(sender, instance, **kwargs):
+    annotation_transition(instance, instance._original_status, None)
+    record_deleted(instance, instance._original_status)
+    if instance._original_status in COUNTED_ANNOTATION_STATUSES:
+        annotation_counted(instance.file_id, instance.project_id, -1)
+
+
+@receiver(post_init, sender=QualityReview)
+def remember_review_score(sender, instance, **kwargs):
+    instance._original_score = instance.__dict__.get('overall_score')
+
+
+@receiver(post_save, sender=QualityReview)
+def update_project_quality(sender, instance, created, raw=False, **kwargs):
+    """Поддерживает среднюю оценку качества проекта"""
+    if raw:
+        return
+    old_score = None if created else instance._original_score
+    if created or old_score != instance.overall_score:
+        review_score_changed(
+            Project.objects.filter(annotations__id=instance.annotation_id),
+            old_score,
+            instance.overall_score,
+        )
+    instance._original_score = instance.overall_score
+
+
+@receiver(post_delete, sender=QualityReview)
+def remove_project_quality(sender, instance, **kwargs):
+    review_score_changed(
+        Project.objects.filter(annotations__id=instance.annotation_id),
+        instance._original_score,
+        None,
+    )
@@ -0,0 +1,157 @@
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+from .boxes import BOX_PROJECT_TYPES, extract_boxes
+from .models import Annotation, Box, BoxBuffer
+
+RTREE_TABLE = 'annotations_box_rtree'
+PG_INDEX = 'annotations_box_gist'
+REBUILD_BATCH_SIZE = 2000
+WRITE_BATCH_SIZE = 1000
+
+
+def install(schema_editor):
+    """Создаёт пространственный индекс рамок: R-дерево SQLite с триггерами или GiST в PostgreSQL"""
+    table = Box._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, x1, x2, y1, y2)')
+        # Триггеры держат R-дерево в согласии с таблицей при любых вставках и удалениях, включая массовые
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_insert AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {RTREE_TABLE} VALUES (new.id, new.x1, new.x2, new.y1, new.y2); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_update AFTER UPDATE OF x1, y1, x2, y2 ON {table} BEGIN '
+            f'INSERT OR REPLACE INTO {RTREE_TABLE} VALUES (new.id, new.x1, new.x2, new.y1, new.y2); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_delete AFTER DELETE ON {table} BEGIN '
+            f'DELETE FROM {RTREE_TABLE} WHERE id = old.id; END'
+        )
+        schema_editor.execute(
+            f'INSERT OR REPLACE INTO {RTREE_TABLE} SELECT id, x1, x2, y1, y2 FROM {table}'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {table} USING gist (box(point(x1, y1), point(x2, y2)))'
+        )
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for trigger in ('insert', 'update', 'delete'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {RTREE_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {RTREE_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+def pack_boxes(boxes):
+    """Метки и упакованный float32-буфер (x1, y1, x2, y2) для рамок из extract_boxes"""
+    coordinates = np.array(
+        [(x, y, x + width, y + height) for _, x, y, width, height in boxes], dtype=np.float32
+    ).reshape(-1, 4)
+    return [label for label, *_ in boxes], coordinates.tobytes()
+
+
+def unpack_boxes(buffer):
+    """Массив рамок (n, 4) float32 без копирования буфера"""
+    return np.frombuffer(bytes(buffer), dtype=np.float32).reshape(-1, 4)
+
+
+def sync_boxes(annotations):
+    """Перестраивает буферы и строки рамок для аннотаций проектов детекции"""
+    annotations = list(annotations)
+    if not annotations:
+        return 0
+    buffers, boxes = [], []
+    for annotation in annotations:
+        labels, packed = pack_boxes(extract_boxes(annotation.annotation_data))
+        buffers.append(BoxBuffer(
+            annotation_id=annotation.pk, project_id=annotation.project_id,
+            labels=labels, coordinates=packed, count=len(labels),
+        ))
+        for position, (label, (x1, y1, x2, y2)) in enumerate(zip(labels, unpack_boxes(packed).tolist())):
+            # Строки берут координаты из буфера, чтобы запросы и буфер давали одинаковые значения
+            boxes.append(Box(
+                annotation_id=annotation.pk, project_id=annotation.project_id, position=position,
+                label=label, x1=x1, y1=y1, x2=x2, y2=y2, area=(x2 - x1) * (y2 - y1),
+            ))
+    with transaction.atomic():
+        Box.objects.filter(annotation_id__in=[annotation.pk for annotation in annotations]).delete()
+        BoxBuffer.objects.bulk_create(
+            buffers, batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True, unique_fields=['annotation'],
+            update_fields=['project', 'labels', 'coordinates', 'count'],
+        )
+        Box.objects.bulk_create(boxes, batch_size=WRITE_BATCH_SIZE)
+    return len(boxes)
+
+
+def rebuild_boxes(project=None, batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """Заполняет хранилище рамок из annotation_data пачками по первичному ключу"""
+    annotations = Annotation.objects.filter(project__project_type__in=BOX_PROJECT_TYPES)
+    if project is not None:
+        annotations = annotations.filter(project=project)
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            annotations.filter(pk__gt=last_pk).order_by('pk').only('pk', 'project_id', 'annotation_data')[:batch_size]
+        )
+        if not batch:
+            break
+        total += sync_boxes(batch)
+        last_pk = batch[-1].pk
+        if progress:
+            progress(len(batch))
+    return total
+
+
+def in_region(x1, y1, x2, y2, contained=False):
+    """Условие на рамки, пересекающие область (или целиком лежащие в ней, contained)
+
+    Кандидаты выбираются пространственным индексом, точные границы проверяются по колонкам.
+    """
+    if contained:
+        exact = Q(x1__gte=x1, y1__gte=y1, x2__lte=x2, y2__lte=y2)
+    else:
+        exact = Q(x1__lte=x2, x2__gte=x1, y1__lte=y2, y2__gte=y1)
+    if connection.vendor == 'sqlite':
+        if contained:
+            where, params = 'x1 >= %s AND y1 >= %s AND x2 <= %s AND y2 <= %s', [x1, y1, x2, y2]
+        else:
+            where, params = 'x1 <= %s AND x2 >= %s AND y1 <= %s AND y2 >= %s', [x2, x1, y2, y1]
+        # R-дерево хранит float32 с округлением наружу, поэтому точная проверка остаётся
+        return exact & Q(pk__in=RawSQL(f'SELECT id FROM {RTREE_TABLE} WHERE {where}', params))
+    if connection.vendor == 'postgresql':
+        operator = '<@' if contained else '&&'
+        return exact & Q(pk__in=RawSQL(
+            f'SELECT id FROM {Box._meta.db_table} '
+            f'WHERE box(point(x1, y1), point(x2, y2)) {operator} box(point(%s, %s), point(%s, %s))',
+            [x1, y1, x2, y2],
+        ))
+    return exact
+
+
+def box_query(project, label=None, min_area=None, max_area=None, min_size=None, region=None, contained=False):
+    """Рамки проекта по метке, площади, минимальной стороне и области (x1, y1, x2, y2)"""
+    boxes = Box.objects.filter(project=project)
+    if label is not None:
+        boxes = boxes.filter(label=label)
+    if min_area is not None:
+        boxes = boxes.filter(area__gte=min_area)
+    if max_area is not None:
+        boxes = boxes.filter(area__lte=max_area)
+    if min_size is not None:
+        # Обе стороны не меньше min_size; площадь отсекает заведомо мелкие рамки по индексу
+        boxes = boxes.filter(area__gte=min_size * min_size).alias(
+            width=F('x2') - F('x1'), height=F('y2') - F('y1')
+        ).filter(width__gte=min_size, height__gte=min_size)
+    if region is not None:
+        boxes = boxes.filter(in_region(*region, contained=contained))
+    return boxes
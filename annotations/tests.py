@@ -1,3 +1,1013 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fastjsonschema
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from core.tests import QueryPlanTestCase, query_plan
+from projects.counters import COUNTED_ANNOTATION_STATUSES
+from projects.models import Project, ProjectFile, ProjectSettings
+
+from . import assignment, schemas, views
+from .agreement import (
+    box_pair_agreement, cohen_kappa_pairs, compute_project_agreement, fleiss_kappa, krippendorff_alpha,
+    label_counts,
+)
+from .assignment import lease_next_task, reclaim_expired_leases, release_lease, release_leases
+from .bulk import import_annotations, iter_jsonl
+from .consensus import compute_consensus, dawid_skene, majority_vote
+from .eventlog import DailyRollups, Leaderboard, ReviewLatency, ensure_partitions, rebuild_rollups_from_events, replay
+from .models import (
+    Annotation, AnnotationDailyRollup, AnnotationEvent, AnnotationRevision, AnnotationSession, AnnotationTemplate, AnnotatorAgreement, AnnotatorReliability, Box,
+    BoxBuffer, FileAgreement, FileConsensus, QualityReview, TaskLease,
+)
+from .review import ReviewError, auto_review, review_annotations
+from .revisions import SNAPSHOT_INTERVAL, PatchError, apply_patch, diff, get_revision, record_revision
+from .rollups import rebuild_rollups
+from .schemas import SchemaError, parse_schema, validate_annotation_data, validation_errors
+from .sessions import SessionTracker
+from .spatial import RTREE_TABLE, box_query, unpack_boxes
+
+
+class AnnotationViewQueryTests(QueryPlanTestCase):
+
+    def test_annotation_list(self):
+        self.assertViewQueries(4, views.annotation_list, self.annotator)
+
+    def test_annotation_list_filtered(self):
+        self.assertViewQueries(
+            4, views.annotation_list, self.annotator, status='submitted', project=str(self.project.pk),
+        )
+
+    def test_annotation_list_search(self):
+        self.assertViewQueries(4, views.annotation_list, self.annotator, search='note 1')
+
+    def test_quality_review(self):
+        self.assertViewQueries(3, views.quality_review, self.owner, project=str(self.project.pk))
+
+    def test_session_list(self):
+        self.assertViewQueries(3, views.session_list, self.annotator)
+
+
+class DailyRollupTests(QueryPlanTestCase):
+
+    def rollup_cells(self):
+        return set(
+            AnnotationDailyRollup.objects.filter(count__gt=0).values_list(
+                'day', 'project_id', 'annotator_id', 'status', 'count'
+            )
+        )
+
+    def test_transitions_match_rebuild(self):
+        annotation = Annotation.objects.filter(annotator=self.annotator, status='submitted').first()
+        annotation.status = 'approved'
+        annotation.save()
+        Annotation.objects.filter(annotator=self.annotator, status='draft').first().delete()
+        new_file = ProjectFile.objects.filter(project=self.project).exclude(annotations__annotator=self.owner).first()
+        Annotation.objects.create(
+            project=self.project, file=new_file, annotator=self.owner, annotation_data={}, status='submitted',
+        )
+
+        incremental = self.rollup_cells()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollup_cells())
+
+    def test_rebuild_single_project(self):
+        other = self.projects[1]
+        expected = self.rollup_cells()
+        AnnotationDailyRollup.objects.filter(project=other).update(count=0)
+        rebuild_rollups(other, batch_size=100)
+        self.assertEqual(expected, self.rollup_cells())
+
+
+class LeaseCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [User.objects.create_user(f'annotator{i}', password='password') for i in range(2)]
+        cls.project = Project.objects.create(
+            name='Leases', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        cls.files = [
+            ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.leases = [lease_next_task(self.project, annotator) for annotator in self.annotators]
+        TaskLease.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def lease_counts(self):
+        return sum(ProjectFile.objects.filter(project=self.project).values_list('lease_count', flat=True))
+
+    def test_double_reclaim(self):
+        self.assertEqual(self.lease_counts(), 2)
+        self.assertEqual(reclaim_expired_leases(self.project), 2)
+        self.assertEqual(reclaim_expired_leases(self.project), 0)
+        self.assertEqual(self.lease_counts(), 0)
+
+    def test_reclaim_racing_release(self):
+        delete_leases = assignment._delete_leases
+
+        def racing(pks):
+            # Между выборкой и удалением аренду снимает другой запрос
+            lease = self.leases[0]
+            release_lease(lease.file_id, lease.user_id)
+            return delete_leases(pks)
+
+        with mock.patch.object(assignment, '_delete_leases', racing):
+            self.assertEqual(reclaim_expired_leases(self.project), 1)
+        self.assertEqual(self.lease_counts(), 0)
+        self.assertFalse(TaskLease.objects.exists())
+
+    def test_batch_release_racing_reclaim(self):
+        delete_leases = assignment._delete_leases
+
+        def racing(pks):
+            # Между выборкой и удалением те же аренды забирает параллельный reclaim
+            assignment._release_files(delete_leases(pks))
+            return delete_leases(pks)
+
+        lease = self.leases[0]
+        with mock.patch.object(assignment, '_delete_leases', racing):
+            self.assertEqual(release_leases(lease.user_id, [lease.file_id]), 0)
+        self.assertEqual(self.lease_counts(), 1)
+
+
+class BulkReviewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotator = User.objects.create_user('annotator', password='password')
+        cls.project = Project.objects.create(
+            name='Review', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        ProjectSettings.objects.create(project=cls.project, auto_approve_threshold=0.9, quality_threshold=0.5)
+        cls.annotations = []
+        for i, score in enumerate([0.95, 0.7, 0.2]):
+            project_file = ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            cls.annotations.append(Annotation.objects.create(
+                project=cls.project, file=project_file, annotator=cls.annotator,
+                annotation_data={}, status='submitted', quality_score=score,
+            ))
+
+    def assertCountersConsistent(self):
+        self.project.refresh_from_db()
+        counted = Annotation.objects.filter(project=self.project, status__in=COUNTED_ANNOTATION_STATUSES)
+        self.assertEqual(self.project.annotated_files, counted.values('file').distinct().count())
+        reviews = QualityReview.objects.filter(annotation__project=self.project)
+        self.assertEqual(self.project.quality_review_count, reviews.count())
+        self.assertAlmostEqual(
+            self.project.quality_score_total, sum(reviews.values_list('overall_score', flat=True))
+        )
+        cells = set(AnnotationDailyRollup.objects.filter(count__gt=0).values_list('status', 'count'))
+        rebuild_rollups()
+        self.assertEqual(cells, set(AnnotationDailyRollup.objects.filter(count__gt=0).values_list('status', 'count')))
+
+    def test_review_annotations(self):
+        ids = [annotation.pk for annotation in self.annotations]
+        scores = {'accuracy_score': 0.9, 'completeness_score': 0.6, 'consistency_score': 0.9}
+        reviewed, skipped = review_annotations(self.owner, ids[:2], 'approve', scores)
+        self.assertEqual((reviewed, skipped), (set(ids[:2]), []))
+        review_annotations(self.owner, ids[2:], 'reject')
+
+        statuses = dict(Annotation.objects.filter(pk__in=ids).values_list('pk', 'status'))
+        self.assertEqual(statuses, {ids[0]: 'approved', ids[1]: 'approved', ids[2]: 'rejected'})
+        self.assertAlmostEqual(Annotation.objects.get(pk=ids[0]).quality_score, 0.8)
+        self.assertCountersConsistent()
+
+    def test_rereview_releases_leases_in_batch(self):
+        ids = [annotation.pk for annotation in self.annotations]
+        # Отправленные на ручной обзор снова попадают в счётчики при утверждении
+        for annotation in Annotation.objects.filter(pk__in=ids):
+            annotation.status = 'needs_review'
+            annotation.save()
+        expires_at = timezone.now() + timedelta(minutes=30)
+        for annotation in self.annotations:
+            TaskLease.objects.create(
+                project=self.project, file=annotation.file, user=self.annotator, expires_at=expires_at,
+            )
+        ProjectFile.objects.filter(project=self.project).update(lease_count=1)
+
+        with mock.patch('annotations.review.release_leases', wraps=assignment.release_leases) as release:
+            review_annotations(self.owner, ids, 'approve')
+        release.assert_called_once()
+        self.assertFalse(TaskLease.objects.exists())
+        self.assertEqual(set(ProjectFile.objects.filter(project=self.project).values_list('lease_count', flat=True)), {0})
+        self.assertCountersConsistent()
+
+    def test_only_owner_can_review(self):
+        ids = [annotation.pk for annotation in self.annotations]
+        reviewed, skipped = review_annotations(self.annotator, ids, 'approve')
+        self.assertEqual((reviewed, skipped), (set(), sorted(ids)))
+        self.assertFalse(QualityReview.objects.exists())
+
+    def test_invalid_request(self):
+        with self.assertRaises(ReviewError):
+            review_annotations(self.owner, [self.annotations[0].pk], 'maybe')
+        with self.assertRaises(ReviewError):
+            review_annotations(self.owner, [self.annotations[0].pk], 'approve', {'accuracy_score': 2})
+
+    def test_auto_review(self):
+        self.assertEqual(auto_review(self.project), (1, 1))
+        statuses = [Annotation.objects.get(pk=annotation.pk).status for annotation in self.annotations]
+        self.assertEqual(statuses, ['approved', 'submitted', 'needs_review'])
+        self.assertEqual(
+            set(QualityReview.objects.values_list('review_type', 'is_approved')),
+            {('automatic', True), ('automatic', False)},
+        )
+        self.assertCountersConsistent()
+        # Повторный проход ничего не меняет
+        self.assertEqual(auto_review(self.project), (0, 0))
+
+
+class AgreementMetricTests(TestCase):
+
+    def test_fleiss_kappa(self):
+        # Пример из статьи Флейса: 10 элементов, 14 оценщиков, 5 категорий
+        counts = np.array([
+            [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+            [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+        ])
+        self.assertAlmostEqual(fleiss_kappa(counts), 0.210, places=3)
+
+    def test_krippendorff_alpha(self):
+        # Пример Криппендорфа: 4 кодировщика, 12 единиц, пропуски
+        coders = [
+            [1, 2, 3, 3, 2, 1, 4, 1, 2, None, None, None],
+            [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, None, 3],
+            [None, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, None],
+            [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, None],
+        ]
+        counts = np.zeros((12, 6), dtype=np.int64)
+        for values in coders:
+            for unit, value in enumerate(values):
+                if value is not None:
+                    counts[unit, value] += 1
+        self.assertAlmostEqual(krippendorff_alpha(counts), 0.743, places=3)
+
+    def test_cohen_kappa(self):
+        labels_a = np.array([1] * 25 + [0] * 25)
+        labels_b = np.array([1] * 20 + [0] * 5 + [1] * 10 + [0] * 15)
+        shared, observed, kappa = cohen_kappa_pairs(np.zeros(50, dtype=np.int64), labels_a, labels_b, 1, 2)
+        self.assertEqual(list(shared), [50])
+        self.assertAlmostEqual(observed[0], 0.7)
+        self.assertAlmostEqual(kappa[0], 0.4)
+
+    def test_box_matching(self):
+        boxes = np.array([[0, 0, 10, 10], [20, 20, 30, 30], [0, 0, 10, 10], [21, 21, 31, 31]], dtype=float)
+        labels = np.array([0, 1, 0, 1])
+        scores = box_pair_agreement(
+            np.array([0, 2, 4]), np.array([2, 2, 0]), boxes, labels, np.array([0, 0, 2]), np.array([1, 2, 2]),
+        )
+        # Точное совпадение и IoU 81/119; рамки против пустой аннотации; две пустые аннотации
+        self.assertAlmostEqual(scores[0], (1 + 81 / 119) / 2)
+        self.assertEqual(list(scores[1:]), [0.0, 1.0])
+
+
+class ProjectAgreementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [User.objects.create_user(f'annotator{i}', password='password') for i in range(3)]
+        cls.project = Project.objects.create(
+            name='Agreement', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        labels = [('cat', 'cat', 'cat'), ('cat', 'dog', 'dog'), ('dog', 'dog', None)]
+        for i, file_labels in enumerate(labels):
+            project_file = ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            for annotator, label in zip(cls.annotators, file_labels):
+                if label:
+                    Annotation.objects.create(
+                        project=cls.project, file=project_file, annotator=annotator,
+                        annotation_data={'label': label}, status='submitted',
+                    )
+        cls.files = list(ProjectFile.objects.filter(project=cls.project).order_by('pk'))
+
+    def test_compute_project_agreement(self):
+        result = compute_project_agreement(self.project)
+        self.assertEqual((result['files'], result['annotator_pairs']), (3, 3))
+        per_file = dict(FileAgreement.objects.values_list('file_id', 'agreement'))
+        self.assertEqual([per_file[f.pk] for f in self.files], [1.0, 1 / 3, 1.0])
+
+        first, second, third = (annotator.pk for annotator in self.annotators)
+        pairs = {
+            (row.annotator_a_id, row.annotator_b_id): row
+            for row in AnnotatorAgreement.objects.filter(project=self.project)
+        }
+        self.assertEqual(pairs[first, second].shared_files, 3)
+        self.assertAlmostEqual(pairs[first, second].observed_agreement, 2 / 3)
+        self.assertEqual(pairs[second, third].observed_agreement, 1.0)
+
+        # Повторный расчёт обновляет строки и удаляет устаревшие
+        Annotation.objects.filter(annotator=self.annotators[2]).delete()
+        result = compute_project_agreement(self.project)
+        self.assertEqual(result['annotator_pairs'], 1)
+        self.assertEqual(AnnotatorAgreement.objects.count(), 1)
+
+    def test_review_uses_consistency(self):
+        compute_project_agreement(self.project)
+        annotation = Annotation.objects.get(file=self.files[1], annotator=self.annotators[0])
+        review_annotations(self.owner, [annotation.pk], 'approve')
+        review = QualityReview.objects.get(annotation=annotation)
+        # Каппа 0.4 на трёх общих файлах с аннотатором 1 и 0 на двух с аннотатором 2
+        self.assertAlmostEqual(review.consistency_score, 0.24)
+
+
+class ConsensusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [User.objects.create_user(f'annotator{i}', password='password') for i in range(3)]
+        cls.project = Project.objects.create(
+            name='Consensus', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        labels = [
+            ('cat', 'cat', 'dog'), ('dog', 'dog', 'dog'), ('cat', 'dog', 'cat'),
+            ('dog', 'cat', 'dog'), ('cat', 'cat', 'cat'), ('dog', 'dog', 'cat'),
+        ]
+        cls.files = []
+        for i, file_labels in enumerate(labels):
+            project_file = ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            cls.files.append(project_file)
+            for annotator, label in zip(cls.annotators, file_labels):
+                Annotation.objects.create(
+                    project=cls.project, file=project_file, annotator=annotator,
+                    annotation_data={'label': label}, status='submitted',
+                )
+
+    def test_dawid_skene_outweighs_unreliable_majority(self):
+        rng = np.random.default_rng(0)
+        n_items = 500
+        truth = rng.integers(0, 2, n_items)
+        # Два надёжных аннотатора и три почти угадывающих
+        accuracy = np.array([0.95, 0.95, 0.6, 0.6, 0.6])
+        votes = np.where(rng.random((n_items, 5)) < accuracy, truth[:, None], 1 - truth[:, None])
+        items = np.repeat(np.arange(n_items), 5)
+        raters = np.tile(np.arange(5), n_items)
+        codes = votes.ravel()
+
+        posteriors, confusion, _ = dawid_skene(items, raters, codes, n_items, 5, 2)
+        winners, _ = majority_vote(label_counts(items, codes, n_items, 2))
+        self.assertGreater((posteriors.argmax(axis=1) == truth).mean(), (winners == truth).mean())
+        self.assertGreater(confusion[0].diagonal().min(), 0.9)
+        self.assertLess(confusion[2].diagonal().max(), 0.7)
+
+    def test_full_then_incremental(self):
+        result = compute_consensus(self.project)
+        self.assertEqual(result, {'files': 6, 'removed': 0, 'full': True})
+        consensus = {row.file_id: row for row in FileConsensus.objects.all()}
+        self.assertEqual(consensus[self.files[0].pk].majority_label, 'cat')
+        self.assertAlmostEqual(consensus[self.files[0].pk].majority_share, 2 / 3)
+        self.assertEqual(AnnotatorReliability.objects.filter(project=self.project).count(), 3)
+
+        # Без изменений ничего не пересчитывается
+        self.assertEqual(compute_consensus(self.project), {'files': 0, 'removed': 0, 'full': False})
+
+        annotation = Annotation.objects.get(file=self.files[1], annotator=self.annotators[0])
+        annotation.annotation_data = {'label': 'cat'}
+        annotation.save()
+        Annotation.objects.filter(file=self.files[5]).delete()
+        self.assertEqual(compute_consensus(self.project), {'files': 1, 'removed': 1, 'full': False})
+        updated = FileConsensus.objects.get(file=self.files[1])
+        self.assertEqual((updated.annotation_count, updated.majority_label), (3, 'dog'))
+        self.assertGreater(updated.computed_at, consensus[self.files[1].pk].computed_at)
+        self.assertEqual(
+            FileConsensus.objects.get(file=self.files[2]).computed_at, consensus[self.files[2].pk].computed_at
+        )
+        self.assertFalse(FileConsensus.objects.filter(file=self.files[5]).exists())
+
+    def test_new_label_forces_full_recompute(self):
+        compute_consensus(self.project)
+        annotation = Annotation.objects.get(file=self.files[0], annotator=self.annotators[2])
+        annotation.annotation_data = {'label': 'bird'}
+        annotation.save()
+        self.assertTrue(compute_consensus(self.project)['full'])
+        reliability = AnnotatorReliability.objects.get(project=self.project, annotator=self.annotators[0])
+        self.assertEqual(set(reliability.confusion), {'bird', 'cat', 'dog'})
+
+
+class SchemaValidationTests(TestCase):
+
+    SCHEMA = {
+        'type': 'object',
+        'required': ['label'],
+        'properties': {
+            'label': {'type': 'string', 'enum': ['cat', 'dog']},
+            'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+        },
+    }
+
+    def setUp(self):
+        schemas._compiled.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.project = Project.objects.create(
+            name='Schema', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        cls.template = AnnotationTemplate.objects.create(
+            project=cls.project, name='Labels', schema=cls.SCHEMA, is_default=True,
+        )
+
+    def test_validate(self):
+        validate_annotation_data(self.project, {'label': 'cat', 'confidence': 0.5})
+        with self.assertRaises(SchemaError) as context:
+            validate_annotation_data(self.project, {'label': 'bird'})
+        self.assertEqual(context.exception.path, 'data.label')
+        self.assertEqual(
+            set(validation_errors(self.project, [{'label': 'dog'}, {}, {'label': 'cat', 'confidence': 2}])),
+            {1, 2},
+        )
+
+    def test_compiled_once_per_template_version(self):
+        with mock.patch('annotations.schemas.fastjsonschema.compile', wraps=fastjsonschema.compile) as compile:
+            validate_annotation_data(self.project, {'label': 'cat'})
+            for _ in range(3):
+                # Только id и updated_at шаблона, без повторной загрузки и разбора схемы
+                with self.assertNumQueries(1):
+                    validate_annotation_data(self.project, {'label': 'cat'})
+            self.assertEqual(compile.call_count, 1)
+
+            # Новая версия шаблона компилируется заново
+            self.template.schema = {'type': 'object', 'required': ['objects']}
+            self.template.save()
+            with self.assertRaises(SchemaError):
+                validate_annotation_data(self.project, {'label': 'cat'})
+            self.assertEqual(compile.call_count, 2)
+
+    def test_project_without_template(self):
+        other = Project.objects.create(name='Free', owner=self.owner, project_type='image_classification')
+        validate_annotation_data(other, {'anything': True})
+
+    def test_legacy_invalid_schema_string(self):
+        # Строка, которую миграция 0008 оставила как есть
+        self.template.schema = '{not json'
+        self.template.save()
+        with self.assertRaises(SchemaError):
+            validate_annotation_data(self.project, {'label': 'cat'})
+
+        project_file = ProjectFile.objects.create(
+            project=self.project, file='files/1.png', filename='1.png', file_type='image', file_size=1,
+        )
+        request = RequestFactory().post(
+            '/', json.dumps([{'file': project_file.pk, 'annotation_data': {'label': 'cat'}}]),
+            content_type='application/json',
+        )
+        request.user = self.owner
+        self.assertEqual(views.bulk_import(request, self.project.pk).status_code, 400)
+
+    def test_parse_schema(self):
+        self.assertEqual(parse_schema('{"type": "object"}'), {'type': 'object'})
+        for raw in ('{not json', '[1, 2]', '{"type": "nonsense"}'):
+            with self.assertRaises(SchemaError):
+                parse_schema(raw)
+
+    def test_remote_refs_rejected(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'secret': 'value'}, f)
+        self.addCleanup(os.remove, f.name)
+        schemas = [
+            {'$ref': f'file://{f.name}#/secret'},
+            {'properties': {'label': {'$ref': 'http://127.0.0.1:9/schema.json'}}},
+            {'$id': 'http://127.0.0.1:9/', 'properties': {'label': {'$ref': 'other.json'}}},
+            {'$ref': 'other.json'},
+        ]
+        with mock.patch('urllib.request.urlopen') as urlopen:
+            for schema in schemas:
+                with self.assertRaises(SchemaError) as ctx:
+                    parse_schema(schema)
+                self.assertNotIn('value', str(ctx.exception))
+        urlopen.assert_not_called()
+        # Локальные ссылки и прочие ошибки разбора
+        parse_schema({'definitions': {'label': {'type': 'string'}}, 'properties': {'label': {'$ref': '#/definitions/label'}}})
+        for schema in ({'$ref': '#/definitions/missing'}, {'$ref': 5}, {'pattern': '('}, {'properties': []}):
+            with self.assertRaises(SchemaError):
+                parse_schema(schema)
+
+
+class BoxStoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [User.objects.create_user(f'annotator{i}', password='password') for i in range(2)]
+        cls.project = Project.objects.create(
+            name='Detection', owner=cls.owner, project_type='object_detection', status='active',
+        )
+        cls.file = ProjectFile.objects.create(
+            project=cls.project, file='files/0.png', filename='0.png', file_type='image', file_size=1,
+        )
+        cls.annotation = Annotation.objects.create(
+            project=cls.project, file=cls.file, annotator=cls.annotators[0], status='submitted',
+            annotation_data={'objects': [
+                {'label': 'car', 'coordinates': {'x': 0, 'y': 0, 'width': 100, 'height': 50}},
+                {'label': 'person', 'bbox': [200, 200, 20, 40]},
+                {'label': 'car', 'bbox': [300, 10, 40, 40]},
+                {'label': 'broken', 'bbox': [1, 2]},
+            ]},
+        )
+
+    def test_store_in_sync(self):
+        buffer = BoxBuffer.objects.get(annotation=self.annotation)
+        self.assertEqual(buffer.labels, ['car', 'person', 'car'])
+        self.assertEqual(unpack_boxes(buffer.coordinates).tolist()[1], [200, 200, 220, 240])
+        self.assertEqual(Box.objects.filter(annotation=self.annotation).count(), 3)
+
+        self.annotation.annotation_data = {'objects': [{'label': 'truck', 'bbox': [5, 5, 10, 10]}]}
+        self.annotation.save()
+        self.assertEqual(list(Box.objects.values_list('label', 'area')), [('truck', 100.0)])
+        self.annotation.delete()
+        self.assertFalse(Box.objects.exists())
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {RTREE_TABLE}')
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_box_query(self):
+        def labels(**filters):
+            return sorted(box_query(self.project, **filters).values_list('label', flat=True))
+
+        self.assertEqual(labels(label='car', min_area=2000), ['car'])
+        self.assertEqual(labels(min_size=32), ['car', 'car'])
+        self.assertEqual(labels(region=(90, 40, 210, 210)), ['car', 'person'])
+        self.assertEqual(labels(region=(190, 190, 400, 400), contained=True), ['person'])
+        self.assertEqual(labels(region=(1000, 1000, 2000, 2000)), [])
+
+    def test_region_query_uses_spatial_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('R-tree index is SQLite-specific')
+        plan = query_plan(str(box_query(self.project, region=(0, 0, 10, 10)).query))
+        self.assertTrue(any(RTREE_TABLE in line and 'VIRTUAL TABLE INDEX' in line for line in plan), plan)
+
+    def test_box_search_view(self):
+        request = RequestFactory().get('/', {'label': 'car', 'limit': '1'})
+        request.user = self.owner
+        data = json.loads(views.box_search(request, self.project.pk).content)
+        self.assertEqual([box['bbox'] for box in data['boxes']], [[0, 0, 100, 50]])
+
+        request = RequestFactory().get('/', {'label': 'car', 'after': str(data['next'])})
+        request.user = self.owner
+        data = json.loads(views.box_search(request, self.project.pk).content)
+        self.assertEqual(([box['bbox'] for box in data['boxes']], data['next']), ([[300, 10, 340, 50]], None))
+
+        request.user = self.annotators[0]
+        self.assertEqual(views.box_search(request, self.project.pk).status_code, 403)
+
+        for limit in ('0', '-1', 'x'):
+            request = RequestFactory().get('/', {'limit': limit})
+            request.user = self.owner
+            self.assertEqual(views.box_search(request, self.project.pk).status_code, 400)
+
+    def test_bulk_import_syncs_boxes(self):
+        rows = [{
+            'file': self.file.pk, 'status': 'submitted',
+            'annotation_data': {'objects': [{'label': 'bike', 'bbox': [10, 10, 30, 30]}]},
+        }]
+        result = import_annotations(self.project, self.annotators[1], enumerate(rows, 1))
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(
+            list(box_query(self.project, label='bike').values_list('annotation__annotator', 'area')),
+            [(self.annotators[1].pk, 900.0)],
+        )
+
+    def test_detection_agreement_reads_buffers(self):
+        Annotation.objects.create(
+            project=self.project, file=self.file, annotator=self.annotators[1], status='submitted',
+            annotation_data={'objects': [{'label': 'car', 'bbox': [0, 0, 100, 50]}]},
+        )
+        result = compute_project_agreement(self.project)
+        self.assertEqual(result['annotator_pairs'], 1)
+        # Одна из трёх и одна из одной рамки совпали точно: 2·1 / 4
+        self.assertAlmostEqual(FileAgreement.objects.get(file=self.file).agreement, 0.5)
+
+
+class BulkImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.model = User.objects.create_user('prelabeler', password='password')
+        cls.project = Project.objects.create(
+            name='Import', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        cls.project.collaborators.add(cls.model)
+        AnnotationTemplate.objects.create(
+            project=cls.project, name='Labels', is_default=True,
+            schema={'type': 'object', 'required': ['label'], 'properties': {'label': {'type': 'string'}}},
+        )
+        cls.files = [
+            ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            for i in range(5)
+        ]
+
+    def assertStateConsistent(self):
+        self.project.refresh_from_db()
+        counted = Annotation.objects.filter(project=self.project, status__in=COUNTED_ANNOTATION_STATUSES)
+        self.assertEqual(self.project.annotated_files, counted.values('file').distinct().count())
+        for project_file in ProjectFile.objects.filter(project=self.project):
+            self.assertEqual(project_file.annotation_count, counted.filter(file=project_file).count())
+        cells = set(AnnotationDailyRollup.objects.filter(count__gt=0).values_list('status', 'count'))
+        rebuild_rollups()
+        self.assertEqual(cells, set(AnnotationDailyRollup.objects.filter(count__gt=0).values_list('status', 'count')))
+
+    def test_import_with_row_errors(self):
+        lines = [
+            json.dumps({'file': self.files[0].pk, 'annotation_data': {'label': 'cat'}, 'quality_score': 0.9}),
+            json.dumps({'filename': '1.png', 'annotation_data': {'label': 'dog'}, 'status': 'submitted'}),
+            '{broken',
+            json.dumps({'file': self.files[2].pk, 'annotation_data': {}, 'status': 'submitted'}),
+            json.dumps({'file': self.files[3].pk, 'annotation_data': {'label': 'cat'}, 'status': 'approved'}),
+            json.dumps({'filename': 'missing.png', 'annotation_data': {'label': 'cat'}}),
+            json.dumps({'file': self.files[0].pk, 'annotation_data': {'label': 'dog'}}),
+        ]
+        result = import_annotations(self.project, self.model, iter_jsonl(lines), batch_size=3)
+        self.assertEqual((result['created'], result['updated']), (2, 0))
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4, 5, 6, 7])
+        self.assertIn('Duplicate', result['errors'][-1]['error'])
+
+        annotation = Annotation.objects.get(file=self.files[1], annotator=self.model)
+        self.assertEqual((annotation.status, annotation.annotation_data), ('submitted', {'label': 'dog'}))
+        self.assertIsNotNone(annotation.submitted_at)
+        self.assertStateConsistent()
+
+    def test_upsert(self):
+        rows = [{'file': project_file.pk, 'annotation_data': {'label': 'cat'}} for project_file in self.files]
+        self.assertEqual(import_annotations(self.project, self.model, enumerate(rows, 1))['created'], 5)
+        reviewed = Annotation.objects.get(file=self.files[4], annotator=self.model)
+        reviewed.status = 'approved'
+        reviewed.save()
+
+        rows = [dict(row, status='submitted', annotation_data={'label': 'dog'}) for row in rows]
+        result = import_annotations(self.project, self.model, enumerate(rows, 1))
+        self.assertEqual((result['created'], result['updated']), (0, 4))
+        self.assertEqual(result['errors'], [{'row': 5, 'error': 'Annotation is already approved'}])
+        self.assertEqual(
+            Annotation.objects.filter(annotator=self.model, annotation_data__label='dog', status='submitted').count(), 4
+        )
+        self.assertStateConsistent()
+
+    def test_view(self):
+        body = '\n'.join(
+            json.dumps({'file': project_file.pk, 'annotation_data': {'label': 'cat'}}) for project_file in self.files
+        )
+        request = RequestFactory().post('/', body, content_type='application/x-ndjson')
+        request.user = self.model
+        response = views.bulk_import(request, self.project.pk)
+        self.assertEqual(json.loads(response.content), {'success': True, 'created': 5, 'updated': 0, 'errors': []})
+
+        request = RequestFactory().post('/', '{"annotations": 1}', content_type='application/json')
+        request.user = self.model
+        self.assertEqual(views.bulk_import(request, self.project.pk).status_code, 400)
+
+    def test_view_json_body_limit(self):
+        rows = [{'file': project_file.pk, 'annotation_data': {'label': 'dog'}} for project_file in self.files]
+        body = json.dumps(rows)
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(body) - 1):
+            request = RequestFactory().post('/', body, content_type='application/json')
+            request.user = self.model
+            response = views.bulk_import(request, self.project.pk)
+            self.assertEqual(response.status_code, 413)
+            self.assertFalse(Annotation.objects.filter(annotator=self.model).exists())
+
+            # Тот же объём в JSONL читается потоком и не ограничен
+            request = RequestFactory().post(
+                '/', '\n'.join(json.dumps(row) for row in rows), content_type='application/jsonl',
+            )
+            request.user = self.model
+            self.assertEqual(json.loads(views.bulk_import(request, self.project.pk).content)['created'], 5)
+
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=len(body)):
+            request = RequestFactory().post('/', body, content_type='application/json')
+            request.user = self.model
+            self.assertEqual(json.loads(views.bulk_import(request, self.project.pk).content)['updated'], 5)
+
+
+class SessionTrackerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotator = User.objects.create_user('annotator', password='password')
+        cls.project = Project.objects.create(name='Sessions', owner=cls.owner, project_type='image_classification')
+        cls.project.collaborators.add(cls.annotator)
+
+    def setUp(self):
+        self.tracker = SessionTracker()
+        self.session = self.tracker.start(self.annotator, self.project)
+        self.start = self.session.started_at
+
+    def at(self, seconds):
+        return self.start + timedelta(seconds=seconds)
+
+    def test_heartbeats_coalesce_into_few_writes(self):
+        user_id = self.annotator.pk
+        # 20 минут работы с пульсом раз в 15 секунд и 40 отправленных файлов: запись раз в пять минут
+        # и проверка, не закрыл ли сессию другой процесс
+        with self.assertNumQueries(8):
+            for second in range(15, 20 * 60 + 1, 15):
+                self.tracker.heartbeat(self.session.pk, user_id, now=self.at(second))
+                if second % 30 == 0:
+                    self.tracker.submitted(self.session.pk, user_id, now=self.at(second))
+        self.assertTrue(self.tracker.end(self.session.pk, user_id, now=self.at(20 * 60 + 10)))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.files_annotated, 40)
+        self.assertEqual(self.session.total_time_minutes, 20)
+        self.assertEqual(self.session.ended_at, self.at(20 * 60 + 10))
+        self.assertFalse(self.tracker.heartbeat(self.session.pk, user_id, now=self.at(20 * 60 + 20)))
+
+    def test_idle_gap_not_counted(self):
+        user_id = self.annotator.pk
+        for second in range(30, 5 * 60 + 1, 30):
+            self.tracker.heartbeat(self.session.pk, user_id, now=self.at(second))
+        # Десять минут без пульса, затем ещё пять минут работы
+        for second in range(15 * 60, 20 * 60 + 1, 30):
+            self.tracker.heartbeat(self.session.pk, user_id, now=self.at(second))
+        self.tracker.end(self.session.pk, user_id, now=self.at(20 * 60))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.total_time_minutes, 10)
+
+    def test_workers_share_session(self):
+        other = SessionTracker()
+        user_id = self.annotator.pk
+        self.tracker.submitted(self.session.pk, user_id, now=self.at(30))
+        self.assertTrue(other.submitted(self.session.pk, user_id, now=self.at(40)))
+        self.assertFalse(other.heartbeat(self.session.pk, self.owner.pk, now=self.at(50)))
+        self.tracker.flush(now=self.at(60))
+        other.flush(now=self.at(60))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.files_annotated, 2)
+        self.assertIsNone(self.session.ended_at)
+
+    def test_session_closed_by_another_worker(self):
+        other = SessionTracker()
+        user_id = self.annotator.pk
+        self.tracker.heartbeat(self.session.pk, user_id, now=self.at(30))
+        self.assertTrue(other.heartbeat(self.session.pk, user_id, now=self.at(40)))
+        self.assertTrue(self.tracker.end(self.session.pk, user_id, now=self.at(60)))
+
+        # Второй процесс ещё держит сессию в памяти, но его запись по таймауту её не переоткрывает
+        self.assertTrue(other.heartbeat(self.session.pk, user_id, now=self.at(70)))
+        other.flush(now=self.at(70 + 31 * 60))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.ended_at, self.at(60))
+
+        other = SessionTracker()
+        session = self.tracker.start(self.annotator, self.project)
+        self.assertTrue(other.heartbeat(session.pk, user_id, now=self.at(30)))
+        self.tracker.end(session.pk, user_id, now=self.at(40))
+        # После очередной записи закрытая сессия больше не принимает пульсы
+        other.flush(now=self.at(50))
+        self.assertFalse(other.heartbeat(session.pk, user_id, now=self.at(60)))
+        session.refresh_from_db()
+        self.assertEqual(session.ended_at, self.at(40))
+
+    def test_abandoned_session_closed_on_flush(self):
+        self.tracker.heartbeat(self.session.pk, self.annotator.pk, now=self.at(60))
+        self.assertEqual(self.tracker.flush(now=self.at(60 + 31 * 60)), 1)
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.total_time_minutes, self.session.ended_at), (1, self.at(60)))
+
+    def test_views(self):
+        request = RequestFactory().post('/')
+        request.user = self.annotator
+        with mock.patch.object(views, 'tracker', self.tracker):
+            response = views.session_start(request, self.project.pk)
+            session_id = json.loads(response.content)['session']
+            for event, status in [('heartbeat', 200), ('submit', 200), ('dance', 400), ('end', 200), ('end', 404)]:
+                request = RequestFactory().post('/', {'event': event})
+                request.user = self.annotator
+                self.assertEqual(views.session_event(request, session_id).status_code, status)
+        session = AnnotationSession.objects.get(pk=session_id)
+        self.assertEqual(session.files_annotated, 1)
+        self.assertIsNotNone(session.ended_at)
+
+
+class EventLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [User.objects.create_user(f'annotator{i}', password='password') for i in range(2)]
+        cls.project = Project.objects.create(
+            name='Events', owner=cls.owner, project_type='image_classification', status='active',
+        )
+        cls.files = [
+            ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        # Три аннотации первого аннотатора и одна второго; все отправлены, затем проверены
+        self.annotations = []
+        for i, project_file in enumerate(self.files):
+            annotation = Annotation.objects.create(
+                project=self.project, file=project_file, annotator=self.annotators[i // 3],
+                annotation_data={'label': 'cat'}, status='draft',
+            )
+            annotation.status = 'submitted'
+            annotation.save()
+            self.annotations.append(annotation)
+        ids = [annotation.pk for annotation in self.annotations]
+        review_annotations(self.owner, ids[:2] + ids[3:], 'approve')
+        review_annotations(self.owner, ids[2:3], 'reject')
+
+    def test_transitions_are_logged(self):
+        annotation = self.annotations[0]
+        events = list(annotation.events.values_list('event_type', 'previous_status', 'status', 'actor_id'))
+        self.assertEqual(events, [
+            (AnnotationEvent.CREATED, '', 'draft', annotation.annotator_id),
+            (AnnotationEvent.STATUS_CHANGED, 'draft', 'submitted', annotation.annotator_id),
+            (AnnotationEvent.STATUS_CHANGED, 'submitted', 'approved', self.owner.pk),
+        ])
+        self.assertIn('quality_score', annotation.events.last().payload)
+
+        annotation = Annotation.objects.get(pk=annotation.pk)
+        annotation.annotator_notes = 'no status change'
+        annotation.save()
+        annotation_id = annotation.pk
+        annotation.delete()
+        self.assertEqual(
+            list(AnnotationEvent.objects.filter(annotation_id=annotation_id).values_list('event_type', flat=True)),
+            [AnnotationEvent.CREATED, AnnotationEvent.STATUS_CHANGED, AnnotationEvent.STATUS_CHANGED,
+             AnnotationEvent.DELETED],
+        )
+        with self.assertRaises(ValueError):
+            AnnotationEvent.objects.first().save()
+
+    def test_replay_rebuilds_rollups(self):
+        Annotation.objects.get(pk=self.annotations[1].pk).delete()
+        live = set(AnnotationDailyRollup.objects.filter(count__gt=0).values_list(
+            'day', 'project_id', 'annotator_id', 'status', 'count'
+        ))
+        AnnotationDailyRollup.objects.all().delete()
+        rebuild_rollups_from_events(self.project)
+        self.assertEqual(live, set(AnnotationDailyRollup.objects.values_list(
+            'day', 'project_id', 'annotator_id', 'status', 'count'
+        )))
+
+    def test_single_pass_metrics(self):
+        with self.assertNumQueries(1):
+            results = replay([DailyRollups(), Leaderboard(), ReviewLatency()], project=self.project)
+        first, second = self.annotators
+        self.assertEqual(
+            [(row['annotator_id'], row['submitted'], row['approved'], row['rejected']) for row in results['leaderboard']],
+            [(first.pk, 3, 2, 1), (second.pk, 1, 1, 0)],
+        )
+        self.assertAlmostEqual(results['leaderboard'][0]['approval_rate'], 2 / 3)
+        self.assertEqual(results['latency']['count'], 4)
+        self.assertEqual(results['latency']['buckets'][0]['count'], 4)
+        self.assertEqual(sum(results['rollups'].values()), 4)
+
+    def test_bulk_import_logged(self):
+        project_file = ProjectFile.objects.create(
+            project=self.project, file='files/import.png', filename='import.png', file_type='image', file_size=1,
+        )
+        rows = [{'file': project_file.pk, 'annotation_data': {'label': 'cat'}, 'status': 'submitted'}]
+        import_annotations(self.project, self.annotators[1], enumerate(rows, 1))
+        event = AnnotationEvent.objects.last()
+        self.assertEqual((event.event_type, event.status, event.actor_id),
+                         (AnnotationEvent.CREATED, 'submitted', self.annotators[1].pk))
+
+    def test_partitioned_table(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Partitioning is PostgreSQL-specific')
+        # Миграция прошла: таблица секционирована, и индексы из Meta созданы ровно один раз на родителе
+        table = AnnotationEvent._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [table])
+            self.assertIsNotNone(cursor.fetchone())
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [table])
+            indexes = {name for name, in cursor.fetchall()}
+        self.assertTrue({index.name for index in AnnotationEvent._meta.indexes} <= indexes)
+        self.assertTrue(ensure_partitions(months_ahead=1))
+
+    def test_partitions_take_over_default_rows(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Partitioning is PostgreSQL-specific')
+        # Горизонт секций пропущен: событие через два года ложится в DEFAULT
+        table = AnnotationEvent._meta.db_table
+        at = timezone.now() + timedelta(days=730)
+        event = AnnotationEvent.objects.create(
+            annotation_id=0, project_id=self.project.pk, annotator_id=self.annotators[0].pk,
+            event_type=AnnotationEvent.CREATED, status='draft', created_at=at,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {table}_default')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        name = f'{table}_{at:%Y%m}'
+        self.assertIn(name, ensure_partitions(months_ahead=0))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {table}_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute(f'SELECT id FROM {name}')
+            self.assertEqual(cursor.fetchall(), [(event.pk,)])
+        self.assertIn(name, ensure_partitions(months_ahead=0))
+
+
+class RevisionHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.annotator = User.objects.create_user('annotator', password='password')
+        cls.project = Project.objects.create(
+            name='Revisions', owner=cls.annotator, project_type='image_classification', status='active',
+        )
+        cls.project_file = ProjectFile.objects.create(
+            project=cls.project, file='files/1.png', filename='1.png', file_type='image', file_size=1,
+        )
+
+    def setUp(self):
+        self.polygon = [[i, i * 2] for i in range(500)]
+        self.annotation = Annotation.objects.create(
+            project=self.project, file=self.project_file, annotator=self.annotator,
+            annotation_data={'label': 'cat', 'polygon': self.polygon},
+        )
+
+    def test_diff_roundtrip(self):
+        source = {'a': 1, 'b': [1, 2, 3, 4], 'c': {'d/e': 'x', 'f~': [True]}, 'g': None}
+        targets = [
+            {'a': 1.0, 'b': [1, 2, 9, 3, 4], 'c': {'d/e': 'y', 'f~': [True, False]}},
+            {'a': 2, 'b': [4], 'c': [], 'g': {'h': 1}},
+            {'b': [], 'c': {'f~': []}, 'g': None, 'new': [1]},
+            [1, 2],
+        ]
+        for target in targets:
+            patch = diff(source, target)
+            self.assertEqual(apply_patch(source, patch), target)
+        self.assertEqual(source['b'], [1, 2, 3, 4])
+        self.assertEqual(diff(source, source), [])
+        # Вставка в середину списка — одна операция
+        self.assertEqual(diff([1, 2, 3], [1, 5, 2, 3]), [{'op': 'add', 'path': '/1', 'value': 5}])
+        with self.assertRaises(PatchError):
+            apply_patch({'a': 1}, [{'op': 'remove', 'path': '/b'}])
+
+    def test_revisions_store_deltas(self):
+        versions = [self.annotation.annotation_data]
+        for i in range(SNAPSHOT_INTERVAL + 5):
+            data = {'label': 'cat', 'polygon': [list(point) for point in versions[-1]['polygon']]}
+            data['polygon'][i] = [-i - 1, -i - 1]
+            self.annotation.annotation_data = data
+            self.annotation.save()
+            record_revision(self.annotation, self.annotator, previous=versions[-1] if i == 0 else None)
+            versions.append(data)
+
+        revisions = list(self.annotation.revisions.values_list('number', 'is_snapshot'))
+        self.assertEqual(len(revisions), len(versions))
+        self.assertEqual([number for number, is_snapshot in revisions if is_snapshot], [0, SNAPSHOT_INTERVAL])
+        # Правка одной вершины хранится одной операцией, а не копией многоугольника
+        delta = AnnotationRevision.objects.get(annotation=self.annotation, number=3)
+        self.assertEqual(delta.data, [{'op': 'replace', 'path': '/polygon/2/0', 'value': -3},
+                                      {'op': 'replace', 'path': '/polygon/2/1', 'value': -3}])
+
+        for number, expected in enumerate(versions):
+            with self.assertNumQueries(1):
+                self.assertEqual(get_revision(self.annotation, number), expected)
+        with self.assertRaises(AnnotationRevision.DoesNotExist):
+            get_revision(self.annotation, len(versions))
+        # Сохранение без изменений данных версию не добавляет
+        self.assertIsNone(record_revision(self.annotation, self.annotator))
+
+    def test_revision_view(self):
+        previous = self.annotation.annotation_data
+        for label in ('dog', 'bird'):
+            self.annotation.annotation_data = {'label': label, 'confidence': 0.5}
+            self.annotation.save()
+            record_revision(self.annotation, self.annotator, previous=previous)
+        self.assertEqual(self.annotation.revisions.count(), 3)
+
+        def fetch(number, user=self.annotator):
+            request = RequestFactory().get('/')
+            request.user = user
+            return views.annotation_revision(request, self.annotation.pk, number)
+
+        self.assertEqual(json.loads(fetch(0).content)['annotation_data'], {'label': 'cat', 'polygon': self.polygon})
+        data = json.loads(fetch(2).content)
+        self.assertEqual((data['annotation_data'], data['latest']), ({'label': 'bird', 'confidence': 0.5}, 2))
+        self.assertEqual(fetch(3).status_code, 404)
+        self.assertEqual(fetch(0, User.objects.create_user('stranger')).status_code, 403)
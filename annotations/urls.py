@@ -8,11 +8,20 @@ urlpatterns = [
     path('create/', views.annotation_create, name='annotation_create'),
     path('<int:pk>/', views.annotation_detail, name='annotation_detail'),
     path('<int:pk>/edit/', views.annotation_edit, name='annotation_edit'),
+    path('<int:pk>/revisions/<int:number>/', views.annotation_revision, name='annotation_revision'),
     path('<int:pk>/delete/', views.annotation_delete, name='annotation_delete'),
+    path('<int:pk>/skip/', views.release_task, name='release_task'),
+    path('next/<int:project_pk>/', views.next_task, name='next_task'),
+    path('import/<int:project_pk>/', views.bulk_import, name='bulk_import'),
     path('review/', views.quality_review, name='quality_review'),
+    path('review/bulk/', views.bulk_review, name='bulk_review'),
+    path('review/auto/<int:project_pk>/', views.auto_review_project, name='auto_review_project'),
+    path('boxes/<int:project_pk>/', views.box_search, name='box_search'),
     path('templates/', views.template_list, name='template_list'),
     path('templates/create/', views.template_create, name='template_create'),
     path('labels/', views.label_list, name='label_list'),
     path('labels/create/', views.label_create, name='label_create'),
     path('sessions/', views.session_list, name='session_list'),
+    path('sessions/start/<int:project_pk>/', views.session_start, name='session_start'),
+    path('sessions/<int:pk>/event/', views.session_event, name='session_event'),
 ]
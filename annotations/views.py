@@ -1,11 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Annotation, AnnotationTemplate, QualityReview, AnnotationLabel, AnnotationSession
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from .models import Annotation, AnnotationTemplate, QualityReview, AnnotationLabel, AnnotationSession, AnnotationRevision
+from core.pagination import estimate_count, paginate
+from core.search import matching
+from projects.access import can_edit, can_view, visible_projects
+from .assignment import lease_next_task, release_lease
+from .bulk import import_annotations, iter_jsonl
+from .revisions import get_revision, record_revision
+from .review import SCORE_FIELDS, ReviewError, auto_review, review_annotations
+from .schemas import SchemaError, parse_schema, validate_annotation_data
+from .sessions import tracker
+from .spatial import box_query
 from projects.models import Project, ProjectFile
 from django.utils import timezone
+import json
 
 @login_required
 def annotation_list(request):
@@ -28,19 +41,15 @@ def annotation_list(request):
     search_query = request.GET.get('search')
     if search_query:
         annotations = annotations.filter(
-            Q(file__filename__icontains=search_query) |
-            Q(annotator_notes__icontains=search_query)
+            matching('file', search_query, field='file_id') |
+            matching('annotation', search_query)
         )
     
-    # Пагинация
-    paginator = Paginator(annotations, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Пагинация по ключу (created_at, id)
+    page_obj = paginate(request, annotations, ['-created_at', '-id'], 20)
     
     # Проекты для фильтра
-    user_projects = Project.objects.filter(
-        Q(owner=user) | Q(collaborators=user)
-    )
+    user_projects = visible_projects(user)
     
     context = {
         'page_obj': page_obj,
@@ -48,7 +57,7 @@ def annotation_list(request):
         'project_filter': project_filter,
         'search_query': search_query,
         'user_projects': user_projects,
-        'total_annotations': annotations.count(),
+        'total_annotations': estimate_count(annotations),
     }
     
     return render(request, 'annotations/annotation_list.html', context)
@@ -57,9 +66,7 @@ def annotation_list(request):
 def annotation_create(request):
     """Создание новой аннотации"""
     # Получаем доступные файлы для аннотации
-    user_projects = Project.objects.filter(
-        Q(owner=request.user) | Q(collaborators=request.user)
-    ).filter(status='active')
+    user_projects = visible_projects(request.user).filter(status='active')
     
     if request.method == 'POST':
         project_id = request.POST.get('project')
@@ -67,6 +74,9 @@ def annotation_create(request):
         
         if project_id and file_id:
             project = get_object_or_404(Project, id=project_id)
+            if not can_view(request.user, project):
+                messages.error(request, 'You do not have permission to annotate this project.')
+                return redirect('annotations:annotation_list')
             project_file = get_object_or_404(ProjectFile, id=file_id, project=project)
             
             # Проверяем, не аннотировал ли уже пользователь этот файл
@@ -99,6 +109,40 @@ def annotation_create(request):
     
     return render(request, 'annotations/annotation_create.html', context)
 
+@login_required
+@require_POST
+def next_task(request, project_pk):
+    """Выдача следующего файла проекта в аренду аннотатору"""
+    project = get_object_or_404(Project, pk=project_pk)
+    
+    # Проверяем права доступа
+    if not can_view(request.user, project):
+        messages.error(request, 'You do not have permission to annotate this project.')
+        return redirect('annotations:annotation_list')
+    
+    lease = lease_next_task(project, request.user)
+    if lease is None:
+        messages.info(request, 'There are no files left to annotate in this project.')
+        return redirect('annotations:annotation_list')
+    
+    annotation, _ = Annotation.objects.get_or_create(
+        file_id=lease.file_id,
+        annotator=request.user,
+        defaults={'project': project, 'annotation_data': {}, 'status': 'draft'},
+    )
+    return redirect('annotations:annotation_edit', pk=annotation.pk)
+
+@login_required
+@require_POST
+def release_task(request, pk):
+    """Отказ от арендованного файла: он возвращается в очередь"""
+    annotation = get_object_or_404(Annotation, pk=pk, annotator=request.user)
+    release_lease(annotation.file_id, request.user.pk)
+    if annotation.status == 'draft':
+        annotation.delete()
+    messages.info(request, 'Task skipped.')
+    return redirect('annotations:annotation_list')
+
 @login_required
 def annotation_detail(request, pk):
     """Детальная информация об аннотации"""
@@ -131,6 +175,7 @@ def annotation_edit(request, pk):
     
     if request.method == 'POST':
         # Обработка данных аннотации
+        previous_data = annotation.annotation_data
         annotation_data = {}
         
         # В зависимости от типа проекта обрабатываем разные данные
@@ -153,6 +198,12 @@ def annotation_edit(request, pk):
         
         # Если пользователь отправил аннотацию
         if 'submit' in request.POST:
+            # Отправленные данные проверяются по схеме шаблона проекта, черновики — нет
+            try:
+                validate_annotation_data(annotation.project, annotation_data)
+            except SchemaError as exc:
+                messages.error(request, str(exc))
+                return redirect('annotations:annotation_edit', pk=annotation.pk)
             annotation.status = 'submitted'
             annotation.submitted_at = timezone.now()
             messages.success(request, 'Annotation submitted successfully!')
@@ -160,7 +211,10 @@ def annotation_edit(request, pk):
             annotation.status = 'draft'
             messages.success(request, 'Annotation saved as draft!')
         
-        annotation.save()
+        with transaction.atomic():
+            annotation.save()
+            # В историю пишется только разница с предыдущей версией
+            record_revision(annotation, request.user, previous=previous_data)
         return redirect('annotations:annotation_detail', pk=annotation.pk)
     
     # Получаем метки для проекта
@@ -173,6 +227,19 @@ def annotation_edit(request, pk):
     
     return render(request, 'annotations/annotation_edit.html', context)
 
+@login_required
+def annotation_revision(request, pk, number):
+    """Данные аннотации в версии number"""
+    annotation = get_object_or_404(Annotation.objects.select_related('project'), pk=pk)
+    if annotation.annotator_id != request.user.pk and annotation.project.owner_id != request.user.pk:
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    try:
+        data = get_revision(annotation, number)
+    except AnnotationRevision.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Revision not found'}, status=404)
+    latest = annotation.revisions.order_by('-number').values_list('number', flat=True).first()
+    return JsonResponse({'success': True, 'number': number, 'latest': latest, 'annotation_data': data})
+
 @login_required
 def annotation_delete(request, pk):
     """Удаление аннотации"""
@@ -211,10 +278,8 @@ def quality_review(request):
     if project_filter:
         annotations_for_review = annotations_for_review.filter(project_id=project_filter)
     
-    # Пагинация
-    paginator = Paginator(annotations_for_review, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Пагинация по ключу (submitted_at, id)
+    page_obj = paginate(request, annotations_for_review, ['-submitted_at', '-id'], 10)
     
     # Проекты для фильтра
     user_projects = Project.objects.filter(owner=user)
@@ -227,6 +292,129 @@ def quality_review(request):
     
     return render(request, 'annotations/quality_review.html', context)
 
+@login_required
+@require_POST
+def bulk_review(request):
+    """Утверждение или отклонение выбранных аннотаций одним запросом"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        annotation_ids = data.get('annotation_ids') or []
+        decision = data.get('decision')
+        scores = data.get('scores')
+        comments = data.get('comments', '')
+    else:
+        annotation_ids = request.POST.getlist('annotation_ids')
+        decision = request.POST.get('decision')
+        scores = {field: request.POST[field] for field in SCORE_FIELDS if field in request.POST} or None
+        comments = request.POST.get('comments', '')
+    
+    try:
+        reviewed, skipped = review_annotations(request.user, annotation_ids, decision, scores, str(comments))
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid annotation ids'}, status=400)
+    except ReviewError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    
+    return JsonResponse({'success': True, 'reviewed': len(reviewed), 'skipped': skipped})
+
+@login_required
+@require_POST
+def bulk_import(request, project_pk):
+    """Загрузка предразметки пачкой: JSON-массив или JSONL, ошибки возвращаются по строкам"""
+    project = get_object_or_404(Project, pk=project_pk)
+    if not can_view(request.user, project):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    if project.status != 'active':
+        return JsonResponse({'success': False, 'error': 'Project is not active'}, status=400)
+    
+    # JSONL читается потоком и пишется пачками, без ограничения на размер тела
+    if request.content_type in ('application/jsonl', 'application/x-ndjson', 'application/x-jsonlines'):
+        rows = iter_jsonl(request)
+    elif request.content_type == 'application/json':
+        # JSON-массив разбирается целиком в памяти, поэтому его размер ограничен
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        # Лишний байт показывает, что тело длиннее предела, и без Content-Length
+        body = request.read() if limit is None else request.read(limit + 1)
+        if limit is not None and len(body) > limit:
+            return JsonResponse({
+                'success': False,
+                'error': f'JSON body exceeds {limit} bytes; send large imports as JSONL (application/jsonl)',
+            }, status=413)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        if isinstance(data, dict):
+            data = data.get('annotations')
+        if not isinstance(data, list):
+            return JsonResponse({'success': False, 'error': 'Expected a list of annotations'}, status=400)
+        rows = enumerate(data, 1)
+    else:
+        return JsonResponse({'success': False, 'error': 'Unsupported content type'}, status=415)
+    
+    try:
+        result = import_annotations(project, request.user, rows)
+    except SchemaError as exc:
+        # Сломана схема шаблона проекта, а не загружаемые строки
+        return JsonResponse({'success': False, 'error': str(exc)}, status=exc.status)
+    return JsonResponse({'success': not result['errors'], **result})
+
+@login_required
+@require_POST
+def auto_review_project(request, project_pk):
+    """Автоматический обзор отправленных аннотаций проекта по порогам настроек"""
+    project = get_object_or_404(Project, pk=project_pk)
+    if not can_edit(request.user, project):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    approved, flagged = auto_review(project)
+    return JsonResponse({'success': True, 'approved': approved, 'needs_review': flagged})
+
+# Наибольшее число рамок в одном ответе
+MAX_BOX_RESULTS = 1000
+
+@login_required
+def box_search(request, project_pk):
+    """Поиск рамок проекта по метке, площади, размеру и области с постраничной выдачей по id"""
+    project = get_object_or_404(Project, pk=project_pk)
+    if not can_view(request.user, project):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    params = request.GET
+    try:
+        numbers = {
+            name: float(params[name]) for name in ('min_area', 'max_area', 'min_size') if params.get(name)
+        }
+        region = tuple(float(value) for value in params['region'].split(',')) if params.get('region') else None
+        after = int(params.get('after', 0))
+        limit = min(int(params.get('limit', MAX_BOX_RESULTS)), MAX_BOX_RESULTS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid parameters'}, status=400)
+    if region is not None and len(region) != 4:
+        return JsonResponse({'success': False, 'error': 'Region must be x1,y1,x2,y2'}, status=400)
+    if limit < 1:
+        return JsonResponse({'success': False, 'error': 'Limit must be at least 1'}, status=400)
+    
+    boxes = box_query(
+        project, label=params.get('label'), region=region, contained=params.get('contained') == '1', **numbers
+    ).filter(pk__gt=after).order_by('pk').values_list(
+        'pk', 'annotation_id', 'label', 'x1', 'y1', 'x2', 'y2', 'area'
+    )[:limit]
+    results = [
+        {'id': pk, 'annotation': annotation_id, 'label': label, 'bbox': [x1, y1, x2, y2], 'area': area}
+        for pk, annotation_id, label, x1, y1, x2, y2, area in boxes
+    ]
+    return JsonResponse({
+        'success': True,
+        'boxes': results,
+        'next': results[-1]['id'] if len(results) == limit else None,
+    })
+
 @login_required
 def template_list(request):
     """Список шаблонов аннотаций"""
@@ -260,16 +448,22 @@ def template_create(request):
         if project_id and name:
             project = get_object_or_404(Project, id=project_id, owner=user)
             
-            # Создаем шаблон
-            template = AnnotationTemplate.objects.create(
-                project=project,
-                name=name,
-                description=description,
-                schema=schema
-            )
-            
-            messages.success(request, 'Template created successfully!')
-            return redirect('annotations:template_list')
+            # Схема хранится разобранной и заранее проверяется компиляцией
+            try:
+                schema = parse_schema(schema)
+            except SchemaError as exc:
+                messages.error(request, str(exc))
+            else:
+                # Создаем шаблон
+                AnnotationTemplate.objects.create(
+                    project=project,
+                    name=name,
+                    description=description,
+                    schema=schema
+                )
+                
+                messages.success(request, 'Template created successfully!')
+                return redirect('annotations:template_list')
         else:
             messages.error(request, 'Please fill in all required fields.')
     
@@ -339,14 +533,45 @@ def session_list(request):
     # Получаем сессии пользователя
     sessions = AnnotationSession.objects.filter(annotator=user).order_by('-started_at')
     
-    # Пагинация
-    paginator = Paginator(sessions, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Пагинация по ключу (started_at, id)
+    page_obj = paginate(request, sessions, ['-started_at', '-id'], 20)
     
     context = {
         'page_obj': page_obj,
-        'total_sessions': sessions.count(),
+        'total_sessions': estimate_count(sessions),
     }
     
     return render(request, 'annotations/session_list.html', context)
+
+@login_required
+@require_POST
+def session_start(request, project_pk):
+    """Начало сессии аннотации; дальше клиент шлёт события в session_event"""
+    project = get_object_or_404(Project, pk=project_pk)
+    if not can_view(request.user, project):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    session = tracker.start(
+        request.user, project,
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ip_address=request.META.get('REMOTE_ADDR'),
+    )
+    return JsonResponse({'success': True, 'session': session.pk})
+
+@login_required
+@require_POST
+def session_event(request, pk):
+    """Пульс, отправка файла или закрытие сессии; в базу пишется пачками, а не на каждое событие"""
+    event = request.POST.get('event', 'heartbeat')
+    if event == 'heartbeat':
+        recorded = tracker.heartbeat(pk, request.user.pk)
+    elif event == 'submit':
+        recorded = tracker.submitted(pk, request.user.pk)
+    elif event == 'end':
+        recorded = tracker.end(pk, request.user.pk)
+    else:
+        return JsonResponse({'success': False, 'error': 'Unknown event'}, status=400)
+    
+    if not recorded:
+        return JsonResponse({'success': False, 'error': 'Session not found or already ended'}, status=404)
+    return JsonResponse({'success': True})
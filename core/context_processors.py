@@ -0,0 +1,12 @@
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import unread_count
+
+
+def notifications(request):
+    """Значок непрочитанных в меню; считается, только если шаблон его выводит"""
+    def count():
+        user = getattr(request, 'user', None)
+        return unread_count(user) if user is not None and user.is_authenticated else 0
+
+    return {'unread_notification_count': SimpleLazyObject(count)}
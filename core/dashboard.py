@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Func, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from annotations.models import Annotation
+from projects.access import Membership
+from projects.models import Project
+
+# Окно «недавних» аннотаций на главной и в статистике
+RECENT_DAYS = 30
+
+
+def _cache_key(user_id):
+    return f'core:dashboard:{user_id}'
+
+
+def _count(queryset):
+    """Коррелированный COUNT(*) для подстановки в общий запрос"""
+    counted = queryset.order_by().annotate(
+        _count=Func(Value(1), function='COUNT', output_field=IntegerField())
+    ).values('_count')
+    return Coalesce(Subquery(counted), 0)
+
+
+def _visible_projects():
+    return Project.objects.filter(
+        Q(owner=OuterRef('pk'))
+        | Q(pk__in=Membership.objects.filter(user=OuterRef(OuterRef('pk'))).values('project_id'))
+    )
+
+
+def compute_dashboard_stats(user):
+    """Все числа панели пользователя одним запросом: условная агрегация и подзапросы"""
+    since = timezone.now() - timedelta(days=RECENT_DAYS)
+    annotation_counts = {
+        f'annotations_{status}': Count('annotations', filter=Q(annotations__status=status))
+        for status, _ in Annotation.STATUS_CHOICES
+    }
+    project_type_counts = {
+        f'projects_{project_type}': _count(_visible_projects().filter(project_type=project_type))
+        for project_type, _ in Project.PROJECT_TYPES
+    }
+    row = User.objects.filter(pk=user.pk).values('pk').annotate(
+        total_annotations=Count('annotations'),
+        recent_annotations=Count('annotations', filter=Q(annotations__created_at__gte=since)),
+        **annotation_counts,
+        owned_projects=_count(Project.objects.filter(owner=OuterRef('pk'))),
+        collaborated_projects=_count(Membership.objects.filter(user=OuterRef('pk'))),
+        active_projects=_count(_visible_projects().filter(status='active')),
+        total_projects=_count(_visible_projects()),
+        **project_type_counts,
+    ).get()
+
+    return {
+        'total_annotations': row['total_annotations'],
+        'approved_annotations': row['annotations_approved'],
+        'recent_annotations': row['recent_annotations'],
+        'owned_projects': row['owned_projects'],
+        'collaborated_projects': row['collaborated_projects'],
+        'active_projects': row['active_projects'],
+        'total_projects': row['total_projects'],
+        'annotation_statuses': {status: row[f'annotations_{status}'] for status, _ in Annotation.STATUS_CHOICES},
+        'project_types': {
+            project_type: row[f'projects_{project_type}'] for project_type, _ in Project.PROJECT_TYPES
+        },
+    }
+
+
+def get_dashboard_stats(user):
+    """Числа панели из кеша; при промахе считаются одним запросом"""
+    # Без общего кеша (DASHBOARD_CACHE_TIMEOUT = 0) числа считаются при каждом обращении
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT
+    key = _cache_key(user.pk)
+    stats = cache.get(key) if timeout else None
+    if stats is None:
+        stats = compute_dashboard_stats(user)
+        if timeout:
+            cache.set(key, stats, timeout)
+    return stats
+
+
+def invalidate_dashboard(*user_ids):
+    """Сбрасывает кеш панели после изменения аннотаций или проектов"""
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids if user_id])
+
+
+def breakdown(counts, field):
+    """Ненулевые счётчики по убыванию в виде values(field).annotate(count=...)"""
+    return sorted(
+        ({field: key, 'count': count} for key, count in counts.items() if count),
+        key=lambda item: -item['count'],
+    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Notification
+from core.notifications import notify_project
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Send a notification to the owner and all collaborators of a project'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='Project id')
+        parser.add_argument('title')
+        parser.add_argument('--message', default='')
+        parser.add_argument(
+            '--type', dest='notification_type', default='system',
+            choices=[value for value, _ in Notification.NOTIFICATION_TYPES],
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f'Project {options["project"]} does not exist')
+
+        sent = notify_project(project, options['notification_type'], options['title'], options['message'])
+        self.stdout.write(self.style.SUCCESS(f'Notified {sent} user(s) of "{project.name}"'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.search import SEARCH_INDEXES, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search indexes for projects, files and annotation notes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('indexes', nargs='*', help=f'Indexes to rebuild: {", ".join(SEARCH_INDEXES)}')
+
+    def handle(self, *args, **options):
+        names = options['indexes'] or list(SEARCH_INDEXES)
+        unknown = set(names) - set(SEARCH_INDEXES)
+        if unknown:
+            raise CommandError(f'Unknown search index: {", ".join(sorted(unknown))}')
+
+        with transaction.atomic():
+            result = rebuild(names)
+
+        for name, count in result.items():
+            if count is None:
+                self.stdout.write(f'Reindexed "{name}"')
+            else:
+                self.stdout.write(f'Indexed {count} row(s) in "{name}"')
+        self.stdout.write(self.style.SUCCESS('Search indexes rebuilt'))
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from core.search import install, uninstall
+
+
+def create_search_index(apps, schema_editor):
+    install(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('projects', '0007_projectfile_lease_count'),
+        ('annotations', '0002_tasklease'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -33,6 +33,20 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-created_at']),
+            models.Index(fields=['user', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
+
+class NotificationCounter(models.Model):
+    """Число непрочитанных уведомлений пользователя; меняется вместе с уведомлениями"""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter'
+    )
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+
+from projects.access import Membership
+
+from .models import Notification, NotificationCounter
+from .pagination import CursorPaginator
+from .pubsub import publish, user_channel
+
+INBOX_PAGE_SIZE = 20
+INBOX_ORDERING = ['-created_at', '-id']
+
+
+def _cache_key(user_id):
+    return f'core:unread:{user_id}'
+
+
+def invalidate_unread(*user_ids):
+    """Сбрасывает кешированное число непрочитанных после изменения счётчика"""
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids if user_id])
+
+
+def adjust_unread(user_id, delta):
+    """Атомарно сдвигает счётчик пользователя; строки ещё нет — её создаст recount_unread"""
+    if delta:
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta)
+        invalidate_unread(user_id)
+
+
+def recount_unread(*user_ids):
+    """Пересчитывает счётчики по самим уведомлениям; возвращает {user_id: непрочитано}"""
+    counts = dict.fromkeys(user_ids, 0)
+    counts.update(
+        Notification.objects.filter(user_id__in=user_ids, is_read=False)
+        .values('user_id').annotate(unread=Count('pk')).order_by().values_list('user_id', 'unread')
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, unread=unread) for user_id, unread in counts.items()],
+        update_conflicts=True, unique_fields=['user'], update_fields=['unread'],
+    )
+    invalidate_unread(*user_ids)
+    return counts
+
+
+def unread_count(user):
+    """Число непрочитанных для значка в меню: из кеша, при промахе — строка счётчика"""
+    # Без общего кеша (NOTIFICATION_CACHE_TIMEOUT = 0) счётчик читается из базы каждый раз
+    timeout = settings.NOTIFICATION_CACHE_TIMEOUT
+    key = _cache_key(user.pk)
+    count = cache.get(key) if timeout else None
+    if count is None:
+        count = NotificationCounter.objects.filter(user_id=user.pk).values_list('unread', flat=True).first()
+        if count is None:
+            # Счётчик заводится при первом чтении, до этого рассылка его не трогает
+            count = recount_unread(user.pk)[user.pk]
+        if timeout:
+            cache.set(key, count, timeout)
+    return count
+
+
+def notify(user_ids, notification_type, title, message=''):
+    """Рассылает уведомление пользователям: один bulk_create и одно обновление счётчиков
+
+    Сигналы post_save не отправляются: счётчики сдвигаются здесь же одним UPDATE,
+    а подключённым получателям уходит одно событие на всех.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+    with transaction.atomic():
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=user_id, notification_type=notification_type,
+                title=title, message=message,
+            )
+            for user_id in user_ids
+        ])
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(unread=F('unread') + 1)
+        # Одно событие на все каналы получателей, подписчикам оно уходит после фиксации
+        publish(
+            [user_channel(user_id) for user_id in user_ids], 'notification',
+            {'notification_type': notification_type, 'title': title, 'message': message},
+        )
+    invalidate_unread(*user_ids)
+    return len(user_ids)
+
+
+def project_recipients(project, exclude=None):
+    """id владельца и участников проекта одним запросом"""
+    user_ids = set(Membership.objects.filter(project_id=project.pk).values_list('user_id', flat=True))
+    user_ids.add(project.owner_id)
+    user_ids.discard(exclude.pk if exclude is not None else None)
+    return sorted(user_ids)
+
+
+def notify_project(project, notification_type, title, message='', exclude=None):
+    """Уведомляет владельца и всех участников проекта, кроме exclude (обычно автора события)"""
+    return notify(project_recipients(project, exclude), notification_type, title, message)
+
+
+def mark_read(user, notification_ids=None):
+    """Отмечает уведомления прочитанными (все, если ids не переданы); возвращает их число
+
+    Счётчик уменьшается ровно на число строк, которые действительно сменили состояние.
+    """
+    notifications = Notification.objects.filter(user=user, is_read=False)
+    if notification_ids is not None:
+        notifications = notifications.filter(pk__in=notification_ids)
+    with transaction.atomic():
+        updated = notifications.update(is_read=True)
+        adjust_unread(user.pk, -updated)
+    return updated
+
+
+def inbox(user, cursor=None, unread_only=False, per_page=INBOX_PAGE_SIZE):
+    """Страница входящих по ключу (created_at, id) без COUNT(*) и OFFSET"""
+    notifications = Notification.objects.filter(user=user)
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+    return CursorPaginator(notifications, INBOX_ORDERING, per_page).get_page(cursor)
@@ -0,0 +1,168 @@
+import base64
+import datetime
+import json
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Выше этого значения точный COUNT не выполняется
+COUNT_CAP = 10000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder обрезает микросекунды, а ключу нужна точная граница"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return data['v'], data['d']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(token)
+
+
+class CursorPage:
+    """Страница keyset-пагинации с непрозрачными токенами соседних страниц"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинация по ключу (например, (uploaded_at, id)) без COUNT(*) и OFFSET"""
+
+    # Последним полем ordering должно быть уникальное поле, обычно id
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.model_fields = [queryset.model._meta.get_field(field) for field in self.fields]
+
+    def _keyset_filter(self, values, forward):
+        # (a, b) > (x, y)  ⇔  a > x OR (a = x AND b > y)
+        conditions = []
+        for i, ordering in enumerate(self.ordering):
+            descending = ordering.startswith('-') == forward
+            lookup = f'{self.fields[i]}__{"lt" if descending else "gt"}'
+            equal = {self.fields[j]: values[j] for j in range(i)}
+            conditions.append(Q(**equal, **{lookup: values[i]}))
+        return reduce(lambda a, b: a | b, conditions)
+
+    def _values(self, obj):
+        return [getattr(obj, field.attname) for field in self.model_fields]
+
+    def get_page(self, cursor=None):
+        forward = True
+        queryset = self.queryset
+        if cursor:
+            try:
+                raw_values, direction = decode_cursor(cursor)
+                if len(raw_values) != len(self.fields):
+                    raise InvalidCursor(cursor)
+                values = [field.to_python(value) for field, value in zip(self.model_fields, raw_values)]
+            except (InvalidCursor, ValidationError):
+                # Повреждённый токен: отдаём первую страницу, как Paginator.get_page
+                cursor = None
+            else:
+                forward = direction != 'prev'
+                queryset = queryset.filter(self._keyset_filter(values, forward))
+
+        ordering = self.ordering if forward else [
+            field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering
+        ]
+        # Лишняя строка показывает, есть ли ещё страница в этом направлении
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor(self._values(rows[-1]), 'next')
+            if (has_more and not forward) or (forward and cursor):
+                previous_cursor = encode_cursor(self._values(rows[0]), 'prev')
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+class CountedPaginator(Paginator):
+    """Paginator, которому передаётся уже известное точное число объектов
+
+    По count считаются num_pages и допустимые номера страниц, поэтому оценка
+    (estimate_count) сюда не передаётся: она годится только для показа.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @cached_property
+    def count(self):
+        if self._known_count is not None:
+            return self._known_count
+        return super().count
+
+
+def estimate_count(queryset, cap=COUNT_CAP):
+    """Оценка числа строк: план запроса на PostgreSQL, иначе COUNT с ограничением"""
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.order_by()[:cap].count()
+
+
+def paginate(request, queryset, ordering, per_page, count=None, allow_cursor=True, prefer_cursor=False):
+    """Страница для представления: keyset-режим по ?cursor= или ?pagination=cursor
+
+    count — точное число объектов, если оно уже известно; иначе Paginator выполнит COUNT.
+    prefer_cursor включает keyset-режим по умолчанию, пока не запрошен ?page=:
+    так границы страниц не требуют точного подсчёта.
+    """
+    # Поля ordering в keyset-режиме не должны содержать NULL у страниц выборки
+    cursor_mode = (
+        'cursor' in request.GET or request.GET.get('pagination') == 'cursor'
+        or (prefer_cursor and 'page' not in request.GET)
+    )
+    if allow_cursor and cursor_mode:
+        return CursorPaginator(queryset, ordering, per_page).get_page(request.GET.get('cursor'))
+    paginator = CountedPaginator(queryset.order_by(*ordering), per_page, count=count)
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Сколько непрочитанных событий держать для одного подключения; старые вытесняются
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def project_channel(project_id):
+    return f'project:{project_id}'
+
+
+class Subscription:
+    """Очередь событий одного подключения, привязанная к его циклу событий"""
+
+    def __init__(self, broker, channels, maxsize=SUBSCRIPTION_QUEUE_SIZE):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, message):
+        """Кладёт событие в очередь; вызывается в цикле подписчика"""
+        if self.queue.full():
+            # Медленный клиент не должен копить память: теряются самые старые события
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Следующее событие (event, data); asyncio.TimeoutError, если за timeout ничего не пришло"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+def _put_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.put(message)
+
+
+class InProcessBroker:
+    """Публикация и подписка внутри одного процесса
+
+    Другой брокер (например, поверх Redis) подключается через EVENT_BROKER и должен
+    предоставлять те же subscribe(channels), unsubscribe(subscription) и publish(channels, message).
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, maxsize=SUBSCRIPTION_QUEUE_SIZE):
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channels, message):
+        """Доставляет сообщение подписчикам каналов; подписанный на несколько каналов получит его один раз"""
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subscribers.get(channel, ()))
+        # Один вызов на цикл событий, а не на подписчика: будить цикл из чужого потока дорого
+        by_loop = defaultdict(list)
+        for subscription in targets:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_put_all, subscriptions, message)
+            except RuntimeError:
+                # Цикл уже закрыт: подключения оборвались, не успев отписаться
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+        return len(targets)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Брокер процесса, класс задаётся настройкой EVENT_BROKER"""
+    return import_string(settings.EVENT_BROKER)()
+
+
+def _deliver(messages):
+    broker = get_broker()
+    for channels, message in messages:
+        broker.publish(channels, message)
+
+
+def publish_many(messages):
+    """Публикует тройки (каналы, событие, данные) после фиксации текущей транзакции
+
+    Данные сериализуются один раз и отдаются всем подписчикам одной строкой.
+    """
+    prepared = [
+        (list(channels), (event, json.dumps(data, cls=DjangoJSONEncoder)))
+        for channels, event, data in messages
+    ]
+    if prepared:
+        transaction.on_commit(lambda: _deliver(prepared))
+
+
+def publish(channels, event, data):
+    publish_many([(channels, event, data)])
@@ -0,0 +1,143 @@
+from django.apps import apps
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Индексируемые текстовые поля: имя индекса -> (модель, поля)
+SEARCH_INDEXES = {
+    'project': ('projects.Project', ('name', 'description')),
+    'file': ('projects.ProjectFile', ('filename',)),
+    'annotation': ('annotations.Annotation', ('annotator_notes',)),
+}
+# Триграммы не находят запросы короче трёх символов
+MIN_QUERY_LENGTH = 3
+
+
+def _fts_table(name):
+    return f'search_{name}'
+
+
+def _pg_index(name, field):
+    return f'search_{name}_{field}_trgm'
+
+
+def _backend():
+    if connection.vendor == 'sqlite':
+        return 'fts5'
+    if connection.vendor == 'postgresql':
+        return 'trigram'
+    return None
+
+
+def install(schema_editor):
+    """Создаёт индексы для текущей СУБД и заполняет их существующими строками"""
+    vendor = schema_editor.connection.vendor
+    for name, (label, fields) in SEARCH_INDEXES.items():
+        table = apps.get_model(label)._meta.db_table
+        if vendor == 'sqlite':
+            # Триграммный токенизатор FTS5 ищет подстроки без учёта регистра, как icontains
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {_fts_table(name)} '
+                f'USING fts5({", ".join(fields)}, tokenize="trigram")'
+            )
+        elif vendor == 'postgresql':
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for field in fields:
+                # GIN-индекс pg_trgm используется для ILIKE '%...%'
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {_pg_index(name, field)} '
+                    f'ON {table} USING gin ({field} gin_trgm_ops)'
+                )
+    if vendor == 'sqlite':
+        rebuild(using=schema_editor.connection)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for name, (_, fields) in SEARCH_INDEXES.items():
+        if vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {_fts_table(name)}')
+        elif vendor == 'postgresql':
+            for field in fields:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {_pg_index(name, field)}')
+
+
+def rebuild(names=None, using=None):
+    """Полностью перестраивает индексы; возвращает число проиндексированных строк по индексу"""
+    using = using or connection
+    result = {}
+    with using.cursor() as cursor:
+        for name in names or SEARCH_INDEXES:
+            label, fields = SEARCH_INDEXES[name]
+            table = apps.get_model(label)._meta.db_table
+            if using.vendor == 'sqlite':
+                columns = ', '.join(fields)
+                cursor.execute(f'DELETE FROM {_fts_table(name)}')
+                cursor.execute(
+                    f'INSERT INTO {_fts_table(name)} (rowid, {columns}) SELECT id, {columns} FROM {table}'
+                )
+                result[name] = cursor.rowcount
+            elif using.vendor == 'postgresql':
+                for field in fields:
+                    cursor.execute(f'REINDEX INDEX {_pg_index(name, field)}')
+                result[name] = None
+    return result
+
+
+def index_objects(name, objects):
+    """Добавляет или обновляет строки индекса (для bulk_create и сигналов)"""
+    if _backend() != 'fts5':
+        # Индексы PostgreSQL обновляются самой СУБД
+        return
+    fields = SEARCH_INDEXES[name][1]
+    rows = [
+        (obj.pk, *[getattr(obj, field) or '' for field in fields])
+        for obj in objects if obj.pk is not None
+    ]
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * (len(fields) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {_fts_table(name)} (rowid, {", ".join(fields)}) VALUES ({placeholders})',
+            rows,
+        )
+
+
+def unindex_objects(name, pks):
+    if _backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {_fts_table(name)} WHERE rowid = %s', [(pk,) for pk in pks])
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def matching(name, query, field='pk'):
+    """Условие «поле field входит в результаты поиска query по индексу name»"""
+    label, fields = SEARCH_INDEXES[name]
+    query = query.strip()
+    backend = _backend()
+
+    if backend == 'fts5' and len(query) >= MIN_QUERY_LENGTH:
+        # Запрос целиком — одна фраза: спецсимволы синтаксиса MATCH не интерпретируются
+        phrase = '"%s"' % query.replace('"', '""')
+        table = _fts_table(name)
+        return Q(**{f'{field}__in': RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [phrase])})
+
+    if backend == 'trigram' and len(query) >= MIN_QUERY_LENGTH:
+        table = apps.get_model(label)._meta.db_table
+        conditions = ' OR '.join(f"{column} ILIKE %s ESCAPE '\\'" for column in fields)
+        pattern = f'%{_escape_like(query)}%'
+        return Q(**{f'{field}__in': RawSQL(
+            f'SELECT id FROM {table} WHERE {conditions}', [pattern] * len(fields)
+        )})
+
+    # Короткие запросы и прочие СУБД: обычный поиск подстроки
+    prefix = '' if field == 'pk' else f'{field.removesuffix("_id")}__'
+    condition = Q()
+    for column in fields:
+        condition |= Q(**{f'{prefix}{column}__icontains': query})
+    return condition
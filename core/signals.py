@@ -0,0 +1,83 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from annotations.models import Annotation
+from projects.access import Membership
+from projects.models import Project
+
+from .dashboard import invalidate_dashboard
+from .models import Notification
+from .notifications import adjust_unread
+from .pubsub import publish, user_channel
+from .search import SEARCH_INDEXES, index_objects, unindex_objects
+
+
+def _connect(name, label, fields):
+    def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+        # Сохранение без индексируемых полей (например, только статуса) индекс не трогает
+        if raw or (update_fields is not None and not set(update_fields) & set(fields)):
+            return
+        index_objects(name, [instance])
+
+    def remove_from_search_index(sender, instance, **kwargs):
+        unindex_objects(name, [instance.pk])
+
+    post_save.connect(update_search_index, sender=label, weak=False, dispatch_uid=f'search_save_{name}')
+    post_delete.connect(remove_from_search_index, sender=label, weak=False, dispatch_uid=f'search_delete_{name}')
+
+
+for name, (label, fields) in SEARCH_INDEXES.items():
+    _connect(name, label, fields)
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def invalidate_annotator_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(instance.annotator_id)
+
+
+@receiver(post_init, sender=Notification)
+def remember_notification_read(sender, instance, **kwargs):
+    instance._original_is_read = instance.__dict__.get('is_read')
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created, raw=False, **kwargs):
+    """Одиночные create/save сдвигают счётчик; массовая рассылка делает это в notify"""
+    if raw:
+        return
+    if created:
+        delta = 0 if instance.is_read else 1
+        publish([user_channel(instance.user_id)], 'notification', {
+            'id': instance.pk, 'notification_type': instance.notification_type,
+            'title': instance.title, 'message': instance.message, 'created_at': instance.created_at,
+        })
+    else:
+        delta = int(bool(instance._original_is_read)) - int(bool(instance.is_read))
+    adjust_unread(instance.user_id, delta)
+    instance._original_is_read = instance.is_read
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance._original_is_read:
+        adjust_unread(instance.user_id, -1)
+
+
+@receiver(post_save, sender=Project)
+@receiver(pre_delete, sender=Project)
+def invalidate_project_dashboards(sender, instance, **kwargs):
+    """Статус и тип проекта учитываются в панелях владельца и всех участников"""
+    user_ids = Membership.objects.filter(project_id=instance.pk).values_list('user_id', flat=True)
+    invalidate_dashboard(instance.owner_id, getattr(instance, '_original_owner_id', None), *user_ids)
+
+
+@receiver(m2m_changed, sender=Membership)
+def invalidate_collaborator_dashboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            invalidate_dashboard(instance.pk)
+        else:
+            invalidate_dashboard(*Membership.objects.filter(project=instance).values_list('user_id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_dashboard(*([instance.pk] if reverse else pk_set or []))
@@ -1,3 +1,635 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import re
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.template import RequestContext, Template
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from annotations.models import Annotation, AnnotationDailyRollup, AnnotationSession
+from annotations.rollups import rebuild_rollups
+from projects.models import Project, ProjectFile
+from scale_ai_platform import settings as project_settings
+
+from . import search, views
+from .dashboard import get_dashboard_stats
+from .models import Notification, NotificationCounter
+from .pubsub import InProcessBroker, get_broker, project_channel, user_channel
+from .notifications import inbox, mark_read, notify, notify_project, recount_unread, unread_count
+from .pagination import CursorPage, CursorPaginator, estimate_count, paginate
+
+# Таблицы, полный просмотр или сортировка которых недопустимы в горячих представлениях
+LARGE_TABLES = {
+    Annotation._meta.db_table,
+    AnnotationSession._meta.db_table,
+    AnnotationDailyRollup._meta.db_table,
+    ProjectFile._meta.db_table,
+    Notification._meta.db_table,
+}
+TABLE_ALIAS_RE = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?"?(\w+)"?)?')
+
+
+def _evaluate_context(request, template_name, context=None, *args, **kwargs):
+    """Вместо рендеринга шаблона вычисляет все ленивые значения контекста"""
+    for value in (context or {}).values():
+        if isinstance(value, QuerySet) or hasattr(value, 'object_list'):
+            list(value)
+    return HttpResponse(template_name)
+
+
+def query_plan(sql):
+    """План запроса в виде строк (EXPLAIN QUERY PLAN на SQLite, EXPLAIN на PostgreSQL)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_problems(sql):
+    """Полные просмотры и сортировки больших таблиц в плане запроса"""
+    aliases = {}
+    for table, alias in TABLE_ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    if not set(aliases.values()) & LARGE_TABLES:
+        return []
+
+    problems = []
+    main_table = aliases.get(TABLE_ALIAS_RE.search(sql).group(1))
+    # Сортировка уже сгруппированных строк дешёвая, проверяется только сортировка самой таблицы;
+    # сортировка найденного полнотекстовым поиском ограничена числом совпадений
+    sorts_table = main_table in LARGE_TABLES and 'GROUP BY' not in sql and ' MATCH ' not in sql
+    for line in query_plan(sql):
+        if connection.vendor == 'sqlite':
+            match = re.match(r'\s*SCAN (\w+)', line)
+            if match and aliases.get(match.group(1)) in LARGE_TABLES and 'USING' not in line:
+                problems.append(line)
+            if 'TEMP B-TREE FOR ORDER BY' in line and sorts_table:
+                problems.append(line)
+        else:
+            match = re.search(r'Seq Scan on (\w+)', line)
+            if match and match.group(1) in LARGE_TABLES:
+                problems.append(line)
+    return problems
+
+
+class QueryPlanTestCase(TestCase):
+    """Наполняет базу крупным набором данных и проверяет запросы представлений"""
+
+    PROJECTS = 6
+    FILES_PER_PROJECT = 400
+    ANNOTATORS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.annotators = [
+            User.objects.create_user(f'annotator{i}', password='password') for i in range(cls.ANNOTATORS)
+        ]
+        cls.annotator = cls.annotators[0]
+
+        cls.projects = [
+            Project.objects.create(
+                name=f'Project {i}', description=f'Dataset number {i}', owner=cls.owner,
+                project_type='image_classification', status='active',
+            )
+            for i in range(cls.PROJECTS)
+        ]
+        for project in cls.projects:
+            project.collaborators.add(*cls.annotators)
+        cls.project = cls.projects[0]
+
+        now = timezone.now()
+        files = ProjectFile.objects.bulk_create([
+            ProjectFile(
+                project=project, file=f'files/{project.pk}/{i}.png', filename=f'image_{project.pk}_{i}.png',
+                file_type='image', file_size=1000 + i, uploaded_by=cls.owner,
+            )
+            for project in cls.projects
+            for i in range(cls.FILES_PER_PROJECT)
+        ])
+        # bulk_create не обновляет счётчики проекта
+        Project.objects.update(total_files=cls.FILES_PER_PROJECT)
+
+        statuses = ['draft', 'submitted', 'approved', 'rejected']
+        annotations = []
+        for i, project_file in enumerate(files):
+            for j in range(2):
+                status = statuses[(i // cls.ANNOTATORS + j) % len(statuses)]
+                annotations.append(Annotation(
+                    project_id=project_file.project_id, file=project_file,
+                    annotator=cls.annotators[(i + j) % cls.ANNOTATORS],
+                    annotation_data={'label': 'cat'}, status=status,
+                    submitted_at=now - timedelta(minutes=i) if status != 'draft' else None,
+                    annotator_notes=f'note {i}',
+                ))
+        Annotation.objects.bulk_create(annotations)
+        rebuild_rollups()
+
+        Notification.objects.bulk_create([
+            Notification(
+                user=user, notification_type='system', title=f'Notice {i}', message='Message',
+                is_read=i % 3 == 0,
+            )
+            for user in [cls.owner, *cls.annotators]
+            for i in range(200)
+        ])
+        # bulk_create не сдвигает счётчики непрочитанных
+        recount_unread(cls.owner.pk, *[user.pk for user in cls.annotators])
+        AnnotationSession.objects.bulk_create([
+            AnnotationSession(annotator=user, project=project, files_annotated=i)
+            for user in cls.annotators
+            for project in cls.projects
+            for i in range(10)
+        ])
+
+        # Статистика для планировщика, как на рабочей базе
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        # Кеш индекса доступа не должен переживать тест, иначе число запросов зависит от порядка
+        cache.clear()
+
+    def get(self, view, user, *args, **params):
+        request = RequestFactory().get('/', params)
+        request.user = user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with mock.patch(f'{view.__module__}.render', _evaluate_context):
+            return view(request, *args)
+
+    def assertViewQueries(self, max_queries, view, user, *args, **params):
+        """Не больше max_queries запросов и ни одного полного просмотра больших таблиц"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(view, user, *args, **params)
+        self.assertEqual(response.status_code, 200)
+
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{view.__name__} issued {len(queries)} queries:\n' + '\n'.join(queries),
+        )
+        for sql in queries:
+            if sql.lstrip().upper().startswith('SELECT'):
+                problems = plan_problems(sql)
+                self.assertFalse(problems, f'{view.__name__}: {sql}\n' + '\n'.join(problems))
+        return response
+
+
+class CoreViewQueryTests(QueryPlanTestCase):
+
+    def test_home(self):
+        self.assertViewQueries(3, views.home, self.annotator)
+
+    def test_dashboard(self):
+        self.assertViewQueries(5, views.dashboard, self.annotator)
+
+    def test_notifications(self):
+        self.assertViewQueries(1, views.notifications, self.annotator)
+
+    def test_statistics(self):
+        self.assertViewQueries(3, views.statistics, self.annotator)
+
+    def test_statistics_timeseries(self):
+        response = self.assertViewQueries(
+            3, views.statistics_timeseries, self.owner, project=str(self.project.pk), days='90',
+        )
+        series = json.loads(response.content)['series']
+        self.assertEqual(
+            sum(row['count'] for row in series), Annotation.objects.filter(project=self.project).count()
+        )
+
+    @override_settings(DASHBOARD_CACHE_TIMEOUT=300)
+    def test_statistics_reads_only_rollups(self):
+        # Числа проектов уже в кеше, остаются два запроса к дневным агрегатам
+        self.get(views.statistics, self.annotator)
+        with self.assertNumQueries(2):
+            self.get(views.statistics, self.annotator)
+
+
+@override_settings(DASHBOARD_CACHE_TIMEOUT=300)
+class DashboardStatsTests(QueryPlanTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stats = get_dashboard_stats(self.annotator)
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_stats(self.annotator), self.stats)
+
+    @override_settings(DASHBOARD_CACHE_TIMEOUT=0)
+    def test_not_cached_in_process_local_cache(self):
+        # Кеш по умолчанию — LocMemCache, другим воркерам не видный: числа панели в нём не хранятся
+        self.assertEqual(project_settings.DASHBOARD_CACHE_TIMEOUT, 0)
+        # Изменение в другом воркере: сигналы этого процесса кеш не сбросили бы
+        submitted = self.stats['annotation_statuses']['submitted']
+        self.assertTrue(submitted)
+        Annotation.objects.filter(annotator=self.annotator, status='submitted').update(status='approved')
+        stats = get_dashboard_stats(self.annotator)
+        self.assertEqual(stats['approved_annotations'], self.stats['approved_annotations'] + submitted)
+
+    def test_matches_raw_counts(self):
+        annotations = Annotation.objects.filter(annotator=self.annotator)
+        self.assertEqual(self.stats['total_annotations'], annotations.count())
+        self.assertEqual(self.stats['approved_annotations'], annotations.filter(status='approved').count())
+        self.assertEqual(self.stats['total_projects'], self.PROJECTS)
+        self.assertEqual(self.stats['project_types']['image_classification'], self.PROJECTS)
+
+    def test_invalidated_by_annotation_change(self):
+        annotation = Annotation.objects.filter(annotator=self.annotator, status='submitted').first()
+        annotation.status = 'approved'
+        annotation.save()
+        stats = get_dashboard_stats(self.annotator)
+        self.assertEqual(stats['approved_annotations'], self.stats['approved_annotations'] + 1)
+
+    def test_invalidated_by_membership_change(self):
+        self.project.collaborators.remove(self.annotator)
+        stats = get_dashboard_stats(self.annotator)
+        self.assertEqual(stats['total_projects'], self.PROJECTS - 1)
+        self.assertEqual(stats['collaborated_projects'], self.PROJECTS - 1)
+
+
+class NotificationTests(QueryPlanTestCase):
+
+    def unread(self, user):
+        return Notification.objects.filter(user=user, is_read=False).count()
+
+    @override_settings(NOTIFICATION_CACHE_TIMEOUT=300)
+    def test_unread_count_cached(self):
+        expected = self.unread(self.annotator)
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_count(self.annotator), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.annotator), expected)
+
+    def test_not_cached_in_process_local_cache(self):
+        # LocMemCache не виден другим воркерам, поэтому счётчик в нём не кешируется
+        self.assertEqual(project_settings.NOTIFICATION_CACHE_TIMEOUT, 0)
+        expected = unread_count(self.annotator)
+        # Счётчик сдвинул другой воркер: сброс кеша там этот процесс не затронул бы
+        NotificationCounter.objects.filter(user=self.annotator).update(unread=F('unread') + 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_count(self.annotator), expected + 1)
+
+    def test_counter_created_on_first_read(self):
+        NotificationCounter.objects.filter(user=self.annotator).delete()
+        self.assertEqual(unread_count(self.annotator), self.unread(self.annotator))
+        self.assertTrue(NotificationCounter.objects.filter(user=self.annotator).exists())
+
+    def test_counter_follows_changes(self):
+        user = self.annotator
+        notification = Notification.objects.create(user=user, notification_type='system', title='New', message='')
+        self.assertEqual(unread_count(user), self.unread(user))
+        notification.is_read = True
+        notification.save()
+        self.assertEqual(unread_count(user), self.unread(user))
+        notification.delete()
+        Notification.objects.filter(user=user, is_read=False).first().delete()
+        self.assertEqual(unread_count(user), self.unread(user))
+
+        ids = list(Notification.objects.filter(user=user, is_read=False).values_list('pk', flat=True)[:5])
+        self.assertEqual(mark_read(user, ids), 5)
+        self.assertEqual(mark_read(user, ids), 0)
+        self.assertEqual(unread_count(user), self.unread(user))
+        mark_read(user)
+        self.assertEqual(unread_count(user), 0)
+
+    def test_notify_project_fans_out_in_one_insert(self):
+        before = {user.pk: self.unread(user) for user in [self.owner, *self.annotators]}
+        with CaptureQueriesContext(connection) as context:
+            sent = notify_project(self.project, 'system', 'Deadline', 'Soon', exclude=self.owner)
+        statements = [query['sql'].split()[0] for query in context.captured_queries]
+        self.assertEqual(sent, self.ANNOTATORS)
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertEqual(statements.count('UPDATE'), 1)
+
+        self.assertEqual(unread_count(self.owner), before[self.owner.pk])
+        for user in self.annotators:
+            self.assertEqual(unread_count(user), before[user.pk] + 1)
+            self.assertEqual(unread_count(user), self.unread(user))
+
+    def test_notify_without_counter_row(self):
+        NotificationCounter.objects.filter(user=self.annotator).delete()
+        notify([self.annotator.pk], 'system', 'Hello')
+        self.assertEqual(unread_count(self.annotator), self.unread(self.annotator))
+
+    @override_settings(NOTIFICATION_CACHE_TIMEOUT=300)
+    def test_badge_without_queries(self):
+        template = Template('{% if unread_notification_count %}{{ unread_notification_count }}{% endif %}')
+        request = RequestFactory().get('/')
+        request.user = self.annotator
+        unread_count(self.annotator)
+        with self.assertNumQueries(0):
+            rendered = template.render(RequestContext(request, {}))
+        self.assertEqual(rendered, str(self.unread(self.annotator)))
+
+    def test_inbox_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            with CaptureQueriesContext(connection) as context:
+                page = inbox(self.annotator, cursor, unread_only=True)
+            self.assertEqual(len(context.captured_queries), 1)
+            self.assertFalse(plan_problems(context.captured_queries[0]['sql']))
+            seen.extend(page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(
+            [notification.pk for notification in seen],
+            list(Notification.objects.filter(user=self.annotator, is_read=False)
+                 .order_by('-created_at', '-id').values_list('pk', flat=True)),
+        )
+
+    def test_mark_all_view(self):
+        request = RequestFactory().post('/', {'mark_all': '1'})
+        request.user = self.annotator
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with mock.patch('core.views.redirect', return_value=HttpResponse()):
+            views.notifications(request)
+        self.assertEqual(self.unread(self.annotator), 0)
+        self.assertEqual(unread_count(self.annotator), 0)
+
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        project = Project.objects.create(name='Pages', owner=cls.owner, project_type='image_classification')
+        ProjectFile.objects.bulk_create([
+            ProjectFile(
+                project=project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image',
+                file_size=i % 7, uploaded_by=cls.owner,
+            )
+            for i in range(45)
+        ])
+        cls.files = ProjectFile.objects.all()
+        cls.ordered = list(cls.files.order_by('-file_size', 'id').values_list('pk', flat=True))
+
+    def request(self, **params):
+        return RequestFactory().get('/', params)
+
+    def test_cursor_walk(self):
+        paginator = CursorPaginator(self.files, ['-file_size', 'id'], 20)
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([project_file.pk for project_file in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), self.ordered)
+
+        # Назад от последней страницы — та же вторая страница
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual([project_file.pk for project_file in previous], pages[1])
+        self.assertTrue(previous.has_next() and previous.has_previous())
+        # Повреждённый токен даёт первую страницу
+        self.assertEqual([project_file.pk for project_file in paginator.get_page('garbage')], pages[0])
+
+    def test_known_count_bounds_pages(self):
+        page = paginate(self.request(page='3'), self.files, ['-file_size', 'id'], 20, count=45)
+        self.assertEqual((page.number, page.paginator.num_pages, len(page)), (3, 3, 5))
+        # Без известного числа выполняется точный COUNT
+        with self.assertNumQueries(2):
+            page = paginate(self.request(page='99'), self.files, ['-file_size', 'id'], 20)
+            self.assertEqual((page.number, len(page)), (3, 5))
+
+    def test_prefer_cursor(self):
+        page = paginate(self.request(), self.files, ['id'], 20, prefer_cursor=True)
+        self.assertIsInstance(page, CursorPage)
+        page = paginate(self.request(page='2'), self.files, ['id'], 20, prefer_cursor=True)
+        self.assertEqual(page.number, 2)
+        page = paginate(self.request(), self.files, ['id'], 20, allow_cursor=False, prefer_cursor=True)
+        self.assertNotIsInstance(page, CursorPage)
+
+    def test_estimate_count(self):
+        self.assertEqual(estimate_count(self.files), 45)
+        if connection.vendor == 'sqlite':
+            self.assertEqual(estimate_count(self.files, cap=10), 10)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.signs = Project.objects.create(
+            name='Street signs', description='Road scenes', owner=cls.owner, project_type='object_detection',
+        )
+        cls.scans = Project.objects.create(name='Medical scans', owner=cls.owner, project_type='image_classification')
+        cls.sale = Project.objects.create(name='Cats 100%_off', owner=cls.owner, project_type='image_classification')
+        ProjectFile.objects.create(
+            project=cls.signs, file='files/stop.png', filename='stop.png', file_type='image', file_size=1,
+        )
+
+    def search(self, query, name='project', queryset=None, **kwargs):
+        queryset = Project.objects.all() if queryset is None else queryset
+        return set(queryset.filter(search.matching(name, query, **kwargs)))
+
+    def indexed(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {search._fts_table(name)}')
+            return {pk for pk, in cursor.fetchall()}
+
+    def test_matching(self):
+        # Подстрока без учёта регистра в любом из индексируемых полей, как icontains
+        self.assertEqual(self.search('SIGN'), {self.signs})
+        self.assertEqual(self.search('road sc'), {self.signs})
+        self.assertEqual(self.search('scan'), {self.scans})
+        # Спецсимволы MATCH и LIKE ищутся буквально
+        self.assertEqual(self.search('100%_'), {self.sale})
+        self.assertEqual(self.search('"signs" OR scans*'), set())
+        self.assertEqual(self.search('stop', 'file', ProjectFile.objects.all()), set(self.signs.files.all()))
+        self.assertEqual(
+            self.search('signs', queryset=ProjectFile.objects.all(), field='project_id'),
+            set(self.signs.files.all()),
+        )
+
+    def test_short_query_fallback(self):
+        # Запросы короче трёх символов индексом не ищутся ни одним движком
+        for backend in ('fts5', 'trigram'):
+            with mock.patch.object(search, '_backend', return_value=backend):
+                condition = search.matching('project', ' ca ')
+                self.assertNotIn('RawSQL', repr(condition))
+                self.assertEqual(self.search('ca'), {self.scans, self.sale})
+                self.assertEqual(
+                    self.search('Ro', queryset=ProjectFile.objects.all(), field='project_id'),
+                    set(self.signs.files.all()),
+                )
+
+    def test_trigram_index(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('pg_trgm is PostgreSQL-specific')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [Project._meta.db_table])
+            indexes = {name for name, in cursor.fetchall()}
+        self.assertTrue({search._pg_index('project', field) for field in ('name', 'description')} <= indexes)
+        self.assertIn('ILIKE', str(Project.objects.filter(search.matching('project', 'sign')).query))
+        self.assertEqual(self.search('SIGN'), {self.signs})
+        self.assertEqual(self.search('100%_'), {self.sale})
+        self.assertEqual(self.search('0%x'), set())
+
+    def test_index_follows_signals(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only the FTS5 index is maintained by signals')
+        self.assertEqual(self.indexed('project'), {self.signs.pk, self.scans.pk, self.sale.pk})
+
+        self.scans.name = 'Medical images'
+        self.scans.save()
+        self.assertEqual(self.search('scans'), set())
+        self.assertEqual(self.search('images'), {self.scans})
+
+        # Сохранение без индексируемых полей индекс не трогает
+        with mock.patch('core.signals.index_objects') as index_objects:
+            self.scans.save(update_fields=['status'])
+        index_objects.assert_not_called()
+
+        pk = self.sale.pk
+        self.sale.delete()
+        self.assertNotIn(pk, self.indexed('project'))
+
+    def test_rebuild_command(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only the FTS5 index stores its own rows')
+        # QuerySet.update обходит сигналы, индекс отстаёт до перестроения
+        Project.objects.filter(pk=self.scans.pk).update(name='Medical images')
+        self.assertEqual(self.search('images'), set())
+
+        out = io.StringIO()
+        call_command('rebuild_search_index', 'project', stdout=out)
+        self.assertIn('Indexed 3 row(s) in "project"', out.getvalue())
+        self.assertEqual(self.search('images'), {self.scans})
+        self.assertEqual(self.search('scans'), set())
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_search_index', 'projects')
+
+class EventStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', password='password')
+        cls.other = User.objects.create_user('other', password='password')
+        cls.project = Project.objects.create(
+            name='Live', owner=cls.other, project_type='image_classification',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_broker_delivers_once_per_subscriber(self):
+        broker = InProcessBroker()
+        both = broker.subscribe([user_channel(1), project_channel(7)])
+        other = broker.subscribe([user_channel(2)])
+        # Публикация приходит из потока синхронного представления
+        thread = threading.Thread(
+            target=broker.publish, args=([user_channel(1), project_channel(7)], ('ping', '{}'))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(await both.get(1), ('ping', '{}'))
+        with self.assertRaises(asyncio.TimeoutError):
+            await both.get(0.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            await other.get(0.05)
+        both.close()
+        other.close()
+        self.assertEqual(broker.publish([user_channel(1)], ('ping', '{}')), 0)
+
+    async def test_slow_subscriber_drops_oldest(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(['feed'], maxsize=2)
+        for i in range(3):
+            broker.publish(['feed'], ('tick', str(i)))
+        await asyncio.sleep(0)
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual([(await subscription.get(1))[1] for _ in range(2)], ['1', '2'])
+
+    async def connect(self, **params):
+        request = AsyncRequestFactory().get('/events/', params)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+
+        request.auser = auser
+        return await views.events(request)
+
+    async def test_stream_pushes_notifications_after_commit(self):
+        response = await self.connect()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        await anext(content)
+        self.assertEqual(await anext(content), b'event: unread\ndata: 0\n\n')
+
+        def send():
+            with self.captureOnCommitCallbacks(execute=True):
+                notify([self.user.pk, self.other.pk], 'system', 'Deadline')
+
+        await sync_to_async(send)()
+        event, data = (await anext(content)).decode().split('\n')[:2]
+        self.assertEqual(event, 'event: notification')
+        self.assertEqual(json.loads(data[len('data: '):])['title'], 'Deadline')
+
+        # Обрыв соединения отменяет задачу, ждущую следующее событие, и снимает подписку
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(get_broker().publish([user_channel(self.user.pk)], ('ping', '{}')), 0)
+
+    async def test_project_queue_requires_access(self):
+        response = await self.connect(project=str(self.project.pk))
+        self.assertEqual(response.status_code, 403)
+        response = await self.connect(project='999999')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_annotation_status_reaches_project_queue(self):
+        subscription = get_broker().subscribe([project_channel(self.project.pk)])
+
+        def submit():
+            project_file = ProjectFile.objects.create(
+                project=self.project, file='files/live.png', filename='live.png',
+                file_type='image', file_size=1, uploaded_by=self.other,
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                annotation = Annotation.objects.create(
+                    project=self.project, file=project_file, annotator=self.other,
+                    annotation_data={'label': 'cat'}, status='draft',
+                )
+            with self.captureOnCommitCallbacks(execute=True):
+                annotation.status = 'submitted'
+                annotation.save()
+
+        await sync_to_async(submit)()
+        events = [await subscription.get(1) for _ in range(2)]
+        subscription.close()
+        self.assertEqual([event for event, _ in events], ['annotation_status'] * 2)
+        self.assertEqual(
+            [(json.loads(data)['previous'], json.loads(data)['status']) for _, data in events],
+            [(None, 'draft'), ('draft', 'submitted')],
+        )
@@ -9,5 +9,7 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('profile/', views.profile, name='profile'),
     path('notifications/', views.notifications, name='notifications'),
+    path('events/', views.events, name='events'),
     path('statistics/', views.statistics, name='statistics'),
+    path('statistics/timeseries/', views.statistics_timeseries, name='statistics_timeseries'),
 ]
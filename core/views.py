@@ -1,40 +1,36 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from projects.access import can_view, visible_projects
 from projects.models import Project
-from annotations.models import Annotation, AnnotationSession
+from annotations.models import Annotation, AnnotationDailyRollup, AnnotationSession
+from annotations.rollups import MAX_SERIES_DAYS, daily_series, status_summary
+from .dashboard import RECENT_DAYS, breakdown, get_dashboard_stats
 from .models import UserProfile, Notification
+from .notifications import inbox, mark_read, unread_count
+from .pubsub import get_broker, project_channel, user_channel
 from .forms import CustomUserCreationForm, UserProfileForm
 
 def home(request):
     """Главная страница"""
     if request.user.is_authenticated:
-        # Получаем статистику для авторизованного пользователя
-        user_projects = Project.objects.filter(
-            Q(owner=request.user) | Q(collaborators=request.user)
-        )
-        
-        recent_projects = user_projects.order_by('-created_at')[:5]
-        active_projects = user_projects.filter(status='active')
-        
-        # Статистика аннотаций
-        user_annotations = Annotation.objects.filter(annotator=request.user)
-        total_annotations = user_annotations.count()
-        approved_annotations = user_annotations.filter(status='approved').count()
+        # Счётчики пользователя (один запрос, далее из кеша)
+        stats = get_dashboard_stats(request.user)
         
-        # Непрочитанные уведомления
-        unread_notifications = Notification.objects.filter(
-            user=request.user, is_read=False
-        ).count()
+        recent_projects = visible_projects(request.user).order_by('-created_at')[:5]
         
         context = {
             'recent_projects': recent_projects,
-            'active_projects': active_projects,
-            'total_annotations': total_annotations,
-            'approved_annotations': approved_annotations,
-            'unread_notifications': unread_notifications,
+            'active_projects': stats['active_projects'],
+            'total_annotations': stats['total_annotations'],
+            'approved_annotations': stats['approved_annotations'],
+            'unread_notifications': unread_count(request.user),
         }
     else:
         context = {}
@@ -68,13 +64,15 @@ def dashboard(request):
     """Панель управления пользователя"""
     user = request.user
     
+    stats = get_dashboard_stats(user)
+    
     # Проекты пользователя
     owned_projects = Project.objects.filter(owner=user)
-    collaborated_projects = Project.objects.filter(collaborators=user)
     
-    # Статистика аннотаций
-    annotations = Annotation.objects.filter(annotator=user)
-    recent_annotations = annotations.order_by('-created_at')[:10]
+    # Последние аннотации
+    recent_annotations = Annotation.objects.filter(annotator=user).select_related(
+        'file', 'project'
+    ).order_by('-created_at')[:10]
     
     # Сессии аннотации
     recent_sessions = AnnotationSession.objects.filter(annotator=user).order_by('-started_at')[:5]
@@ -84,12 +82,13 @@ def dashboard(request):
     
     context = {
         'owned_projects': owned_projects,
-        'collaborated_projects': collaborated_projects,
+        'owned_projects_count': stats['owned_projects'],
+        'collaborated_projects_count': stats['collaborated_projects'],
         'recent_annotations': recent_annotations,
         'recent_sessions': recent_sessions,
         'notifications': notifications,
-        'total_annotations': annotations.count(),
-        'approved_annotations': annotations.filter(status='approved').count(),
+        'total_annotations': stats['total_annotations'],
+        'approved_annotations': stats['approved_annotations'],
     }
     
     return render(request, 'core/dashboard.html', context)
@@ -121,60 +120,120 @@ def profile(request):
 @login_required
 def notifications(request):
     """Страница уведомлений"""
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    
     if request.method == 'POST':
-        # Отметить уведомления как прочитанные
-        notification_ids = request.POST.getlist('mark_read')
+        # Отметить выбранные или все уведомления как прочитанные
+        if 'mark_all' in request.POST:
+            mark_read(request.user)
+            messages.success(request, 'All notifications marked as read!')
+            return redirect('notifications')
+        notification_ids = [pk for pk in request.POST.getlist('mark_read') if pk.isdigit()]
         if notification_ids:
-            Notification.objects.filter(
-                id__in=notification_ids, user=request.user
-            ).update(is_read=True)
+            mark_read(request.user, notification_ids)
             messages.success(request, 'Notifications marked as read!')
             return redirect('notifications')
     
+    unread_only = request.GET.get('unread') == '1'
+    # Страницы по ключу (created_at, id): глубина ленты не влияет на стоимость запроса
+    page = inbox(request.user, request.GET.get('cursor'), unread_only=unread_only)
+    
     context = {
-        'notifications': notifications,
+        'notifications': page,
+        'page_obj': page,
+        'unread_only': unread_only,
     }
     
     return render(request, 'core/notifications.html', context)
 
+def _sse(event, data):
+    return f'event: {event}\ndata: {data}\n\n'
+
+@login_required
+async def events(request):
+    """Поток Server-Sent Events: уведомления пользователя и очереди проектов из ?project="""
+    user = await request.auser()
+    channels = [user_channel(user.pk)]
+    for project_id in request.GET.getlist('project'):
+        project = None
+        if project_id.isdigit():
+            project = await Project.objects.filter(pk=project_id).only('pk', 'owner_id').afirst()
+        if project is None:
+            return JsonResponse({'success': False, 'error': 'Project not found'}, status=404)
+        if not await sync_to_async(can_view)(user, project):
+            return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+        channels.append(project_channel(project.pk))
+    unread = await sync_to_async(unread_count)(user)
+
+    async def stream():
+        # Подписка живёт, пока клиент подключён; при обрыве генератор закрывается и отписывается
+        subscription = get_broker().subscribe(channels)
+        try:
+            yield 'retry: 5000\n\n'
+            yield _sse('unread', unread)
+            while True:
+                try:
+                    event, data = await subscription.get(settings.EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Комментарий не даёт прокси закрыть простаивающее соединение
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse(event, data)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _series_days(request):
+    try:
+        days = int(request.GET.get('days', RECENT_DAYS))
+    except ValueError:
+        days = RECENT_DAYS
+    return min(max(days, 1), MAX_SERIES_DAYS)
+
 @login_required
 def statistics(request):
     """Страница статистики"""
     user = request.user
     
-    # Статистика проектов
-    projects = Project.objects.filter(
-        Q(owner=user) | Q(collaborators=user)
-    )
-    
-    # Статистика аннотаций
-    annotations = Annotation.objects.filter(annotator=user)
+    # Проекты: числа из кеша панели
+    stats = get_dashboard_stats(user)
     
-    # Статистика по типам проектов
-    project_types = projects.values('project_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Статистика по статусам аннотаций
-    annotation_statuses = annotations.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Временная статистика (последние 30 дней)
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_annotations = annotations.filter(created_at__gte=thirty_days_ago)
+    # Аннотации: только дневные агрегаты, стоимость зависит от числа дней, а не аннотаций
+    rollups = AnnotationDailyRollup.objects.filter(annotator=user)
+    annotation_statuses = status_summary(rollups, RECENT_DAYS)
+    days = _series_days(request)
     
     context = {
-        'total_projects': projects.count(),
-        'total_annotations': annotations.count(),
-        'recent_annotations': recent_annotations.count(),
-        'project_types': project_types,
+        'total_projects': stats['total_projects'],
+        'total_annotations': sum(row['count'] for row in annotation_statuses),
+        'recent_annotations': sum(row['recent'] for row in annotation_statuses),
+        'project_types': breakdown(stats['project_types'], 'project_type'),
         'annotation_statuses': annotation_statuses,
+        'days': days,
+        'daily_annotations': daily_series(rollups, days),
     }
     
     return render(request, 'core/statistics.html', context)
+
+@login_required
+def statistics_timeseries(request):
+    """Дневной ряд аннотаций по статусам для графиков (свои или всего проекта)"""
+    rollups = AnnotationDailyRollup.objects.filter(annotator=request.user)
+    
+    project_id = request.GET.get('project')
+    if project_id:
+        project = Project.objects.filter(pk=project_id).first() if project_id.isdigit() else None
+        if project is None or not can_view(request.user, project):
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+        rollups = AnnotationDailyRollup.objects.filter(project=project)
+    
+    series = daily_series(rollups, _series_days(request), by_status=True)
+    return JsonResponse({
+        'success': True,
+        'series': [
+            {'day': row['day'].isoformat(), 'status': row['status'], 'count': row['count']}
+            for row in series
+        ],
+    })
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Q, Value
+
+from .models import Project
+
+Membership = Project.collaborators.through
+
+
+def _cache_key(user_id):
+    return f'projects:access:{user_id}'
+
+
+def get_membership(user):
+    """Индекс доступа пользователя: (id своих проектов, id проектов, где он участник)"""
+    if not user.is_authenticated:
+        return frozenset(), frozenset()
+
+    # Без общего кеша (PROJECT_ACCESS_CACHE_TIMEOUT = 0) индекс читается из базы каждый раз
+    timeout = settings.PROJECT_ACCESS_CACHE_TIMEOUT
+    key = _cache_key(user.pk)
+    membership = cache.get(key) if timeout else None
+    if membership is None:
+        # Одним запросом по индексам owner_id и user_id таблицы участников
+        rows = Project.objects.filter(owner=user).order_by().annotate(
+            owned=Value(True, output_field=BooleanField())
+        ).values_list('pk', 'owned').union(
+            Membership.objects.filter(user=user).annotate(
+                owned=Value(False, output_field=BooleanField())
+            ).values_list('project_id', 'owned')
+        )
+        owned, shared = set(), set()
+        for project_id, is_owner in rows:
+            (owned if is_owner else shared).add(project_id)
+        membership = (frozenset(owned), frozenset(shared - owned))
+        if timeout:
+            cache.set(key, membership, timeout)
+    return membership
+
+
+def invalidate_membership(*user_ids):
+    """Сбрасывает кеш доступа пользователей после изменения состава проектов"""
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids if user_id])
+
+
+def can_view(user, project):
+    """Владелец или участник проекта"""
+    if not user.is_authenticated:
+        return False
+    if project.owner_id == user.pk:
+        return True
+    owned, shared = get_membership(user)
+    return project.pk in owned or project.pk in shared
+
+
+def can_edit(user, project):
+    """Изменять настройки и состав проекта может только владелец"""
+    return user.is_authenticated and project.owner_id == user.pk
+
+
+def visible_projects(user):
+    """Проекты пользователя одним запросом без дублирующих строк от JOIN"""
+    if not user.is_authenticated:
+        return Project.objects.none()
+    return Project.objects.filter(
+        Q(owner=user) | Q(pk__in=Membership.objects.filter(user=user).values('project_id'))
+    )
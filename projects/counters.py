@@ -0,0 +1,89 @@
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Project, ProjectFile
+
+# Статусы аннотаций, которые считаются выполненной разметкой файла
+COUNTED_ANNOTATION_STATUSES = ('submitted', 'approved')
+
+
+def file_added(project_id, count=1):
+    """Увеличивает число файлов проекта"""
+    Project.objects.filter(pk=project_id).update(total_files=F('total_files') + count)
+
+
+def file_removed(project_id, count=1):
+    """Уменьшает число файлов проекта"""
+    Project.objects.filter(pk=project_id).update(total_files=F('total_files') - count)
+
+
+def annotation_counted(file_id, project_id, delta):
+    """Учитывает переход аннотации в выполненный статус (delta=1) или обратно (delta=-1)"""
+    ProjectFile.objects.filter(pk=file_id).update(annotation_count=F('annotation_count') + delta)
+
+    # Флаг файла переключается условным UPDATE, поэтому счётчик проекта
+    # меняется ровно один раз даже при параллельных изменениях
+    if delta > 0:
+        flipped = ProjectFile.objects.filter(
+            pk=file_id, is_annotated=False, annotation_count__gt=0
+        ).update(is_annotated=True)
+    else:
+        flipped = -ProjectFile.objects.filter(
+            pk=file_id, is_annotated=True, annotation_count__lte=0
+        ).update(is_annotated=False)
+
+    if flipped:
+        Project.objects.filter(pk=project_id).update(annotated_files=F('annotated_files') + flipped)
+
+
+def annotations_counted(project_id, file_deltas):
+    """Пакетный вариант annotation_counted для файлов одного проекта: {file_id: delta}"""
+    by_delta = {}
+    for file_id, delta in file_deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(file_id)
+    if not by_delta:
+        return
+
+    for delta, file_ids in by_delta.items():
+        ProjectFile.objects.filter(pk__in=file_ids).update(annotation_count=F('annotation_count') + delta)
+
+    raised = [file_id for delta, file_ids in by_delta.items() if delta > 0 for file_id in file_ids]
+    lowered = [file_id for delta, file_ids in by_delta.items() if delta < 0 for file_id in file_ids]
+    flipped = 0
+    if raised:
+        flipped += ProjectFile.objects.filter(
+            pk__in=raised, is_annotated=False, annotation_count__gt=0
+        ).update(is_annotated=True)
+    if lowered:
+        flipped -= ProjectFile.objects.filter(
+            pk__in=lowered, is_annotated=True, annotation_count__lte=0
+        ).update(is_annotated=False)
+    if flipped:
+        Project.objects.filter(pk=project_id).update(annotated_files=F('annotated_files') + flipped)
+
+
+def review_score_changed(projects, old_score=None, new_score=None):
+    """Пересчитывает среднюю оценку качества проекта по сумме и числу обзоров"""
+    if old_score is None and new_score is None:
+        return
+    count_delta = (new_score is not None) - (old_score is not None)
+    score_delta = (new_score or 0.0) - (old_score or 0.0)
+    review_scores_added(projects, score_delta, count_delta)
+
+
+def review_scores_added(projects, score_delta, count_delta):
+    """Добавляет к проектам сумму оценок и число обзоров (например, после пакетного обзора)"""
+    # В SET правые части вычисляются по старым значениям строки,
+    # поэтому среднее считается от уже обновлённых суммы и количества
+    total = F('quality_score_total') + score_delta
+    count = F('quality_review_count') + count_delta
+    projects.update(
+        quality_score_total=total,
+        quality_review_count=count,
+        quality_score=Case(
+            When(quality_review_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(total, FloatField()) / Cast(count, FloatField()),
+            output_field=FloatField(),
+        ),
+    )
@@ -0,0 +1,84 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .filetypes import EXTENSION_TYPES, hash_and_sniff
+from .workers import get_executor
+
+# Фиксированные размеры производных изображений (по длинной стороне)
+DERIVATIVE_SIZES = {
+    'thumb': 256,
+    'preview': 1024,
+}
+DERIVATIVE_QUALITY = 80
+
+
+def derivative_name(sha256, kind):
+    """Имя производного файла определяется содержимым и размером"""
+    size = DERIVATIVE_SIZES[kind]
+    return f'derivatives/{sha256[:2]}/{sha256[2:4]}/{sha256}_{size}.webp'
+
+
+def render_derivative(source_path, target_path, size):
+    """Рендерит уменьшенную WebP-копию изображения (выполняется в дочернем процессе)"""
+    if os.path.exists(target_path):
+        return target_path
+
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size, size))  # JPEG декодируется сразу в уменьшенном масштабе
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Запись во временный файл и переименование: читатели не увидят недописанный файл
+        tmp_path = f'{target_path}.{os.getpid()}.tmp'
+        image.save(tmp_path, 'WEBP', quality=DERIVATIVE_QUALITY, method=4)
+    os.replace(tmp_path, target_path)
+    return target_path
+
+
+def _ensure_sha256(project_file):
+    if not project_file.sha256:
+        sha256, _ = hash_and_sniff(project_file.file.path)
+        type(project_file).objects.filter(pk=project_file.pk).update(sha256=sha256)
+        project_file.sha256 = sha256
+    return project_file.sha256
+
+
+def get_derivative_path(project_file, kind, timeout=None):
+    """Путь к производному файлу; при отсутствии он рендерится в пуле процессов"""
+    sha256 = _ensure_sha256(project_file)
+    target_path = default_storage.path(derivative_name(sha256, kind))
+    if not os.path.exists(target_path):
+        future = get_executor().submit(
+            render_derivative, project_file.file.path, target_path, DERIVATIVE_SIZES[kind]
+        )
+        future.result(timeout=timeout or settings.DERIVATIVE_RENDER_TIMEOUT)
+    return target_path
+
+
+def pregenerate(items, executor=None):
+    """Ставит рендеринг всех размеров в очередь для пар (путь к исходнику, sha256)"""
+    executor = executor or get_executor()
+    futures = []
+    for source_path, sha256 in items:
+        for kind, size in DERIVATIVE_SIZES.items():
+            target_path = default_storage.path(derivative_name(sha256, kind))
+            if not os.path.exists(target_path):
+                futures.append(executor.submit(render_derivative, source_path, target_path, size))
+    return futures
+
+
+def is_image(project_file):
+    extension = os.path.splitext(project_file.filename)[1].lower()
+    return project_file.file_type == 'image' or EXTENSION_TYPES.get(extension) == 'image'
+
+
+def schedule_for(project_file):
+    """Фоновая подготовка производных для только что загруженного изображения"""
+    if is_image(project_file) and project_file.sha256:
+        pregenerate([(project_file.file.path, project_file.sha256)])
@@ -0,0 +1,165 @@
+import csv
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from asgiref.sync import sync_to_async
+
+from annotations.models import Annotation
+
+# Размер пачки для серверного курсора: память не растёт с размером проекта
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = ['id', 'file_id', 'filename', 'annotator', 'status', 'annotation_data']
+METADATA_FIELDS = [
+    'file_type', 'file_size', 'quality_score', 'annotator_notes', 'reviewer_notes',
+    'created_at', 'updated_at', 'submitted_at', 'reviewed_at',
+]
+
+CONTENT_TYPES = {
+    'json': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'xml': 'application/xml',
+}
+
+FILE_EXTENSIONS = {
+    'json': 'jsonl',
+    'csv': 'csv',
+    'xml': 'xml',
+}
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def iter_annotation_rows(project, include_metadata=True, chunk_size=EXPORT_CHUNK_SIZE):
+    """Построчно обходит аннотации проекта пачками фиксированного размера"""
+    columns = [
+        'id', 'file_id', 'file__filename', 'annotator__username', 'status', 'annotation_data',
+    ]
+    if include_metadata:
+        columns += [
+            'file__file_type', 'file__file_size', 'quality_score', 'annotator_notes',
+            'reviewer_notes', 'created_at', 'updated_at', 'submitted_at', 'reviewed_at',
+        ]
+
+    # values() + iterator() не создают экземпляры моделей и не кешируют QuerySet;
+    # на PostgreSQL iterator() использует серверный курсор
+    queryset = (
+        Annotation.objects.filter(project=project)
+        .order_by('id')
+        .values(*columns)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    for values in queryset:
+        row = {
+            'id': values['id'],
+            'file_id': values['file_id'],
+            'filename': values['file__filename'],
+            'annotator': values['annotator__username'],
+            'status': values['status'],
+            'annotation_data': values['annotation_data'],
+        }
+        if include_metadata:
+            row.update({
+                'file_type': values['file__file_type'],
+                'file_size': values['file__file_size'],
+                'quality_score': values['quality_score'],
+                'annotator_notes': values['annotator_notes'],
+                'reviewer_notes': values['reviewer_notes'],
+                'created_at': _isoformat(values['created_at']),
+                'updated_at': _isoformat(values['updated_at']),
+                'submitted_at': _isoformat(values['submitted_at']),
+                'reviewed_at': _isoformat(values['reviewed_at']),
+            })
+        yield row
+
+
+def _buffered(lines, buffer_size=EXPORT_CHUNK_SIZE):
+    """Склеивает строки в блоки, чтобы не отдавать ответ по одной строке"""
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= buffer_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(row[field], ensure_ascii=False) if field == 'annotation_data' else row[field]
+            for field in fields
+        ])
+
+
+def _xml_lines(rows, project):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<project id="{project.pk}" name={quoteattr(project.name)}>\n'
+    for row in rows:
+        parts = ['  <annotation>']
+        for field, value in row.items():
+            if field == 'annotation_data':
+                value = json.dumps(value, ensure_ascii=False)
+            text = '' if value is None else escape(str(value))
+            parts.append(f'<{field}>{text}</{field}>')
+        parts.append('</annotation>\n')
+        yield ''.join(parts)
+    yield '</project>\n'
+
+
+def get_export_format(settings, requested=None):
+    """Определяет формат экспорта по запросу и настройкам проекта"""
+    export_format = requested or (settings.export_format if settings else 'json')
+    # YOLO/COCO пока выгружаются как JSONL с полными данными аннотации
+    if export_format not in CONTENT_TYPES:
+        export_format = 'json'
+    return export_format
+
+
+def stream_project_export(project, export_format, include_metadata=True):
+    """Генератор блоков экспорта проекта в заданном формате"""
+    rows = iter_annotation_rows(project, include_metadata=include_metadata)
+
+    if export_format == 'csv':
+        fields = EXPORT_FIELDS + (METADATA_FIELDS if include_metadata else [])
+        lines = _csv_lines(rows, fields)
+    elif export_format == 'xml':
+        lines = _xml_lines(rows, project)
+    else:
+        lines = _jsonl_lines(rows)
+
+    return _buffered(lines)
+
+
+async def astream_project_export(project, export_format, include_metadata=True):
+    """Асинхронный генератор блоков экспорта для ASGI
+
+    Синхронный итератор ASGI-обработчик Django собирает в список до отправки первого
+    байта; здесь каждый блок читается отдельным вызовом в потоке соединения с БД.
+    """
+    chunks = stream_project_export(project, export_format, include_metadata=include_metadata)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Курсор закрывается в том же потоке, где был открыт
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,80 @@
+import codecs
+import hashlib
+import os
+
+# Сигнатуры (magic bytes) поддерживаемых форматов
+MAGIC_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image'),  # JPEG
+    (b'\x89PNG\r\n\x1a\n', 'image'),
+    (b'GIF87a', 'image'),
+    (b'GIF89a', 'image'),
+    (b'BM', 'image'),
+    (b'II*\x00', 'image'),  # TIFF little-endian
+    (b'MM\x00*', 'image'),  # TIFF big-endian
+    (b'%PDF', 'document'),
+    (b'\xd0\xcf\x11\xe0', 'document'),  # DOC (OLE)
+    (b'PK\x03\x04', 'document'),  # DOCX (zip)
+    (b'ID3', 'audio'),
+    (b'OggS', 'audio'),
+    (b'fLaC', 'audio'),
+    (b'\x1a\x45\xdf\xa3', 'video'),  # Matroska / WebM
+]
+
+EXTENSION_TYPES = {
+    '.jpg': 'image', '.jpeg': 'image', '.png': 'image', '.gif': 'image',
+    '.bmp': 'image', '.tiff': 'image', '.tif': 'image', '.webp': 'image',
+    '.txt': 'text', '.csv': 'text', '.json': 'text', '.jsonl': 'text', '.xml': 'text',
+    '.pdf': 'document', '.doc': 'document', '.docx': 'document',
+    '.mp3': 'audio', '.wav': 'audio', '.flac': 'audio', '.ogg': 'audio',
+    '.mp4': 'video', '.mov': 'video', '.avi': 'video', '.mkv': 'video', '.webm': 'video',
+}
+
+# Сколько байт читать для определения типа
+SNIFF_SIZE = 512
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sniff_file_type(header, filename=''):
+    """Определяет тип файла по сигнатуре, а при её отсутствии по расширению"""
+    for signature, file_type in MAGIC_SIGNATURES:
+        if header.startswith(signature):
+            return file_type
+    if header[:4] == b'RIFF' and header[8:12] in (b'WAVE', b'AVI '):
+        return 'audio' if header[8:12] == b'WAVE' else 'video'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image'
+    if header[4:8] == b'ftyp':
+        return 'video'
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in EXTENSION_TYPES:
+        return EXTENSION_TYPES[extension]
+
+    # Текст без нулевых байт считаем текстовым файлом
+    if header and b'\x00' not in header:
+        try:
+            # Последний символ заголовка может быть обрезан посередине
+            codecs.getincrementaldecoder('utf-8')().decode(header, final=False)
+            return 'text'
+        except UnicodeDecodeError:
+            pass
+    return 'document'
+
+
+def hash_and_sniff(path):
+    """Считает SHA-256 и определяет тип файла за один проход чтения"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        header = f.read(SNIFF_SIZE)
+        digest.update(header)
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest(), sniff_file_type(header, path)
+
+
+def sniff_upload(content, filename=''):
+    """Тип загружаемого файла по первым байтам без чтения всего содержимого"""
+    content.seek(0)
+    header = content.read(SNIFF_SIZE)
+    content.seek(0)
+    return sniff_file_type(header, filename or content.name)
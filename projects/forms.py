@@ -1,6 +1,14 @@
 from django import forms
+import os
 from .models import Project, ProjectFile
 
+# Поддерживаемые расширения загружаемых файлов
+ALLOWED_EXTENSIONS = [
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff',  # Изображения
+    '.txt', '.csv', '.json', '.xml',  # Текстовые файлы
+    '.pdf', '.doc', '.docx'  # Документы
+]
+
 class ProjectForm(forms.ModelForm):
     """Форма для создания и редактирования проекта"""
     
@@ -75,18 +83,11 @@ class ProjectFileForm(forms.ModelForm):
                 raise forms.ValidationError('File size must be under 10MB.')
             
             # Проверяем расширение файла
-            allowed_extensions = [
-                '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff',  # Изображения
-                '.txt', '.csv', '.json', '.xml',  # Текстовые файлы
-                '.pdf', '.doc', '.docx'  # Документы
-            ]
-            
-            import os
             file_extension = os.path.splitext(file.name)[1].lower()
-            if file_extension not in allowed_extensions:
+            if file_extension not in ALLOWED_EXTENSIONS:
                 raise forms.ValidationError(
                     f'File type {file_extension} is not supported. '
-                    f'Allowed types: {", ".join(allowed_extensions)}'
+                    f'Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
                 )
         
         return file
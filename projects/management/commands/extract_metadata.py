@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from projects.metadata import METADATA_FIELDS, apply_metadata, extract_metadata
+from projects.models import ProjectFile
+
+
+def _extract(entry):
+    path, filename = entry
+    try:
+        return extract_metadata(path, filename)
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Extract file type and content metadata for files that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Only process files of this project')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Re-extract metadata for already processed files')
+
+    def handle(self, *args, **options):
+        files = ProjectFile.objects.order_by('pk').only('pk', 'file', 'filename')
+        if options['project']:
+            files = files.filter(project_id=options['project'])
+        if not options['all']:
+            files = files.filter(metadata_extracted_at__isnull=True)
+
+        batch_size = options['batch_size']
+        processed = missing = 0
+        last_id = 0
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(files.filter(pk__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].pk
+
+                chunksize = max(1, len(batch) // (options['workers'] * 4))
+                results = executor.map(
+                    _extract, [(f.file.path, f.filename) for f in batch], chunksize=chunksize
+                )
+                updated = []
+                for project_file, data in zip(batch, results):
+                    if data is None:
+                        missing += 1
+                        continue
+                    updated.append(apply_metadata(project_file, data))
+                ProjectFile.objects.bulk_update(updated, METADATA_FIELDS, batch_size=batch_size)
+
+                processed += len(updated)
+                self.stdout.write(f'Processed {processed} file(s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted metadata for {processed} file(s), {missing} file(s) missing on disk'
+        ))
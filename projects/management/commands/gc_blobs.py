@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from projects.models import Blob
+from projects.storage import collect_blobs
+
+
+class Command(BaseCommand):
+    help = 'Recount references to shared file blobs and delete unreferenced ones'
+
+    def handle(self, *args, **options):
+        drifted = Blob.objects.annotate(references=Count('project_files')).exclude(
+            ref_count=F('references')
+        )
+        fixed = 0
+        for blob_id, references in drifted.values_list('pk', 'references').iterator():
+            Blob.objects.filter(pk=blob_id).update(ref_count=references)
+            fixed += 1
+
+        with transaction.atomic():
+            removed = collect_blobs()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed {fixed} reference count(s), removed {removed} unreferenced blob(s)'
+        ))
@@ -0,0 +1,221 @@
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.search import index_objects
+from projects.filetypes import hash_and_sniff
+from projects.models import Blob, Project, ProjectFile, blob_file_path
+from projects.derivatives import pregenerate
+from projects.metadata import extract_metadata
+from projects.storage import add_blob_references
+
+
+def iter_source(source):
+    """Файлы каталога в детерминированном порядке или строки манифеста"""
+    if os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            # Сортировка нужна, чтобы продолжение по контрольной точке было корректным
+            dirnames.sort()
+            for filename in sorted(filenames):
+                yield os.path.join(dirpath, filename)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding='utf-8') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield os.path.join(base_dir, line)
+
+
+def inspect_file(path):
+    """Обработка одного файла в дочернем процессе: хеш, размер и метаданные; None для нечитаемого"""
+    try:
+        sha256, _ = hash_and_sniff(path)
+        return sha256, os.path.getsize(path), extract_metadata(path)
+    except Exception:
+        # Один плохой файл не должен прерывать executor.map всей пачки
+        return None
+
+
+def store_blob_file(entry):
+    """Копирует новое содержимое в хранилище блобов в дочернем процессе"""
+    source_path, storage_name = entry
+    with open(source_path, 'rb') as f:
+        return default_storage.save(storage_name, File(f))
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import a directory or a manifest of file paths into a project'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int, help='Project id')
+        parser.add_argument('source', help='Directory to walk or manifest file with one path per line')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--uploaded-by', help='Username recorded as uploader (defaults to project owner)')
+        parser.add_argument(
+            '--checkpoint',
+            help='Checkpoint file used to resume an interrupted run '
+                 '(defaults to .ingest_<project>.checkpoint next to the source)',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project']} does not exist")
+
+        source = os.path.abspath(options['source'])
+        if not os.path.exists(source):
+            raise CommandError(f'Source {source} does not exist')
+
+        if options['uploaded_by']:
+            try:
+                uploader = User.objects.get(username=options['uploaded_by'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['uploaded_by']} does not exist")
+        else:
+            uploader = project.owner
+
+        checkpoint_path = options['checkpoint'] or os.path.join(
+            os.path.dirname(source.rstrip(os.sep)), f'.ingest_{project.pk}.checkpoint'
+        )
+        processed = 0 if options['restart'] else self._read_checkpoint(checkpoint_path, source, project)
+        if processed:
+            self.stdout.write(f'Resuming after {processed} file(s) from {checkpoint_path}')
+
+        batch_size = options['batch_size']
+        entries = itertools.islice(iter_source(source), processed, None)
+
+        # Дочерние процессы не должны наследовать открытые соединения с БД
+        connections.close_all()
+
+        created = skipped = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(itertools.islice(entries, batch_size))
+                if not batch:
+                    break
+
+                chunksize = max(1, len(batch) // (options['workers'] * 4))
+                results = list(executor.map(inspect_file, batch, chunksize=chunksize))
+                paths, inspected = [], []
+                for path, result in zip(batch, results):
+                    if result is None:
+                        skipped += 1
+                        self.stderr.write(f'Skipped unreadable file {path}')
+                    else:
+                        paths.append(path)
+                        inspected.append(result)
+                batch_hashes = [sha256 for sha256, _, _ in inspected]
+                extracted_at = timezone.now()
+
+                # Копируем только содержимое, которого ещё нет в хранилище
+                known = set(Blob.objects.filter(sha256__in=batch_hashes).values_list('sha256', flat=True))
+                new_blobs = {}
+                for path, (sha256, size, _) in zip(paths, inspected):
+                    if sha256 not in known and sha256 not in new_blobs:
+                        new_blobs[sha256] = (path, size)
+                stored_names = list(executor.map(
+                    store_blob_file,
+                    [(path, blob_file_path(Blob(sha256=sha256), '')) for sha256, (path, _) in new_blobs.items()],
+                ))
+
+                # До фиксации пачка отмечается как незавершённая: при продолжении по её отметке
+                # времени видно, успела ли она записаться, и она не загружается повторно
+                self._write_checkpoint(
+                    checkpoint_path, source, processed,
+                    pending={'processed': processed + len(batch), 'extracted_at': extracted_at.isoformat()},
+                )
+                with transaction.atomic():
+                    Blob.objects.bulk_create(
+                        [
+                            Blob(sha256=sha256, file=name, size=size)
+                            for (sha256, (_, size)), name in zip(new_blobs.items(), stored_names)
+                        ],
+                        ignore_conflicts=True,
+                    )
+                    add_blob_references(batch_hashes)
+                    blobs = {
+                        sha256: (blob_id, name)
+                        for sha256, blob_id, name in Blob.objects.filter(
+                            sha256__in=batch_hashes
+                        ).values_list('sha256', 'pk', 'file')
+                    }
+                    files = [
+                        ProjectFile(
+                            project=project,
+                            file=blobs[sha256][1],
+                            blob_id=blobs[sha256][0],
+                            filename=os.path.basename(path),
+                            file_size=size,
+                            sha256=sha256,
+                            uploaded_by=uploader,
+                            metadata_extracted_at=extracted_at,
+                            **metadata,
+                        )
+                        for path, (sha256, size, metadata) in zip(paths, inspected)
+                    ]
+                    ProjectFile.objects.bulk_create(files, batch_size=batch_size)
+                    # Счётчик проекта сдвигается вместе с пачкой: прерванный запуск его не теряет
+                    Project.objects.filter(pk=project.pk).update(total_files=F('total_files') + len(files))
+                    # bulk_create не отправляет post_save, индекс поиска пополняется явно
+                    index_objects('file', files)
+
+                # Превью новых изображений рендерятся в том же пуле, пока идёт следующая пачка
+                pregenerate(
+                    [
+                        (default_storage.path(blobs[sha256][1]), sha256)
+                        for sha256, _, metadata in inspected
+                        if metadata['file_type'] == 'image' and sha256 in new_blobs
+                    ],
+                    executor=executor,
+                )
+
+                processed += len(batch)
+                created += len(files)
+                self._write_checkpoint(checkpoint_path, source, processed)
+                self.stdout.write(f'Ingested {processed} file(s)')
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {created} file(s) into "{project.name}", skipped {skipped} unreadable file(s)'
+        ))
+
+    def _read_checkpoint(self, path, source, project):
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('source') != source:
+            raise CommandError(f'Checkpoint {path} belongs to another source; use --restart')
+        pending = checkpoint.get('pending')
+        if pending and ProjectFile.objects.filter(
+            project=project, metadata_extracted_at=datetime.fromisoformat(pending['extracted_at'])
+        ).exists():
+            # Запуск прервался между фиксацией пачки и записью контрольной точки
+            return pending['processed']
+        return checkpoint.get('processed', 0)
+
+    def _write_checkpoint(self, path, source, processed, pending=None):
+        # Атомарная замена, чтобы прерывание не оставило повреждённый файл
+        tmp_path = f'{path}.tmp'
+        checkpoint = {'source': source, 'processed': processed}
+        if pending:
+            checkpoint['pending'] = pending
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
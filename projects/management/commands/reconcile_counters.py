@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from annotations.models import QualityReview
+from projects.counters import COUNTED_ANNOTATION_STATUSES
+from projects.models import Project, ProjectFile
+
+
+COUNTER_FIELDS = ['total_files', 'annotated_files', 'quality_review_count', 'quality_score_total', 'quality_score']
+
+
+def _subquery_count(queryset, field):
+    return Coalesce(
+        Subquery(queryset.values(field).annotate(n=Count('pk')).values('n')[:1]),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute project and file counters from source rows to correct drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help='Projects to reconcile (default: all)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        projects = Project.objects.order_by('pk')
+        if options['project_ids']:
+            projects = projects.filter(pk__in=options['project_ids'])
+
+        batch_size = options['batch_size']
+        fixed_files = fixed_projects = 0
+        last_id = 0
+        while True:
+            ids = list(projects.filter(pk__gt=last_id).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                fixed_files += self._reconcile_files(ids)
+                fixed_projects += self._reconcile_projects(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed {fixed_files} file(s) and {fixed_projects} project(s)'
+        ))
+
+    def _reconcile_files(self, project_ids):
+        # Исправляем только файлы, у которых счётчик разошёлся с аннотациями
+        drifted = (
+            ProjectFile.objects.filter(project_id__in=project_ids)
+            .annotate(
+                actual=Count(
+                    'annotations',
+                    filter=Q(annotations__status__in=COUNTED_ANNOTATION_STATUSES),
+                    distinct=True,
+                ),
+                actual_leases=Count('leases', distinct=True),
+            )
+            .filter(
+                ~Q(annotation_count=F('actual'))
+                | ~Q(lease_count=F('actual_leases'))
+                | Q(is_annotated=True, actual=0)
+                | Q(is_annotated=False, actual__gt=0)
+            )
+            .only('pk', 'annotation_count', 'is_annotated', 'lease_count')
+        )
+        files = []
+        for project_file in drifted:
+            project_file.annotation_count = project_file.actual
+            project_file.is_annotated = project_file.actual > 0
+            project_file.lease_count = project_file.actual_leases
+            files.append(project_file)
+        ProjectFile.objects.bulk_update(
+            files, ['annotation_count', 'is_annotated', 'lease_count'], batch_size=1000
+        )
+        return len(files)
+
+    def _reconcile_projects(self, project_ids):
+        files = ProjectFile.objects.filter(project=OuterRef('pk')).order_by()
+        reviews = QualityReview.objects.filter(annotation__project=OuterRef('pk')).order_by()
+        actual = Project.objects.filter(pk__in=project_ids).annotate(
+            actual_total_files=_subquery_count(files, 'project'),
+            actual_annotated_files=_subquery_count(files.filter(is_annotated=True), 'project'),
+            actual_review_count=_subquery_count(reviews, 'annotation__project'),
+            actual_score_total=Coalesce(
+                Subquery(
+                    reviews.values('annotation__project')
+                    .annotate(total=Sum('overall_score'))
+                    .values('total')[:1]
+                ),
+                Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+
+        projects = []
+        for project in actual:
+            score = project.actual_score_total / project.actual_review_count if project.actual_review_count else 0.0
+            values = {
+                'total_files': project.actual_total_files,
+                'annotated_files': project.actual_annotated_files,
+                'quality_review_count': project.actual_review_count,
+                'quality_score_total': project.actual_score_total,
+                'quality_score': score,
+            }
+            # Суммы с плавающей точкой сравниваем с допуском
+            if any(abs(getattr(project, field) - value) > 1e-9 for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(project, field, value)
+                projects.append(project)
+        if projects:
+            Project.objects.bulk_update(projects, COUNTER_FIELDS, batch_size=500)
+        return len(projects)
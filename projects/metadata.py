@@ -0,0 +1,104 @@
+import codecs
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from PIL import Image
+
+from .filetypes import HASH_BLOCK_SIZE, SNIFF_SIZE, sniff_file_type
+from .workers import get_executor
+
+METADATA_FIELDS = [
+    'file_type', 'width', 'height', 'image_mode', 'char_count', 'line_count',
+    'captured_at', 'metadata_extracted_at',
+]
+
+# EXIF: DateTimeOriginal в Exif IFD и DateTime в основном IFD
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+
+def _parse_exif_datetime(value):
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        return None
+
+
+def _image_metadata(path):
+    # Image.open читает только заголовок, пиксели не декодируются
+    with Image.open(path) as image:
+        exif = image.getexif()
+        taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        return {
+            'width': image.width,
+            'height': image.height,
+            'image_mode': image.mode,
+            'captured_at': _parse_exif_datetime(taken) if taken else None,
+        }
+
+
+def _text_metadata(path):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    chars = lines = 0
+    last = b''
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            chars += len(decoder.decode(block))
+            lines += block.count(b'\n')
+            last = block
+    chars += len(decoder.decode(b'', final=True))
+    # Последняя строка без перевода строки тоже считается
+    if last and not last.endswith(b'\n'):
+        lines += 1
+    return {'char_count': chars, 'line_count': lines}
+
+
+def extract_metadata(path, filename=''):
+    """Дешёвые метаданные файла: тип по сигнатуре, размеры изображения, объём текста"""
+    with open(path, 'rb') as f:
+        header = f.read(SNIFF_SIZE)
+    file_type = sniff_file_type(header, filename or path)
+
+    data = {'file_type': file_type}
+    try:
+        if file_type == 'image':
+            data.update(_image_metadata(path))
+        elif file_type == 'text':
+            data.update(_text_metadata(path))
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        # Повреждённый или слишком большой для распаковки файл: тип известен, остальные поля пустые
+        pass
+    return data
+
+
+def apply_metadata(project_file, data):
+    """Переносит извлечённые значения в поля модели"""
+    for field, value in data.items():
+        setattr(project_file, field, value)
+    project_file.metadata_extracted_at = timezone.now()
+    return project_file
+
+
+def _save_metadata(file_id, future):
+    from .models import ProjectFile
+
+    # Колбэк выполняется в служебном потоке пула со своим соединением с БД
+    close_old_connections()
+    try:
+        data = future.result()
+    except Exception:
+        return
+    try:
+        data['metadata_extracted_at'] = timezone.now()
+        ProjectFile.objects.filter(pk=file_id).update(**data)
+    finally:
+        connection.close()
+
+
+def schedule_extraction(project_file):
+    """Извлекает метаданные в пуле процессов и сохраняет их по готовности"""
+    future = get_executor().submit(extract_metadata, project_file.file.path, project_file.filename)
+    future.add_done_callback(lambda f, file_id=project_file.pk: _save_metadata(file_id, f))
+    return future
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_visibility_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectfile',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:51
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Exists, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+# Статусы, которые считаются в счётчиках (projects.counters.COUNTED_ANNOTATION_STATUSES)
+COUNTED_ANNOTATION_STATUSES = ('submitted', 'approved')
+
+
+def _aggregate(queryset, group, value, output_field):
+    # Значение по группе подзапросом; у пустой группы — ноль
+    return Coalesce(
+        Subquery(queryset.values(group).annotate(value=value).values('value')[:1]),
+        Value(0), output_field=output_field,
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    """Заполняет счётчики существующих файлов и проектов, которые дальше сдвигаются через F()"""
+    Project = apps.get_model('projects', 'Project')
+    ProjectFile = apps.get_model('projects', 'ProjectFile')
+    Annotation = apps.get_model('annotations', 'Annotation')
+    QualityReview = apps.get_model('annotations', 'QualityReview')
+
+    counted = Annotation.objects.filter(file=OuterRef('pk'), status__in=COUNTED_ANNOTATION_STATUSES).order_by()
+    ProjectFile.objects.update(
+        annotation_count=_aggregate(counted, 'file', Count('pk'), IntegerField()),
+        is_annotated=Exists(counted),
+    )
+    files = ProjectFile.objects.filter(project=OuterRef('pk')).order_by()
+    reviews = QualityReview.objects.filter(annotation__project=OuterRef('pk')).order_by()
+    Project.objects.update(
+        total_files=_aggregate(files, 'project', Count('pk'), IntegerField()),
+        annotated_files=_aggregate(files.filter(is_annotated=True), 'project', Count('pk'), IntegerField()),
+        quality_review_count=_aggregate(reviews, 'annotation__project', Count('pk'), IntegerField()),
+        quality_score_total=_aggregate(reviews, 'annotation__project', Sum('overall_score'), FloatField()),
+    )
+    # Средняя оценка — отношение накопленных сумм, как в projects.counters
+    Project.objects.update(quality_score=Case(
+        When(quality_review_count=0, then=Value(0.0)),
+        default=Cast('quality_score_total', FloatField()) / Cast('quality_review_count', FloatField()),
+        output_field=FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_blob_storage'),
+        ('annotations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='quality_review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='quality_score_total',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
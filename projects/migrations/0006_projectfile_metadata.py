@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_project_quality_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectfile',
+            name='captured_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='char_count',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='image_mode',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='line_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='metadata_extracted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectfile',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_projectfile_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectfile',
+            name='lease_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_projectfile_lease_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectfile',
+            index=models.Index(fields=['project', 'is_annotated'], name='projects_pr_project_a886ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectfile',
+            index=models.Index(fields=['project', 'uploaded_at'], name='projects_pr_project_01c624_idx'),
+        ),
+    ]
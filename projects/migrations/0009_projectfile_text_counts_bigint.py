@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_projectfile_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectfile',
+            name='char_count',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='projectfile',
+            name='line_count',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,12 +1,32 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
 import os
+import uuid
 
 def project_file_path(instance, filename):
     """Путь для файлов проекта"""
     return f'projects/{instance.project.id}/{filename}'
 
+def blob_file_path(instance, filename):
+    """Путь к содержимому, адресуемому по SHA-256"""
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}'
+
+class Blob(models.Model):
+    """Общее содержимое файлов, дедуплицированное по SHA-256"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_file_path, max_length=255)
+    size = models.BigIntegerField(default=0)
+    
+    # Количество файлов проектов, ссылающихся на содержимое
+    ref_count = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
 class Project(models.Model):
     """Проект для аннотации данных"""
     PROJECT_TYPES = [
@@ -51,6 +71,8 @@ class Project(models.Model):
     total_files = models.IntegerField(default=0)
     annotated_files = models.IntegerField(default=0)
     quality_score = models.FloatField(default=0.0)
+    quality_score_total = models.FloatField(default=0.0)
+    quality_review_count = models.IntegerField(default=0)
     
     # Метаданные
     created_at = models.DateTimeField(auto_now_add=True)
@@ -84,10 +106,22 @@ class ProjectFile(models.Model):
     file_type = models.CharField(max_length=10, choices=FILE_TYPES)
     filename = models.CharField(max_length=255)
     file_size = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='project_files')
+    
+    # Метаданные содержимого (заполняются фоновым извлечением)
+    width = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    height = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    image_mode = models.CharField(max_length=10, blank=True)
+    char_count = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    line_count = models.PositiveBigIntegerField(null=True, blank=True)
+    captured_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    metadata_extracted_at = models.DateTimeField(null=True, blank=True)
     
     # Статус аннотации
     is_annotated = models.BooleanField(default=False)
     annotation_count = models.IntegerField(default=0)
+    lease_count = models.IntegerField(default=0)
     
     # Метаданные
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -95,6 +129,10 @@ class ProjectFile(models.Model):
     
     class Meta:
         ordering = ['uploaded_at']
+        indexes = [
+            models.Index(fields=['project', 'is_annotated']),
+            models.Index(fields=['project', 'uploaded_at']),
+        ]
     
     def __str__(self):
         return f"{self.filename} - {self.project.name}"
@@ -105,6 +143,10 @@ class ProjectFile(models.Model):
         if not self.file_size and self.file:
             self.file_size = self.file.size
         super().save(*args, **kwargs)
+    
+    def get_derivative_url(self, kind='thumb'):
+        """URL уменьшенной копии изображения вместо оригинала"""
+        return reverse('projects:file_derivative', args=[self.project_id, self.pk, kind])
 
 class ProjectSettings(models.Model):
     """Настройки проекта"""
@@ -128,3 +170,38 @@ class ProjectSettings(models.Model):
     
     def __str__(self):
         return f"Settings for {self.project.name}"
+
+class UploadSession(models.Model):
+    """Сессия докачиваемой загрузки файла по частям"""
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='upload_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    
+    # Созданный после завершения файл
+    project_file = models.ForeignKey(
+        ProjectFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Upload {self.filename} ({self.received_bytes}/{self.total_size})"
+    
+    def is_complete(self):
+        """Все ли байты файла получены"""
+        return self.received_bytes >= self.total_size
@@ -0,0 +1,55 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .access import Membership, invalidate_membership
+from .counters import file_added, file_removed
+from .models import Project, ProjectFile
+from .storage import release_blob
+
+
+@receiver(post_save, sender=ProjectFile)
+def count_project_file(sender, instance, created, raw=False, **kwargs):
+    """Учитывает новый файл в счётчике проекта"""
+    if created and not raw:
+        file_added(instance.project_id)
+
+
+@receiver(post_delete, sender=ProjectFile)
+def release_project_file_blob(sender, instance, **kwargs):
+    """Освобождает общее содержимое при удалении файла проекта"""
+    file_removed(instance.project_id)
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_init, sender=Project)
+def remember_project_owner(sender, instance, **kwargs):
+    instance._original_owner_id = instance.__dict__.get('owner_id')
+
+
+@receiver(post_save, sender=Project)
+def invalidate_owner_access(sender, instance, created, **kwargs):
+    """Новый проект или смена владельца меняют индекс доступа"""
+    if created or instance._original_owner_id != instance.owner_id:
+        invalidate_membership(instance.owner_id, instance._original_owner_id)
+    instance._original_owner_id = instance.owner_id
+
+
+@receiver(pre_delete, sender=Project)
+def invalidate_project_access(sender, instance, **kwargs):
+    user_ids = Membership.objects.filter(project=instance).values_list('user_id', flat=True)
+    invalidate_membership(instance.owner_id, *user_ids)
+
+
+@receiver(m2m_changed, sender=Membership)
+def invalidate_collaborator_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кеш доступа при изменении состава участников"""
+    if action == 'pre_clear':
+        # После очистки список участников уже не узнать
+        if reverse:
+            invalidate_membership(instance.pk)
+        else:
+            invalidate_membership(*Membership.objects.filter(project=instance).values_list('user_id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        # Со стороны пользователя (reverse) pk_set содержит id проектов
+        invalidate_membership(*([instance.pk] if reverse else pk_set or []))
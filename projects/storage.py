@@ -0,0 +1,124 @@
+import hashlib
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .filetypes import HASH_BLOCK_SIZE
+from .models import Blob, blob_file_path
+
+
+class HashingUploadHandlerMixin:
+    """Считает SHA-256 загружаемого файла по мере получения данных"""
+
+    def new_file(self, *args, **kwargs):
+        # MemoryFileUploadHandler.new_file прерывает цепочку исключением
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        if getattr(self, 'activated', True):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def hash_content(content):
+    """SHA-256 файла или загруженного содержимого"""
+    sha256 = getattr(content, 'sha256', None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_BLOCK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def find_blob(sha256):
+    """Проверка «уже загружено?» одним поиском по индексу"""
+    return Blob.objects.filter(sha256=sha256).first()
+
+
+def acquire_blob(content, sha256=None):
+    """Возвращает блоб с этим содержимым, сохраняя файл только если его ещё нет"""
+    sha256 = sha256 or hash_content(content)
+
+    with transaction.atomic():
+        if Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+            return Blob.objects.get(sha256=sha256)
+
+    blob = Blob(sha256=sha256, size=content.size, ref_count=1)
+    blob.file.save(blob_file_path(blob, ''), content, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Параллельная загрузка того же содержимого успела первой
+        default_storage.delete(blob.file.name)
+        with transaction.atomic():
+            Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        blob = Blob.objects.get(sha256=sha256)
+    return blob
+
+
+def attach_blob(project_file, content, sha256=None):
+    """Привязывает файл проекта к общему содержимому вместо отдельной копии"""
+    blob = acquire_blob(content, sha256)
+    project_file.blob = blob
+    project_file.sha256 = blob.sha256
+    project_file.file.name = blob.file.name
+    project_file.file_size = blob.size
+    return project_file
+
+
+def add_blob_references(sha256_list):
+    """Увеличивает счётчики ссылок пачкой: по одному UPDATE на каждое значение приращения"""
+    increments = {}
+    for sha256, count in Counter(sha256_list).items():
+        increments.setdefault(count, []).append(sha256)
+    for count, hashes in increments.items():
+        Blob.objects.filter(sha256__in=hashes).update(ref_count=F('ref_count') + count)
+
+
+def release_blob(blob_id):
+    """Уменьшает счётчик ссылок и удаляет содержимое, на которое больше никто не ссылается"""
+    Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+    collect_blobs(Blob.objects.filter(pk=blob_id))
+
+
+def collect_blobs(queryset=None):
+    """Удаляет блобы с нулевым счётчиком ссылок и их файлы после фиксации транзакции"""
+    queryset = Blob.objects.all() if queryset is None else queryset
+    unreferenced = list(
+        queryset.filter(ref_count__lte=0, project_files__isnull=True).values_list('pk', 'sha256', 'file')
+    )
+    if not unreferenced:
+        return 0
+
+    Blob.objects.filter(pk__in=[pk for pk, _, _ in unreferenced], ref_count__lte=0).delete()
+
+    def delete_files():
+        for _, sha256, name in unreferenced:
+            # Содержимое могли загрузить заново, пока транзакция была открыта
+            if not Blob.objects.filter(sha256=sha256).exists():
+                default_storage.delete(name)
+
+    transaction.on_commit(delete_files)
+    return len(unreferenced)
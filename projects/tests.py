@@ -1,3 +1,432 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import path
+from PIL import Image
+
+from core.tests import QueryPlanTestCase
+
+from annotations.models import Annotation
+
+from . import export, views
+from .access import Membership, can_view
+from .management.commands import ingest_dataset
+from .metadata import extract_metadata
+from .models import Blob, Project, ProjectFile, UploadSession
+from .uploads import UploadError, abort_upload, finalize_upload
+
+# Маршруты приложения не подключены в корневом urls.py; тестам ASGI нужен свой
+urlpatterns = [
+    path('projects/<int:pk>/export/', views.project_export),
+]
+
+
+class ProjectViewQueryTests(QueryPlanTestCase):
+
+    def test_project_list(self):
+        self.assertViewQueries(3, views.project_list, self.annotator)
+
+    def test_project_list_search(self):
+        self.assertViewQueries(3, views.project_list, self.owner, search='Dataset')
+
+    def test_project_detail(self):
+        self.assertViewQueries(4, views.project_detail, self.annotator, self.project.pk)
+
+    def test_project_files(self):
+        self.assertViewQueries(3, views.project_files, self.annotator, self.project.pk)
+
+    def test_project_files_cursor(self):
+        self.assertViewQueries(3, views.project_files, self.annotator, self.project.pk, pagination='cursor')
+
+    def test_project_files_search(self):
+        self.assertViewQueries(4, views.project_files, self.annotator, self.project.pk, search='image_1')
+
+    def files_context(self, estimate, **params):
+        captured = {}
+
+        def render(request, template_name, context=None, *args, **kwargs):
+            captured.update(context)
+            return HttpResponse(template_name)
+
+        request = RequestFactory().get('/', params)
+        request.user = self.annotator
+        with mock.patch.object(views, 'render', render), mock.patch.object(views, 'estimate_count', return_value=estimate):
+            views.project_files(request, self.project.pk)
+        return captured
+
+    def test_project_files_filtered_pages_ignore_estimate(self):
+        # Оценка планировщика ниже настоящего числа: страницы за ней всё равно доступны
+        context = self.files_context(5, type='image', sort='width', page='3')
+        page_obj = context['page_obj']
+        self.assertEqual((page_obj.number, len(page_obj), page_obj.paginator.count), (3, 20, self.FILES_PER_PROJECT))
+        self.assertEqual(context['total_files'], 5)
+
+        # Завышенная оценка не создаёт пустых страниц
+        context = self.files_context(10 ** 6, type='image', sort='width', page='999')
+        self.assertEqual(context['page_obj'].number, self.FILES_PER_PROJECT // 20)
+
+        # По умолчанию фильтр листается по ключу, без COUNT
+        page_obj = self.files_context(10 ** 6, type='image')['page_obj']
+        self.assertEqual(len(page_obj), 20)
+        self.assertTrue(page_obj.has_next())
+
+
+class IngestDatasetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.project = Project.objects.create(name='Ingest', owner=cls.owner, project_type='text_classification')
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = os.path.join(self.tmp, 'source')
+        os.makedirs(self.source)
+        for i in range(3):
+            with open(os.path.join(self.source, f'{i}.txt'), 'w') as f:
+                f.write(f'text {i}')
+        self.checkpoint = os.path.join(self.tmp, 'ingest.checkpoint')
+        media = self.settings(MEDIA_ROOT=os.path.join(self.tmp, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+        # Тестовая база живёт в транзакции, закрывать соединения перед пулом процессов нельзя
+        patcher = mock.patch.object(ingest_dataset.connections, 'close_all')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest(self):
+        call_command(
+            'ingest_dataset', self.project.pk, self.source, workers=1, batch_size=2,
+            checkpoint=self.checkpoint, stdout=io.StringIO(),
+        )
+
+    def test_resume_after_crash_between_commit_and_checkpoint(self):
+        write_checkpoint = ingest_dataset.Command._write_checkpoint
+        calls = []
+
+        def crashing(command, *args, **kwargs):
+            calls.append(kwargs.get('pending'))
+            # Вторая запись — после фиксации первой пачки
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return write_checkpoint(command, *args, **kwargs)
+
+        with mock.patch.object(ingest_dataset.Command, '_write_checkpoint', crashing):
+            with self.assertRaises(KeyboardInterrupt):
+                self.ingest()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.total_files, 2)
+
+        self.ingest()
+        self.project.refresh_from_db()
+        self.assertEqual(ProjectFile.objects.filter(project=self.project).count(), 3)
+        self.assertEqual(self.project.total_files, 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_bad_files_do_not_abort_batch(self):
+        Image.new('RGB', (64, 64)).save(os.path.join(self.source, 'bomb.png'))
+        os.symlink(os.path.join(self.tmp, 'gone.txt'), os.path.join(self.source, 'missing.txt'))
+        stderr = io.StringIO()
+        # Пул создаётся fork-ом внутри команды и наследует уменьшенный предел
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            call_command(
+                'ingest_dataset', self.project.pk, self.source, workers=1, batch_size=2,
+                checkpoint=self.checkpoint, stdout=io.StringIO(), stderr=stderr,
+            )
+        self.assertIn('missing.txt', stderr.getvalue())
+        files = ProjectFile.objects.filter(project=self.project)
+        self.assertEqual(sorted(files.values_list('filename', flat=True)), ['0.txt', '1.txt', '2.txt', 'bomb.png'])
+        bomb = files.get(filename='bomb.png')
+        self.assertEqual((bomb.file_type, bomb.width, bomb.height), ('image', None, None))
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.total_files, 4)
+
+
+class ProjectAccessTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.collaborator = User.objects.create_user('collaborator', password='password')
+        cls.project = Project.objects.create(name='Access', owner=cls.owner, project_type='image_classification')
+        cls.project.collaborators.add(cls.collaborator)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_cached_in_process_local_cache(self):
+        # LocMemCache не виден другим воркерам, поэтому права в нём не кешируются
+        self.assertEqual(settings.PROJECT_ACCESS_CACHE_TIMEOUT, 0)
+        self.assertTrue(can_view(self.collaborator, self.project))
+        # Участника убрали в другом процессе: сигналы этого процесса об этом не знают
+        Membership.objects.filter(user=self.collaborator).delete()
+        self.assertFalse(can_view(self.collaborator, self.project))
+
+    @override_settings(PROJECT_ACCESS_CACHE_TIMEOUT=300)
+    def test_shared_cache_invalidated(self):
+        self.assertTrue(can_view(self.collaborator, self.project))
+        with self.assertNumQueries(0):
+            self.assertTrue(can_view(self.collaborator, self.project))
+        self.project.collaborators.remove(self.collaborator)
+        self.assertFalse(can_view(self.collaborator, self.project))
+        self.assertTrue(can_view(self.owner, self.project))
+
+
+class ProjectFileMetadataTests(TestCase):
+
+    def test_text_counts_beyond_integer_range(self):
+        # Текст больше 2 ГиБ символов не должен переполнять счётчики
+        owner = User.objects.create_user('owner', password='password')
+        project = Project.objects.create(name='Texts', owner=owner, project_type='text_classification')
+        project_file = ProjectFile.objects.create(
+            project=project, file='files/huge.txt', filename='huge.txt', file_type='text', file_size=2 ** 33,
+            char_count=2 ** 32, line_count=2 ** 31,
+        )
+        project_file.refresh_from_db()
+        self.assertEqual((project_file.char_count, project_file.line_count), (2 ** 32, 2 ** 31))
+        self.assertTrue(ProjectFile.objects.filter(char_count__gte=2 ** 31 + 1).exists())
+
+    def test_decompression_bomb(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'bomb.png')
+        Image.new('RGB', (64, 64)).save(path)
+        self.assertEqual(extract_metadata(path)['width'], 64)
+        # Больше двух пределов PIL бросает DecompressionBombError: остаётся только тип файла
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            self.assertEqual(extract_metadata(path), {'file_type': 'image'})
+
+class DerivativeViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.project = Project.objects.create(name='Images', owner=cls.owner, project_type='image_classification')
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        media = self.settings(MEDIA_ROOT=tmp)
+        media.enable()
+        self.addCleanup(media.disable)
+        os.makedirs(os.path.join(tmp, 'files'))
+        with open(os.path.join(tmp, 'files', 'big.png'), 'wb') as f:
+            f.write(b'original')
+        self.project_file = ProjectFile.objects.create(
+            project=self.project, file='files/big.png', filename='big.png', file_type='image', file_size=8,
+            sha256='0' * 64,
+        )
+
+    def fetch(self, error):
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        with mock.patch.object(views, 'get_derivative_path', side_effect=error):
+            return views.file_derivative(request, self.project.pk, self.project_file.pk, 'thumb')
+
+    def test_render_failures(self):
+        for error in (OSError('broken'), Image.DecompressionBombError('bomb')):
+            with self.assertRaises(Http404):
+                self.fetch(error)
+        # Не успевший рендеринг — исходник без долгого кеширования
+        for error in (FutureTimeoutError(), BrokenProcessPool()):
+            response = self.fetch(error)
+            self.assertEqual(b''.join(response.streaming_content), b'original')
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            response.close()
+
+
+class UploadSessionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.project = Project.objects.create(name='Texts', owner=cls.owner, project_type='text_classification')
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        media = self.settings(MEDIA_ROOT=tmp, CHUNKED_UPLOAD_DIR=os.path.join(tmp, 'incomplete'))
+        media.enable()
+        self.addCleanup(media.disable)
+        self.factory = RequestFactory()
+        request = self.factory.post('/', '{"filename": "notes.txt", "size": 10}', content_type='application/json')
+        request.user = self.owner
+        response = views.upload_session_create(request, self.project.pk)
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = json.loads(response.content)['upload']['id']
+
+    def put(self, offset, body):
+        request = self.factory.put(
+            '/', body, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {offset}-{offset + len(body) - 1}/10',
+        )
+        request.user = self.owner
+        response = views.upload_session_chunk(request, self.project.pk, self.upload_id)
+        return response, json.loads(response.content)
+
+    def complete(self):
+        request = self.factory.post('/')
+        request.user = self.owner
+        response = views.upload_session_complete(request, self.project.pk, self.upload_id)
+        return response, json.loads(response.content)
+
+    def test_out_of_order_and_duplicate_chunks(self):
+        # Часть не с текущего смещения отклоняется, сервер сообщает, откуда продолжить
+        response, data = self.put(4, b'56789a')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(data['upload']['offset'], 0)
+
+        response, data = self.put(0, b'0123')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '4')
+
+        # Повтор уже принятой части не сдвигает смещение и не портит данные
+        response, data = self.put(0, b'XXXX')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(data['upload']['offset'], 4)
+
+        response, data = self.put(4, b'456789abc')
+        self.assertEqual(response.status_code, 416)
+
+        response, data = self.complete()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ProjectFile.objects.exists())
+
+        response, data = self.put(4, b'456789')
+        self.assertEqual(response['Upload-Offset'], '10')
+
+        response, data = self.complete()
+        self.assertEqual(response.status_code, 200)
+        project_file = ProjectFile.objects.get(pk=data['file']['id'])
+        with project_file.file.open('rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+
+    def test_completion(self):
+        self.put(0, b'0123456789')
+        with mock.patch('projects.uploads.schedule_file_processing') as schedule, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response, data = self.complete()
+            self.assertEqual(response.status_code, 200)
+        # Фоновая обработка запускается после фиксации транзакции
+        self.assertEqual(len(callbacks), 1)
+        schedule.assert_called_once_with(ProjectFile.objects.get(pk=data['file']['id']))
+
+        self.assertEqual(data['upload']['status'], 'completed')
+        self.assertEqual(data['file']['file_size'], 10)
+        project_file = ProjectFile.objects.get(pk=data['file']['id'])
+        self.assertEqual((project_file.filename, project_file.file_type), ('notes.txt', 'text'))
+        self.assertEqual(project_file.uploaded_by, self.owner)
+        self.assertEqual(len(os.listdir(settings.CHUNKED_UPLOAD_DIR)), 0)
+
+        # Повторное завершение возвращает тот же файл, новые части не принимаются
+        response, again = self.complete()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(again['file']['id'], project_file.pk)
+        self.assertEqual(ProjectFile.objects.count(), 1)
+        response, data = self.put(10, b'x')
+        self.assertEqual(response.status_code, 409)
+
+    def test_concurrent_completion(self):
+        self.put(0, b'0123456789')
+        # Оба запроса загрузили сессию до того, как первый её завершил
+        first, second = UploadSession.objects.get(pk=self.upload_id), UploadSession.objects.get(pk=self.upload_id)
+        project_file = finalize_upload(first)
+        self.assertEqual(finalize_upload(second), project_file)
+        self.assertEqual(second.status, 'completed')
+        self.assertEqual(ProjectFile.objects.count(), 1)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_abort(self):
+        self.put(0, b'0123')
+        stale = UploadSession.objects.get(pk=self.upload_id)
+        request = self.factory.delete('/')
+        request.user = self.owner
+        response = views.upload_session_chunk(request, self.project.pk, self.upload_id)
+        self.assertEqual(json.loads(response.content)['upload']['status'], 'aborted')
+        self.assertEqual(os.listdir(settings.CHUNKED_UPLOAD_DIR), [])
+        with self.assertRaises(UploadError):
+            finalize_upload(stale)
+
+    def test_completed_upload_cannot_be_aborted(self):
+        self.put(0, b'0123456789')
+        stale = UploadSession.objects.get(pk=self.upload_id)
+        self.complete()
+        with self.assertRaises(UploadError):
+            abort_upload(stale)
+
+        request = self.factory.delete('/')
+        request.user = self.owner
+        response = views.upload_session_chunk(request, self.project.pk, self.upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content)['upload']['status'], 'completed')
+        self.assertEqual(UploadSession.objects.get(pk=self.upload_id).status, 'completed')
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ExportStreamingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='password')
+        cls.project = Project.objects.create(name='Export', owner=cls.owner, project_type='image_classification')
+        for i, label in enumerate(('cat', 'dog', 'bird')):
+            project_file = ProjectFile.objects.create(
+                project=cls.project, file=f'files/{i}.png', filename=f'{i}.png', file_type='image', file_size=1,
+            )
+            Annotation.objects.create(
+                project=cls.project, file=project_file, annotator=cls.owner, annotation_data={'label': label},
+            )
+        cls.url = f'/projects/{cls.project.pk}/export/'
+
+    def setUp(self):
+        # Каждая строка — отдельный блок, чтобы видеть, сколько прочитано до первого байта
+        self.produced = []
+
+        def one_per_chunk(lines):
+            for line in lines:
+                self.produced.append(line)
+                yield line
+
+        patcher = mock.patch.object(export, '_buffered', one_per_chunk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def labels(self, content):
+        return [json.loads(line)['annotation_data']['label'] for line in content.splitlines()]
+
+    async def test_asgi_export_streams(self):
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+
+        chunks = []
+        async for chunk in response:
+            # Первый блок отдан, а остальные ещё не прочитаны из БД
+            if not chunks:
+                self.assertEqual(len(self.produced), 1)
+            chunks.append(chunk)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(self.labels(b''.join(chunks).decode()), ['cat', 'dog', 'bird'])
+
+    def test_wsgi_export_streams(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertFalse(response.is_async)
+        content = iter(response.streaming_content)
+        next(content)
+        self.assertEqual(len(self.produced), 1)
+        self.assertEqual(self.labels(b''.join(response.streaming_content).decode()), ['dog', 'bird'])
@@ -0,0 +1,159 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+
+from .forms import ALLOWED_EXTENSIONS
+from .models import ProjectFile, UploadSession
+from .derivatives import schedule_for
+from .filetypes import sniff_upload
+from .metadata import schedule_extraction
+from .storage import attach_blob
+
+
+class UploadError(Exception):
+    """Ошибка протокола докачиваемой загрузки"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _TemporaryFile(File):
+    """Файл на диске, который хранилище может переместить вместо копирования"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def schedule_file_processing(project_file):
+    """Фоновая обработка нового файла: метаданные и превью"""
+    schedule_extraction(project_file)
+    schedule_for(project_file)
+
+
+def get_part_path(session):
+    """Путь к недокачанному файлу сессии"""
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def create_upload_session(project, user, filename, total_size):
+    """Создаёт сессию загрузки после проверки имени и размера файла"""
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError('Filename is required.')
+
+    file_extension = os.path.splitext(filename)[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(
+            f'File type {file_extension} is not supported. '
+            f'Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+        )
+
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise UploadError('File size must be an integer.')
+    if total_size <= 0 or total_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError(f'File size must be between 1 and {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.')
+
+    session = UploadSession.objects.create(
+        project=project,
+        user=user,
+        filename=filename,
+        total_size=total_size,
+    )
+
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(get_part_path(session), 'wb').close()
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """Дописывает часть файла с указанного смещения, читая поток блоками"""
+    if session.status != 'active':
+        raise UploadError('Upload session is not active.', status=409)
+    if offset != session.received_bytes:
+        # Клиент должен продолжить с того места, где остановился сервер
+        raise UploadError(f'Expected offset {session.received_bytes}.', status=409)
+    if length <= 0 or offset + length > session.total_size:
+        raise UploadError('Chunk exceeds declared file size.', status=416)
+
+    read_size = settings.CHUNKED_UPLOAD_READ_SIZE
+    written = 0
+    with open(get_part_path(session), 'r+b') as part:
+        part.seek(offset)
+        part.truncate()
+        while written < length:
+            block = stream.read(min(read_size, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+
+    # Записываем только полностью сохранённые байты: оборванная часть будет
+    # перезаписана при повторной отправке с того же смещения
+    UploadSession.objects.filter(pk=session.pk, received_bytes=offset).update(
+        received_bytes=F('received_bytes') + written
+    )
+    session.refresh_from_db(fields=['received_bytes', 'updated_at'])
+
+    if written < length:
+        raise UploadError('Chunk body is shorter than Content-Length.', status=400)
+    return session
+
+
+def finalize_upload(session):
+    """Создаёт ProjectFile из полностью полученного файла"""
+    part_path = get_part_path(session)
+    with transaction.atomic():
+        # Строка сессии блокируется до фиксации: одновременные завершения выполняются
+        # по очереди, и второе видит уже созданный файл, а не создаёт ещё один
+        session.refresh_from_db(from_queryset=UploadSession.objects.select_for_update())
+        if session.status == 'completed':
+            return session.project_file
+        if session.status != 'active':
+            raise UploadError('Upload session is not active.', status=409)
+        if not session.is_complete():
+            raise UploadError(
+                f'Upload is incomplete: {session.received_bytes} of {session.total_size} bytes received.',
+                status=409,
+            )
+
+        project_file = ProjectFile(
+            project=session.project,
+            filename=session.filename,
+            file_size=session.total_size,
+            uploaded_by=session.user,
+        )
+        with open(part_path, 'rb') as part:
+            content = _TemporaryFile(part, name=part_path)
+            project_file.file_type = sniff_upload(content, session.filename)
+            # Новое содержимое перемещается в хранилище, а не копируется;
+            # уже известное содержимое не сохраняется повторно
+            attach_blob(project_file, content)
+        project_file.save()
+
+        session.status = 'completed'
+        session.project_file = project_file
+        session.save(update_fields=['status', 'project_file', 'updated_at'])
+        transaction.on_commit(lambda: schedule_file_processing(project_file))
+
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    return project_file
+
+
+def abort_upload(session):
+    """Отменяет сессию и удаляет полученные данные; завершённую отменить нельзя"""
+    with transaction.atomic():
+        session.refresh_from_db(from_queryset=UploadSession.objects.select_for_update())
+        if session.status == 'completed':
+            raise UploadError('Upload session is already completed.', status=409)
+        session.status = 'aborted'
+        session.save(update_fields=['status', 'updated_at'])
+    part_path = get_part_path(session)
+    if os.path.exists(part_path):
+        os.remove(part_path)
@@ -11,6 +11,10 @@ urlpatterns = [
     path('<int:pk>/delete/', views.project_delete, name='project_delete'),
     path('<int:pk>/files/', views.project_files, name='project_files'),
     path('<int:pk>/files/upload/', views.file_upload, name='file_upload'),
+    path('<int:pk>/files/<int:file_id>/<str:kind>/', views.file_derivative, name='file_derivative'),
+    path('<int:pk>/uploads/', views.upload_session_create, name='upload_session_create'),
+    path('<int:pk>/uploads/<uuid:upload_id>/', views.upload_session_chunk, name='upload_session_chunk'),
+    path('<int:pk>/uploads/<uuid:upload_id>/complete/', views.upload_session_complete, name='upload_session_complete'),
     path('<int:pk>/settings/', views.project_settings, name='project_settings'),
     path('<int:pk>/export/', views.project_export, name='project_export'),
 ]
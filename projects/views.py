@@ -1,11 +1,41 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings as django_settings
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Project, ProjectFile, ProjectSettings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.views.decorators.http import require_http_methods, require_POST
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from core.pagination import estimate_count, paginate
+from core.search import matching
+from .models import Project, ProjectFile, ProjectSettings, UploadSession
 from .forms import ProjectForm, ProjectFileForm
+from .access import can_edit, can_view, visible_projects
+from .derivatives import DERIVATIVE_SIZES, get_derivative_path, is_image
+from .filetypes import sniff_upload
+from .export import CONTENT_TYPES, FILE_EXTENSIONS, astream_project_export, get_export_format, stream_project_export
+from .storage import attach_blob
+from .uploads import (
+    UploadError, abort_upload, create_upload_session, finalize_upload, schedule_file_processing, write_chunk,
+)
+
+FILE_METADATA_FILTERS = {
+    'min_width': 'width__gte',
+    'max_width': 'width__lte',
+    'min_height': 'height__gte',
+    'max_height': 'height__lte',
+    'min_chars': 'char_count__gte',
+    'max_chars': 'char_count__lte',
+}
+FILE_SORT_FIELDS = [
+    'width', '-width', 'height', '-height', 'char_count', '-char_count',
+    'captured_at', '-captured_at', 'file_size', '-file_size',
+]
 
 @login_required
 def project_list(request):
@@ -13,9 +43,7 @@ def project_list(request):
     user = request.user
     
     # Получаем проекты пользователя
-    projects = Project.objects.filter(
-        Q(owner=user) | Q(collaborators=user)
-    ).order_by('-created_at')
+    projects = visible_projects(user).order_by('-created_at')
     
     # Фильтрация
     status_filter = request.GET.get('status')
@@ -25,10 +53,7 @@ def project_list(request):
     # Поиск
     search_query = request.GET.get('search')
     if search_query:
-        projects = projects.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
+        projects = projects.filter(matching('project', search_query))
     
     # Пагинация
     paginator = Paginator(projects, 12)
@@ -75,14 +100,14 @@ def project_detail(request, pk):
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user and request.user not in project.collaborators.all():
+    if not can_view(request.user, project):
         messages.error(request, 'You do not have permission to view this project.')
         return redirect('projects:project_list')
     
-    # Статистика проекта
-    total_files = project.files.count()
-    annotated_files = project.files.filter(is_annotated=True).count()
-    progress_percentage = (annotated_files / total_files * 100) if total_files > 0 else 0
+    # Статистика проекта (счётчики поддерживаются при изменениях файлов и аннотаций)
+    total_files = project.total_files
+    annotated_files = project.annotated_files
+    progress_percentage = project.get_progress_percentage()
     
     # Последние файлы
     recent_files = project.files.order_by('-uploaded_at')[:5]
@@ -107,7 +132,7 @@ def project_edit(request, pk):
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user:
+    if not can_edit(request.user, project):
         messages.error(request, 'You do not have permission to edit this project.')
         return redirect('projects:project_detail', pk=project.pk)
     
@@ -134,7 +159,7 @@ def project_delete(request, pk):
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user:
+    if not can_edit(request.user, project):
         messages.error(request, 'You do not have permission to delete this project.')
         return redirect('projects:project_detail', pk=project.pk)
     
@@ -155,7 +180,7 @@ def project_files(request, pk):
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user and request.user not in project.collaborators.all():
+    if not can_view(request.user, project):
         messages.error(request, 'You do not have permission to view this project.')
         return redirect('projects:project_list')
     
@@ -169,29 +194,77 @@ def project_files(request, pk):
     # Поиск
     search_query = request.GET.get('search')
     if search_query:
-        files = files.filter(filename__icontains=search_query)
-    
-    # Пагинация
-    paginator = Paginator(files, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        files = files.filter(matching('file', search_query))
+    
+    # Фильтры по извлечённым метаданным (индексированные поля)
+    for param, lookup in FILE_METADATA_FILTERS.items():
+        value = request.GET.get(param)
+        if value and value.isdigit():
+            files = files.filter(**{lookup: int(value)})
+    
+    # Пагинация: по ключу (uploaded_at, id) либо по выбранному полю сортировки
+    sort = request.GET.get('sort')
+    ordering = [sort, 'id'] if sort in FILE_SORT_FIELDS else ['uploaded_at', 'id']
+    filtered = file_type or search_query or any(request.GET.get(param) for param in FILE_METADATA_FILTERS)
+    total_files = estimate_count(files) if filtered else project.total_files
+    # У width/height/char_count/captured_at бывают NULL, по ним только OFFSET
+    allow_cursor = ordering[0].lstrip('-') in ('uploaded_at', 'file_size')
+    # Оценка только для показа: границы страниц при фильтре — по ключу или по точному COUNT
+    page_obj = paginate(
+        request, files, ordering, 20, count=None if filtered else total_files,
+        allow_cursor=allow_cursor, prefer_cursor=bool(filtered),
+    )
     
     context = {
         'project': project,
         'page_obj': page_obj,
         'file_type': file_type,
         'search_query': search_query,
+        'sort': sort,
+        'total_files': total_files,
     }
     
     return render(request, 'projects/project_files.html', context)
 
+@login_required
+def file_derivative(request, pk, file_id, kind):
+    """Уменьшенная копия изображения с долгим кешированием в браузере"""
+    project_file = get_object_or_404(ProjectFile.objects.select_related('project'), pk=file_id, project_id=pk)
+    
+    # Проверяем права доступа
+    if not can_view(request.user, project_file.project):
+        raise Http404
+    if kind not in DERIVATIVE_SIZES or not is_image(project_file):
+        raise Http404
+    
+    try:
+        path = get_derivative_path(project_file, kind)
+    except (FutureTimeoutError, BrokenProcessPool):
+        # Рендеринг не успел или пул недоступен: отдаём исходник без долгого кеширования
+        response = FileResponse(project_file.file.open('rb'))
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    except (OSError, Image.DecompressionBombError):
+        # Повреждённое, нераспознанное или слишком большое для распаковки изображение
+        raise Http404
+    
+    # Имя производного файла зависит только от содержимого, поэтому ответ не меняется
+    etag = f'"{project_file.sha256}-{kind}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={django_settings.DERIVATIVE_CACHE_MAX_AGE}, immutable'
+    return response
+
 @login_required
 def file_upload(request, pk):
     """Загрузка файлов в проект"""
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user and request.user not in project.collaborators.all():
+    if not can_view(request.user, project):
         messages.error(request, 'You do not have permission to upload files to this project.')
         return redirect('projects:project_detail', pk=project.pk)
     
@@ -201,11 +274,16 @@ def file_upload(request, pk):
             files = request.FILES.getlist('file')
             
             for uploaded_file in files:
-                project_file = form.save(commit=False)
-                project_file.project = project
-                project_file.file = uploaded_file
-                project_file.uploaded_by = request.user
+                project_file = ProjectFile(
+                    project=project,
+                    filename=uploaded_file.name,
+                    file_type=sniff_upload(uploaded_file),
+                    uploaded_by=request.user,
+                )
+                # Одинаковое содержимое хранится один раз
+                attach_blob(project_file, uploaded_file)
                 project_file.save()
+                transaction.on_commit(lambda f=project_file: schedule_file_processing(f))
             
             messages.success(request, f'{len(files)} file(s) uploaded successfully!')
             return redirect('projects:project_files', pk=project.pk)
@@ -219,13 +297,103 @@ def file_upload(request, pk):
     
     return render(request, 'projects/file_upload.html', context)
 
+def _upload_session_data(session):
+    return {
+        'id': str(session.pk),
+        'filename': session.filename,
+        'total_size': session.total_size,
+        'offset': session.received_bytes,
+        'status': session.status,
+        'file_id': session.project_file_id,
+    }
+
+def _parse_chunk_offset(request):
+    """Смещение части из заголовка Content-Range или параметра offset"""
+    content_range = request.headers.get('Content-Range', '')
+    if content_range.startswith('bytes '):
+        return int(content_range[6:].split('-', 1)[0])
+    return int(request.GET.get('offset', 0))
+
+@login_required
+@require_POST
+def upload_session_create(request, pk):
+    """Создание сессии докачиваемой загрузки"""
+    project = get_object_or_404(Project, pk=pk)
+    
+    # Проверяем права доступа
+    if not can_view(request.user, project):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    try:
+        data = json.loads(request.body or '{}')
+        session = create_upload_session(project, request.user, data.get('filename'), data.get('size'))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid data'}, status=400)
+    except UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    
+    return JsonResponse({'success': True, 'upload': _upload_session_data(session)}, status=201)
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT', 'DELETE'])
+def upload_session_chunk(request, pk, upload_id):
+    """Состояние сессии, приём части файла по смещению и отмена загрузки"""
+    session = get_object_or_404(UploadSession, pk=upload_id, project_id=pk, user=request.user)
+    
+    if request.method == 'PUT':
+        try:
+            offset = _parse_chunk_offset(request)
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid offset'}, status=400)
+    
+    try:
+        if request.method == 'PUT':
+            # Тело запроса читается потоком и пишется сразу на диск
+            write_chunk(session, offset, request, length)
+        elif request.method == 'DELETE':
+            abort_upload(session)
+    except UploadError as e:
+        return JsonResponse(
+            {'success': False, 'error': str(e), 'upload': _upload_session_data(session)},
+            status=e.status,
+        )
+    
+    response = JsonResponse({'success': True, 'upload': _upload_session_data(session)})
+    response['Upload-Offset'] = str(session.received_bytes)
+    return response
+
+@login_required
+@require_POST
+def upload_session_complete(request, pk, upload_id):
+    """Завершение загрузки и создание файла проекта"""
+    session = get_object_or_404(UploadSession, pk=upload_id, project_id=pk, user=request.user)
+    
+    try:
+        project_file = finalize_upload(session)
+    except UploadError as e:
+        return JsonResponse(
+            {'success': False, 'error': str(e), 'upload': _upload_session_data(session)},
+            status=e.status,
+        )
+    
+    return JsonResponse({
+        'success': True,
+        'upload': _upload_session_data(session),
+        'file': {
+            'id': project_file.pk,
+            'filename': project_file.filename,
+            'file_size': project_file.file_size,
+        },
+    })
+
 @login_required
 def project_settings(request, pk):
     """Настройки проекта"""
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user:
+    if not can_edit(request.user, project):
         messages.error(request, 'You do not have permission to edit this project.')
         return redirect('projects:project_detail', pk=project.pk)
     
@@ -261,11 +429,25 @@ def project_export(request, pk):
     project = get_object_or_404(Project, pk=pk)
     
     # Проверяем права доступа
-    if project.owner != request.user and request.user not in project.collaborators.all():
+    if not can_view(request.user, project):
         messages.error(request, 'You do not have permission to export this project.')
         return redirect('projects:project_detail', pk=project.pk)
     
-    # Здесь будет логика экспорта данных
-    # Пока просто возвращаем сообщение
-    messages.info(request, 'Export functionality will be implemented in the next phase.')
-    return redirect('projects:project_detail', pk=project.pk)
+    try:
+        settings = project.settings
+    except ProjectSettings.DoesNotExist:
+        settings = None
+    
+    export_format = get_export_format(settings, request.GET.get('format'))
+    include_metadata = settings.include_metadata if settings else True
+    
+    # Ответ отдаётся потоком, память не зависит от размера проекта; под ASGI
+    # нужен асинхронный итератор, иначе Django соберёт весь экспорт в память
+    stream = astream_project_export if isinstance(request, ASGIRequest) else stream_project_export
+    response = StreamingHttpResponse(
+        stream(project, export_format, include_metadata=include_metadata),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    filename = f'project_{project.pk}_annotations.{FILE_EXTENSIONS[export_format]}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,15 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+
+
+def get_executor():
+    """Общий пул процессов для фоновой обработки файлов, создаётся при первом обращении"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.FILE_PROCESSING_WORKERS)
+        atexit.register(_executor.shutdown, wait=False)
+    return _executor
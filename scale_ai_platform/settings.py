@@ -74,6 +74,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.notifications',
             ],
         },
     },
@@ -166,12 +167,69 @@ LOGOUT_REDIRECT_URL = '/'
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+FILE_UPLOAD_HANDLERS = [
+    'projects.storage.HashingMemoryFileUploadHandler',
+    'projects.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Chunked (resumable) uploads
+CHUNKED_UPLOAD_DIR = MEDIA_ROOT / 'uploads' / 'incomplete'
+CHUNKED_UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024  # 20GB
+CHUNKED_UPLOAD_READ_SIZE = 1024 * 1024  # 1MB
 
 # Allowed file types for uploads
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']
 ALLOWED_DOCUMENT_EXTENSIONS = ['.txt', '.csv', '.json', '.xml']
 
+# Background file processing (metadata extraction, thumbnails)
+FILE_PROCESSING_WORKERS = config('FILE_PROCESSING_WORKERS', default=2, cast=int)
+
+# Image derivatives (thumbnails and previews)
+DERIVATIVE_RENDER_TIMEOUT = 30  # seconds
+DERIVATIVE_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # 1 year, names are content-addressed
+
+# Cache
+# LocMemCache is per process; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (e.g. Redis or Memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='scale-ai-platform'),
+    }
+}
+
+# Caches that other workers cannot see
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 # Project settings
+# Access grants are cached only in a shared cache: invalidation in a per-process
+# cache would leave a removed collaborator with access in the other workers.
+PROJECT_ACCESS_CACHE_TIMEOUT = config(
+    'PROJECT_ACCESS_CACHE_TIMEOUT',
+    default=0 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS else 300,
+    cast=int,
+)  # seconds, 0 disables caching
+# Dashboard numbers are invalidated by deleting the cache key, which a per-process
+# cache does only in the worker that handled the write.
+DASHBOARD_CACHE_TIMEOUT = config(
+    'DASHBOARD_CACHE_TIMEOUT',
+    default=0 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS else 300,
+    cast=int,
+)  # seconds, 0 disables caching
+# The unread badge count is invalidated the same way as dashboard numbers.
+NOTIFICATION_CACHE_TIMEOUT = config(
+    'NOTIFICATION_CACHE_TIMEOUT',
+    default=0 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS else 300,
+    cast=int,
+)  # seconds, 0 disables caching
+# In-process pub/sub reaches only connections served by the same worker;
+# point EVENT_BROKER at a shared backend when running several workers.
+EVENT_BROKER = config('EVENT_BROKER', default='core.pubsub.InProcessBroker')
+EVENT_STREAM_KEEPALIVE = 15  # seconds
+TASK_LEASE_MINUTES = 30
 MAX_PROJECTS_PER_USER = 50
 MAX_FILES_PER_PROJECT = 1000
 